@@ -0,0 +1,94 @@
+import os
+import sys
+import json
+import argparse
+import statistics
+import subprocess
+
+# -------------------------------
+# Import-time benchmark for pymbX
+# -------------------------------
+# `import pymbX` must stay cheap and silent: CLI workers and pool processes pay
+# for it on every start. Each measurement runs in a fresh interpreter. The run
+# fails (exit code 1) when
+#   - importing the package loads pandas, numpy, openpyxl or matplotlib,
+#   - importing the package writes anything to stdout, or
+#   - the median import time is above the budget.
+# The time of the first ezclean look-up (which loads pandas) is reported too.
+#
+# Usage: python benchmarks/import_time.py [--runs 15] [--budget-ms 50] [--json]
+
+PACKAGE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HEAVY_MODULES = ["pandas", "numpy", "openpyxl", "matplotlib"]
+
+_IMPORT_PROBE = """
+import sys, time, json
+sys.path.insert(0, %r)
+start = time.perf_counter()
+import pymbX
+import_seconds = time.perf_counter() - start
+heavy = [m for m in %r if m in sys.modules]
+start = time.perf_counter()
+pymbX.ezclean
+first_use_seconds = time.perf_counter() - start
+sys.stderr.write(json.dumps({"import": import_seconds, "first_use": first_use_seconds, "heavy": heavy}))
+"""
+
+
+def _probe():
+    # One fresh interpreter: returns the timings, heavy modules and stdout of the import
+    completed = subprocess.run(
+        [sys.executable, "-c", _IMPORT_PROBE % (PACKAGE_DIR, HEAVY_MODULES)],
+        capture_output=True, text=True, check=True
+    )
+    result = json.loads(completed.stderr.strip().splitlines()[-1])
+    result["stdout"] = completed.stdout
+    return result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Measure how long `import pymbX` takes.")
+    parser.add_argument("--runs", type=int, default=15, help="number of fresh interpreters to time")
+    parser.add_argument("--budget-ms", type=float, default=50.0, help="maximum median import time")
+    parser.add_argument("--json", action="store_true", help="print the results as JSON")
+    args = parser.parse_args(argv)
+
+    probes = [_probe() for _ in range(args.runs)]
+    import_ms = [p["import"] * 1000 for p in probes]
+    first_use_ms = [p["first_use"] * 1000 for p in probes]
+    heavy = sorted({m for p in probes for m in p["heavy"]})
+    stdout = probes[0]["stdout"]
+
+    results = {
+        "runs": args.runs,
+        "import_ms_median": statistics.median(import_ms),
+        "import_ms_min": min(import_ms),
+        "first_ezclean_ms_median": statistics.median(first_use_ms),
+        "budget_ms": args.budget_ms,
+        "heavy_modules_at_import": heavy,
+        "stdout_at_import": stdout
+    }
+
+    failures = []
+    if heavy:
+        failures.append("import pymbX loaded " + ", ".join(heavy))
+    if stdout:
+        failures.append("import pymbX wrote to stdout: %r" % stdout)
+    if results["import_ms_median"] > args.budget_ms:
+        failures.append("median import time %.1f ms is over the %.1f ms budget"
+                        % (results["import_ms_median"], args.budget_ms))
+    results["failures"] = failures
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        print("import pymbX:        %.2f ms (median of %d, min %.2f ms)"
+              % (results["import_ms_median"], args.runs, results["import_ms_min"]))
+        print("first pymbX.ezclean: %.1f ms (median)" % results["first_ezclean_ms_median"])
+        for failure in failures:
+            print("FAIL:", failure)
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
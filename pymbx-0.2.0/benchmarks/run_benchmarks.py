@@ -0,0 +1,213 @@
+import os
+import sys
+import json
+import time
+import argparse
+import importlib.util
+import contextlib
+import platform
+import tempfile
+import statistics
+import subprocess
+
+import numpy as np
+import pandas as pd
+
+# -------------------------------
+# ezclean / ezviz benchmark suite
+# -------------------------------
+# For every size tier a synthetic QIIME2-style table (benchmarks/synthetic.py)
+# is generated and ezclean (dense, sparse and sharded over --workers threads)
+# and ezviz are run on it with a pymbX.StageReport: every stage gets its wall
+# time, CPU time and peak Python memory (tracemalloc, measured in a separate run
+# so it does not inflate the timings), together with the shape of what it
+# produced. The whole call is reported as the "total" stage.
+#
+# Results are written as JSON with the git commit and library versions, so
+# runs can be compared across commits:
+#
+#   python benchmarks/run_benchmarks.py --tiers small,medium --output before.json
+#   ... change something ...
+#   python benchmarks/run_benchmarks.py --tiers small,medium --output after.json --compare before.json
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+PACKAGE_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, PACKAGE_DIR)
+sys.path.insert(0, BENCH_DIR)
+
+from synthetic import write_feature_table  # noqa: E402
+from pymbX import ezclean, ezviz, StageReport  # noqa: E402
+
+TIERS = {
+    "small": {"n_features": 500, "n_samples": 50},
+    "medium": {"n_features": 5000, "n_samples": 200},
+    "large": {"n_features": 20000, "n_samples": 1000},
+}
+
+
+def _measure(fn, repeat=3, memory=True):
+    # Run fn(report) repeat times with a StageReport and return one row per stage:
+    # the fastest wall/CPU time seen for it, how often it ran per call, the
+    # output shape and - from one more run with tracemalloc on - its peak memory.
+    # The whole call is reported as the "total" stage.
+    runs = []
+    for _ in range(repeat):
+        report = StageReport(memory=False)
+        wall, cpu = time.perf_counter(), time.process_time()
+        fn(report)
+        total = {"stage": "total", "calls": 1, "wall_s": time.perf_counter() - wall,
+                 "cpu_s": time.process_time() - cpu, "rows": None, "cols": None}
+        runs.append({row["stage"]: row for row in report.summary() + [total]})
+    peaks = {}
+    if memory:
+        report = StageReport(memory=True)
+        fn(report)
+        peaks = {row["stage"]: row["peak_bytes"] for row in report.summary()}
+
+    rows = []
+    for stage, first in runs[0].items():
+        walls = [run[stage]["wall_s"] for run in runs if stage in run]
+        rows.append({
+            "stage": stage,
+            "calls": first["calls"],
+            "wall_s": min(walls),
+            "wall_median_s": statistics.median(walls),
+            "cpu_s": min(run[stage]["cpu_s"] for run in runs if stage in run),
+            "peak_bytes": peaks.get(stage),
+            "shape": [first["rows"], first["cols"]]
+        })
+    return rows
+
+
+def _pipelines(microbiome_file, metadata_file, level, selected_metadata, top_taxa, scratch_dir, workers=4):
+    # (name, function of a StageReport) for every pipeline that is benchmarked;
+    # ezclean_workers only runs with workers > 1
+    def clean(report):
+        return ezclean(microbiome_file, metadata_file, level, output_dir=scratch_dir, profile=report)
+
+    def clean_sparse(report):
+        return ezclean(microbiome_file, metadata_file, level, save=False, sparse=True, profile=report)
+
+    def clean_workers(report):
+        return ezclean(microbiome_file, metadata_file, level, save=False, workers=workers, profile=report)
+
+    def viz(report):
+        return ezviz(microbiome_file, metadata_file, level, selected_metadata, top_taxa=top_taxa,
+                     output_dir=scratch_dir, profile=report)
+
+    pipelines = [("ezclean", clean), ("ezclean_sparse", clean_sparse), ("ezclean_workers", clean_workers),
+                 ("ezviz", viz)]
+    if not workers or workers < 2:
+        pipelines = [p for p in pipelines if p[0] != "ezclean_workers"]
+    if importlib.util.find_spec("scipy") is None:
+        # The sparse backend is an optional dependency
+        pipelines = [p for p in pipelines if p[0] != "ezclean_sparse"]
+    return pipelines
+
+
+def _git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=PACKAGE_DIR, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(tiers, level="g", selected_metadata="Treatment", top_taxa=10, repeat=3, memory=True, generator=None,
+        data_dir=None, workers=4):
+    # Benchmark every tier and return the results document
+    import matplotlib
+    results = []
+    with tempfile.TemporaryDirectory(prefix="mbX_bench_") as scratch_dir:
+        data_dir = data_dir or scratch_dir
+        for tier in tiers:
+            params = dict(TIERS[tier], **(generator or {}))
+            microbiome_file, metadata_file = write_feature_table(data_dir, name=tier, **params)
+            for pipeline, fn in _pipelines(microbiome_file, metadata_file, level, selected_metadata, top_taxa,
+                                           scratch_dir, workers=workers):
+                # ezviz is dominated by plotting and is slow on big tiers; it is timed once
+                for stats in _measure(fn, repeat=1 if pipeline == "ezviz" else repeat, memory=memory):
+                    row = {"tier": tier, "pipeline": pipeline}
+                    row.update(stats)
+                    row.update(params)
+                    results.append(row)
+                    print("%-7s %-15s %-28s %9.3f s  %9.3f s cpu  %s" % (
+                        tier, pipeline, stats["stage"], stats["wall_s"], stats["cpu_s"],
+                        "%8.1f MiB" % (stats["peak_bytes"] / 2 ** 20) if stats["peak_bytes"] is not None else ""),
+                        file=sys.stderr)
+    return {
+        "meta": {
+            "commit": _git_commit(),
+            "date": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "pandas": pd.__version__,
+            "numpy": np.__version__,
+            "matplotlib": matplotlib.__version__,
+            "level": level,
+            "selected_metadata": selected_metadata,
+            "top_taxa": top_taxa,
+            "repeat": repeat,
+            "workers": workers,
+            "cpu_count": os.cpu_count()
+        },
+        "results": results
+    }
+
+
+def compare(current, baseline):
+    # Print wall-time ratios (current / baseline) for the stages both runs share
+    base = {(r["tier"], r["pipeline"], r["stage"]): r for r in baseline["results"]}
+    print("%-7s %-15s %-28s %10s %10s %7s" % ("tier", "pipeline", "stage", "baseline", "current", "ratio"))
+    for row in current["results"]:
+        old = base.get((row["tier"], row["pipeline"], row["stage"]))
+        if old is None:
+            continue
+        ratio = row["wall_s"] / old["wall_s"] if old["wall_s"] else float("nan")
+        print("%-7s %-15s %-28s %9.3fs %9.3fs %6.2fx" % (row["tier"], row["pipeline"], row["stage"], old["wall_s"],
+                                                         row["wall_s"], ratio))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the stages of ezclean and ezviz.")
+    parser.add_argument("--tiers", default="small,medium", help="comma separated: " + ", ".join(TIERS))
+    parser.add_argument("--level", default="g")
+    parser.add_argument("--selected-metadata", default="Treatment")
+    parser.add_argument("--top-taxa", type=int, default=10)
+    parser.add_argument("--repeat", type=int, default=3, help="timed runs of each ezclean pipeline")
+    parser.add_argument("--no-memory", action="store_true", help="skip the tracemalloc pass")
+    parser.add_argument("--workers", type=int, default=4,
+                        help="sample shards of the ezclean_workers pipeline (below 2 skips it)")
+    parser.add_argument("--sparsity", type=float, default=None, help="override the generator's sparsity")
+    parser.add_argument("--depth", type=int, default=None, help="override the generator's lineage depth")
+    parser.add_argument("--blank-fraction", type=float, default=None, help="override the blank rank fraction")
+    parser.add_argument("--data-dir", default=None, help="keep the generated tables here")
+    parser.add_argument("--output", default=None, help="write the JSON results to this file")
+    parser.add_argument("--compare", default=None, help="JSON results of an earlier run to compare against")
+    args = parser.parse_args(argv)
+
+    tiers = [t.strip() for t in args.tiers.split(",") if t.strip()]
+    unknown = [t for t in tiers if t not in TIERS]
+    if unknown:
+        parser.error("unknown tiers: " + ", ".join(unknown))
+    generator = {k: v for k, v in [("sparsity", args.sparsity), ("depth", args.depth),
+                                   ("blank_fraction", args.blank_fraction)] if v is not None}
+
+    # ezclean/ezviz print progress messages; keep stdout for the JSON document
+    with contextlib.redirect_stdout(sys.stderr):
+        document = run(tiers, level=args.level, selected_metadata=args.selected_metadata, top_taxa=args.top_taxa,
+                       repeat=args.repeat, memory=not args.no_memory, generator=generator, data_dir=args.data_dir,
+                       workers=args.workers)
+    if args.output:
+        with open(args.output, "w") as fh:
+            json.dump(document, fh, indent=2)
+    else:
+        print(json.dumps(document, indent=2))
+    if args.compare:
+        with open(args.compare) as fh:
+            compare(document, json.load(fh))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,118 @@
+import os
+import sys
+import argparse
+
+import numpy as np
+import pandas as pd
+
+# -------------------------------
+# Synthetic QIIME2-style feature tables for benchmarking
+# -------------------------------
+# Writes a microbiome table shaped like a QIIME2 taxa barplot export: one row
+# per sample, an "index" column with the sample ids, one column per feature
+# named by its lineage ("d__Bacteria;p__Firmicutes;...;s__"), and the metadata
+# columns appended at the end. A matching metadata file has "sample-id" as its
+# first header and categorical columns to group by.
+#
+# The taxonomy is a proper tree (every taxon has a single parent) so the level
+# collapse does real work at every rank. Knobs:
+#   n_features / n_samples  size of the table
+#   sparsity                fraction of zero counts
+#   depth                   deepest rank that is ever named (1 = domain ... 7 = species)
+#   blank_fraction          fraction of ranks left blank ("g__" or "__") below the domain
+#   n_groups                number of levels of each metadata column
+
+_RANKS = ["d__", "p__", "c__", "o__", "f__", "g__", "s__"]
+_RANK_NAMES = ["Domain", "Phylum", "Class", "Order", "Family", "Genus", "Species"]
+
+
+def _lineages(rng, n_features, depth, blank_fraction):
+    # Taxa per rank grow geometrically from 2 domains to n_features taxa at the
+    # deepest named rank; each taxon gets a random parent one rank up.
+    sizes = np.geomspace(2, max(n_features, 2), num=depth).round().astype(int)
+    parents = [None] + [rng.integers(0, sizes[r - 1], size=sizes[r]) for r in range(1, depth)]
+
+    # Every leaf once, then random extra leaves in case blank ranks made two
+    # lineages identical (a feature table never has duplicate columns)
+    leaves = np.concatenate([rng.permutation(sizes[-1]), rng.integers(0, sizes[-1], size=10 * n_features)])
+    lineages = set()
+    for leaf in leaves:
+        # Walk up the tree from the leaf to get one taxon index per rank
+        path = [0] * depth
+        path[depth - 1] = leaf
+        for r in range(depth - 1, 0, -1):
+            path[r - 1] = parents[r][path[r]]
+        parts = []
+        for r, marker in enumerate(_RANKS):
+            if r >= depth:
+                parts.append("__")
+            elif r > 0 and rng.random() < blank_fraction:
+                # QIIME2 writes unassigned ranks either as the bare marker or as "__"
+                parts.append(marker if rng.random() < 0.5 else "__")
+            else:
+                parts.append(f"{marker}{_RANK_NAMES[r]}_{path[r]}")
+        lineages.add(";".join(parts))
+        if len(lineages) == n_features:
+            break
+    return sorted(lineages)
+
+
+def make_feature_table(n_features=1000, n_samples=100, sparsity=0.9, depth=7, blank_fraction=0.1, n_groups=4,
+                       seed=0):
+    # Returns (microbiome_df, metadata_df); the microbiome table has the lineages
+    # as column headers, like the csv files ezclean reads.
+    rng = np.random.default_rng(seed)
+    lineages = _lineages(rng, n_features, depth, blank_fraction)
+    samples = [f"sample-{i:05d}" for i in range(n_samples)]
+
+    # Log-normal abundances per feature, with a sparsity fraction of zeros
+    feature_scale = rng.lognormal(mean=2.0, sigma=1.5, size=len(lineages))
+    counts = rng.poisson(feature_scale * rng.lognormal(0.0, 0.5, size=(n_samples, 1)))
+    counts[rng.random(counts.shape) < sparsity] = 0
+
+    metadata_df = pd.DataFrame({
+        "sample-id": samples,
+        "Treatment": rng.choice([f"treatment_{i}" for i in range(n_groups)], n_samples),
+        "Site": rng.choice([f"site_{i}" for i in range(n_groups)], n_samples),
+        "Timepoint": rng.choice([f"t{i}" for i in range(n_groups)], n_samples)
+    })
+
+    microbiome_df = pd.DataFrame(counts, columns=lineages)
+    microbiome_df.insert(0, "index", samples)
+    # QIIME2 exports repeat the metadata columns after the features
+    microbiome_df["Treatment"] = metadata_df["Treatment"].values
+    return microbiome_df, metadata_df
+
+
+def write_feature_table(directory, name="synthetic", **params):
+    # Write <name>_microbiome.csv and <name>_metadata.txt; returns both paths
+    os.makedirs(directory, exist_ok=True)
+    microbiome_df, metadata_df = make_feature_table(**params)
+    microbiome_file = os.path.join(directory, f"{name}_microbiome.csv")
+    metadata_file = os.path.join(directory, f"{name}_metadata.txt")
+    microbiome_df.to_csv(microbiome_file, index=False)
+    metadata_df.to_csv(metadata_file, sep="\t", index=False)
+    return microbiome_file, metadata_file
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Write a synthetic QIIME2-style microbiome table and metadata.")
+    parser.add_argument("directory")
+    parser.add_argument("--name", default="synthetic")
+    parser.add_argument("--features", type=int, default=1000)
+    parser.add_argument("--samples", type=int, default=100)
+    parser.add_argument("--sparsity", type=float, default=0.9)
+    parser.add_argument("--depth", type=int, default=7, choices=range(1, 8))
+    parser.add_argument("--blank-fraction", type=float, default=0.1)
+    parser.add_argument("--groups", type=int, default=4)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+    for path in write_feature_table(args.directory, name=args.name, n_features=args.features,
+                                    n_samples=args.samples, sparsity=args.sparsity, depth=args.depth,
+                                    blank_fraction=args.blank_fraction, n_groups=args.groups, seed=args.seed):
+        print(path)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,5 +1,37 @@
-from .pymbX import ezclean, ezviz
+__version__ = "0.2.0"
 
-__all__ = ["ezclean", "ezviz"]
+# The public functions are loaded on first use: `import pymbX` stays cheap and
+# silent, and pandas, numpy, openpyxl and matplotlib are only imported when
+# ezclean/ezviz (or another function below) is first looked up.
+_LAZY_ATTRS = {
+    "ezclean": ".pymbX",
+    "ezviz": ".pymbX",
+    "ezviz_many": ".pymbX",
+    "ezsummary": ".pymbX",
+    "ezclean_async": ".aio",
+    "ezviz_async": ".aio",
+    "ezsummary_async": ".aio",
+    "ezviz_many_async": ".aio",
+    "ResultCache": ".cache",
+    "cache_info": ".cache",
+    "clear_cache": ".cache",
+    "run_batch": ".batch",
+    "StageReport": ".profiling",
+    "StageCancelled": ".profiling",
+}
 
-print("Thank you for using our library. Please, CITE us!")
+__all__ = list(_LAZY_ATTRS)
+
+
+def __getattr__(name):
+    if name not in _LAZY_ATTRS:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    import importlib
+    value = getattr(importlib.import_module(_LAZY_ATTRS[name], __name__), name)
+    # Later look-ups find the attribute directly and skip __getattr__
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
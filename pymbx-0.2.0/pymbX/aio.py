@@ -0,0 +1,152 @@
+import os
+import shutil
+import asyncio
+import functools
+import tempfile
+import threading
+import contextvars
+from concurrent.futures import ProcessPoolExecutor
+
+from . import profiling as _profiling
+from .pymbX import ezclean, ezviz, ezsummary, ezviz_many
+
+# -------------------------------
+# asyncio variants of ezclean / ezviz / ezsummary / ezviz_many
+# -------------------------------
+# Each coroutine runs the whole call (file reads, pandas work and rendering) in
+# an executor, so the event loop stays free and many requests overlap:
+#
+#   plot = await ezviz_async("micro.csv", "meta.txt", "g", "Treatment", top_taxa=10,
+#                            executor=pool, timeout=60)
+#
+# executor is any concurrent.futures executor (the loop's default thread pool when
+# None); a ProcessPoolExecutor takes plain file paths and DataFrames as inputs.
+#
+# Cancelling the awaiting task, or hitting timeout, cancels the run too: the call
+# stops with profiling.StageCancelled at its next stage boundary and the awaiting
+# task sees CancelledError/TimeoutError as usual. A run that is already inside a
+# stage finishes that stage first. Runs on a process pool cannot be interrupted
+# once they started.
+#
+# When output_dir is not given, every call writes into its own new temporary
+# directory (mbX_async_*) instead of the current working directory, so concurrent
+# requests never share file names. The returned paths point into it; removing the
+# directory is up to the caller. A call that is cancelled, times out or fails
+# removes its directory itself, as soon as no worker writes to it any more, and
+# a call that wrote nothing (e.g. it returned a message) leaves no directory.
+
+
+class _RunDir:
+    # The temporary output directory of one call and whether a worker is writing
+    # to it: an abandoned directory is removed by whichever of the awaiting task
+    # and the worker is the last one to hold it
+    def __init__(self):
+        self.path = tempfile.mkdtemp(prefix="mbX_async_")
+        self._lock = threading.Lock()
+        self._running = False
+        self._abandoned = False
+    
+    def enter(self):
+        # Called by the worker before the run; False when the call was already given up
+        with self._lock:
+            self._running = not self._abandoned
+            return self._running
+    
+    def leave(self):
+        with self._lock:
+            self._running = False
+            abandoned = self._abandoned
+        if abandoned:
+            self.remove()
+    
+    def abandon(self):
+        with self._lock:
+            self._abandoned = True
+            running = self._running
+        if not running:
+            self.remove()
+    
+    def remove(self):
+        shutil.rmtree(self.path, ignore_errors=True)
+    
+    def discard_if_empty(self):
+        try:
+            os.rmdir(self.path)
+        except OSError:
+            pass
+
+
+def _call_in_thread(context, fn, kwargs, run_dir):
+    # Runs in the executor thread: fn in the copied context, bracketed by run_dir
+    if run_dir is not None and not run_dir.enter():
+        raise _profiling.StageCancelled("pymbX run cancelled before it started")
+    try:
+        return context.run(fn, **kwargs)
+    finally:
+        if run_dir is not None:
+            run_dir.leave()
+
+
+async def _run(fn, kwargs, executor, timeout, run_dir=None):
+    loop = asyncio.get_running_loop()
+    if run_dir is not None:
+        kwargs = dict(kwargs, output_dir=run_dir.path)
+    if isinstance(executor, ProcessPoolExecutor):
+        # Context variables do not cross process boundaries; the directory goes once
+        # the worker process is done with the call
+        event = None
+        done = executor.submit(functools.partial(fn, **kwargs))
+        future = asyncio.wrap_future(done)
+    else:
+        event = threading.Event()
+        context = contextvars.copy_context()
+        context.run(_profiling.cancel_event.set, event)
+        future = loop.run_in_executor(executor, functools.partial(_call_in_thread, context, fn, kwargs, run_dir))
+    try:
+        result = await asyncio.wait_for(future, timeout)
+    except BaseException:
+        if event is not None:
+            event.set()
+        if run_dir is not None:
+            if event is None:
+                done.add_done_callback(lambda _: run_dir.remove())
+            else:
+                run_dir.abandon()
+        raise
+    if run_dir is not None:
+        run_dir.discard_if_empty()
+    return result
+
+
+def _async_output_dir(kwargs, writes=True):
+    # A _RunDir for a call that writes files without an output_dir, else None
+    if kwargs.get("output_dir") is None and writes:
+        return _RunDir()
+    return None
+
+
+async def ezclean_async(microbiome_data, metadata, level="d", executor=None, timeout=None, **kwargs):
+    # Same arguments as ezclean; the output directory is a new temporary one
+    # unless output_dir is given (or save=False)
+    kwargs = dict(kwargs, microbiome_data=microbiome_data, metadata=metadata, level=level)
+    return await _run(ezclean, kwargs, executor, timeout, _async_output_dir(kwargs, writes=kwargs.get("save", True)))
+
+
+async def ezviz_async(microbiome_data, metadata, level, selected_metadata, executor=None, timeout=None, **kwargs):
+    kwargs = dict(kwargs, microbiome_data=microbiome_data, metadata=metadata, level=level,
+                  selected_metadata=selected_metadata)
+    return await _run(ezviz, kwargs, executor, timeout, _async_output_dir(kwargs))
+
+
+async def ezsummary_async(microbiome_data, metadata, level, selected_metadata, executor=None, timeout=None,
+                          **kwargs):
+    kwargs = dict(kwargs, microbiome_data=microbiome_data, metadata=metadata, level=level,
+                  selected_metadata=selected_metadata)
+    return await _run(ezsummary, kwargs, executor, timeout, _async_output_dir(kwargs, writes=kwargs.get("save", True)))
+
+
+async def ezviz_many_async(microbiome_data, metadata, combinations, executor=None, timeout=None, **kwargs):
+    # ezviz_many keeps its own worker pool (max_workers/processes) for the plots;
+    # executor only runs the call that drives it
+    kwargs = dict(kwargs, microbiome_data=microbiome_data, metadata=metadata, combinations=combinations)
+    return await _run(ezviz_many, kwargs, executor, timeout, _async_output_dir(kwargs))
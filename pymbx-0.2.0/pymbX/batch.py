@@ -0,0 +1,129 @@
+import os
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import pandas as pd
+
+from .pymbX import ezclean, ezviz
+
+# -------------------------------
+# Batch processing of many (microbiome, metadata) pairs
+# -------------------------------
+# A manifest lists one job per row: microbiome_data, metadata and level, plus
+# optionally selected_metadata / top_taxa / threshold for a visualization and
+# any other ezclean/ezviz keyword (sparse, chunksize, format, cache, ...).
+# Jobs run on a ProcessPoolExecutor; each one is reported with its status,
+# result, error message and run time, and a failing job never stops the rest.
+
+_JOB_COLUMNS = ["microbiome_data", "metadata", "level", "selected_metadata", "top_taxa", "threshold", "output_dir"]
+
+
+def _read_manifest(manifest):
+    # A manifest is a list of dicts, a DataFrame, or a csv/txt/xls/xlsx file of one
+    if isinstance(manifest, pd.DataFrame):
+        rows = manifest.to_dict("records")
+    elif isinstance(manifest, str):
+        ext = os.path.splitext(manifest)[1].lower().lstrip('.')
+        if ext == "txt":
+            rows = pd.read_csv(manifest, sep="\t").to_dict("records")
+        elif ext == "csv":
+            rows = pd.read_csv(manifest).to_dict("records")
+        elif ext in ["xls", "xlsx"]:
+            rows = pd.read_excel(manifest).to_dict("records")
+        else:
+            raise ValueError("The manifest file is not csv, txt, xls, or xlsx format.")
+    else:
+        rows = [dict(job) for job in manifest]
+    jobs = []
+    for row in rows:
+        # Empty manifest cells mean "not set"
+        job = {k: v for k, v in row.items() if isinstance(v, (list, tuple)) or not pd.isna(v)}
+        # Count settings come back as floats from a table with empty cells
+        for key in ["top_taxa", "chunksize", "workers"]:
+            if isinstance(job.get(key), float) and job[key].is_integer():
+                job[key] = int(job[key])
+        jobs.append(job)
+    return jobs
+
+
+def _is_error(result):
+    # ezclean/ezviz report invalid inputs by returning a message string; their
+    # successful string results are the names of files they wrote.
+    return isinstance(result, str) and not os.path.exists(result)
+
+
+def _run_job(job):
+    # Run one manifest job in a worker process and describe how it went.
+    job = dict(job)
+    start = time.perf_counter()
+    report = {"status": "failed", "result": None, "error": None}
+    try:
+        microbiome_data = job.pop("microbiome_data")
+        metadata = job.pop("metadata")
+        level = job.pop("level", "d")
+        selected_metadata = job.pop("selected_metadata", None)
+        # Manifest files can only hold text, so "g,f" stands for the list ["g", "f"]
+        if isinstance(level, str) and "," in level:
+            level = [lv.strip() for lv in level.split(",")]
+        
+        if selected_metadata is None:
+            result = ezclean(microbiome_data, metadata, level, **job)
+        else:
+            # One ezclean for all the job's levels, then one ezviz per level on its result
+            viz_kwargs = {k: job.pop(k) for k in ["top_taxa", "threshold", "output_dir", "format", "plot_format", "dpi",
+                                                   "rasterize", "preview"] if k in job}
+            job.pop("save", None)
+            multi_level = not isinstance(level, str) or level.lower() == "all"
+            result = ezclean(microbiome_data, metadata, level if multi_level else [level], save=False, **job)
+            if not _is_error(result):
+                cleaned, result = result, {}
+                for lv in cleaned:
+                    plot_file = ezviz(cleaned, metadata, lv, selected_metadata, **viz_kwargs)
+                    if _is_error(plot_file):
+                        result = plot_file
+                        break
+                    result[lv] = plot_file
+        
+        if _is_error(result):
+            report["error"] = result
+        else:
+            report["status"] = "ok"
+            report["result"] = result
+    except Exception as exc:
+        report["error"] = "%s: %s\n%s" % (type(exc).__name__, exc, traceback.format_exc())
+    report["seconds"] = time.perf_counter() - start
+    return report
+
+
+def run_batch(manifest, max_workers=None, output_root=None, mp_context=None):
+    # Run every job of a manifest across a process pool and return a report with
+    # one row per job, in manifest order: job, status ("ok"/"failed"), result,
+    # error and seconds, followed by the job's own settings.
+    #
+    # Jobs without an output_dir write into output_root/<job number> (or the
+    # current working directory when output_root is not given either).
+    jobs = _read_manifest(manifest)
+    for i, job in enumerate(jobs):
+        if output_root is not None and "output_dir" not in job:
+            job["output_dir"] = os.path.join(output_root, str(i))
+    
+    reports = [None] * len(jobs)
+    with ProcessPoolExecutor(max_workers=max_workers, mp_context=mp_context) as executor:
+        futures = {executor.submit(_run_job, job): i for i, job in enumerate(jobs)}
+        for future in as_completed(futures):
+            i = futures[future]
+            try:
+                reports[i] = future.result()
+            except Exception as exc:
+                # The worker itself died (e.g. out of memory); the job still gets a row
+                reports[i] = {"status": "failed", "result": None, "seconds": None,
+                              "error": "%s: %s" % (type(exc).__name__, exc)}
+    
+    rows = []
+    for i, (job, report) in enumerate(zip(jobs, reports)):
+        row = {"job": i}
+        row.update(report)
+        row.update({k: job.get(k) for k in _JOB_COLUMNS})
+        rows.append(row)
+    return pd.DataFrame(rows, columns=["job", "status", "result", "error", "seconds"] + _JOB_COLUMNS)
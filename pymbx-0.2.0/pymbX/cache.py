@@ -0,0 +1,220 @@
+import os
+import json
+import time
+import pickle
+import threading
+import hashlib
+import pandas as pd
+
+# -------------------------------
+# Content-addressed result cache for ezclean / ezviz
+# -------------------------------
+# Results are stored as pickles named after a SHA-256 key built from the
+# contents of the input files, the call parameters and the pymbX version, so a
+# changed file or a new release never returns a stale table. The directory is
+# kept under a size limit by evicting the least recently used entries.
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "pymbX")
+DEFAULT_MAX_BYTES = 1024 ** 3  # 1 GiB
+
+# Digests of files already hashed in this process, keyed on (path, size, mtime)
+_digest_memo = {}
+
+
+class ResultCache:
+    def __init__(self, directory=None, max_bytes=DEFAULT_MAX_BYTES):
+        self.directory = directory or os.environ.get("PYMBX_CACHE_DIR", DEFAULT_CACHE_DIR)
+        self.max_bytes = max_bytes
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + ".pkl")
+
+    def get(self, key):
+        # Return the stored object for key, or None on a miss. A hit refreshes the
+        # entry's modification time, which is what the LRU eviction orders on.
+        # Other processes share the directory: an entry can be evicted at any
+        # moment, and a truncated or corrupt one counts as a miss and is removed.
+        path = self._path(key)
+        try:
+            value = pd.read_pickle(path)
+        except OSError:
+            return None
+        except (pickle.UnpicklingError, EOFError):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            return None
+        try:
+            os.utime(path, None)
+        except OSError:
+            # Evicted since it was read; the value itself is still good
+            pass
+        return value
+
+    def put(self, key, value):
+        os.makedirs(self.directory, exist_ok=True)
+        path = self._path(key)
+        # Write to a private temporary name first so readers never see a partial file
+        tmp_path = "%s.%d.%d.%d.tmp" % (path, os.getpid(), threading.get_ident(), time.monotonic_ns())
+        try:
+            pd.to_pickle(value, tmp_path)
+            os.replace(tmp_path, path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        self.evict()
+
+    def entries(self):
+        # (path, size in bytes, last use time) of every stored entry, oldest first
+        if not os.path.isdir(self.directory):
+            return []
+        found = []
+        for name in os.listdir(self.directory):
+            if not name.endswith(".pkl"):
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            found.append((path, stat.st_size, stat.st_mtime))
+        return sorted(found, key=lambda entry: entry[2])
+
+    def evict(self):
+        # Drop least recently used entries until the cache fits in max_bytes
+        entries = self.entries()
+        total = sum(size for _, size, _ in entries)
+        for path, size, _ in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+
+    def info(self):
+        entries = self.entries()
+        return {
+            "directory": self.directory,
+            "entries": len(entries),
+            "total_bytes": sum(size for _, size, _ in entries),
+            "max_bytes": self.max_bytes
+        }
+
+    def clear(self):
+        removed = 0
+        for path, _, _ in self.entries():
+            try:
+                os.remove(path)
+                removed += 1
+            except FileNotFoundError:
+                pass
+        return removed
+
+
+class MemoryCache:
+    # In-process counterpart of ResultCache for long-running processes (the pymbx
+    # daemon): keeps the most recently used max_entries results in memory.
+    # Callers get copies, so a result can never be changed through the cache.
+    def __init__(self, max_entries=16):
+        from collections import OrderedDict
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            if key not in self._entries:
+                return None
+            self._entries.move_to_end(key)
+            value = self._entries[key]
+        return value.copy() if hasattr(value, "copy") else value
+
+    def put(self, key, value):
+        with self._lock:
+            self._entries[key] = value.copy() if hasattr(value, "copy") else value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def info(self):
+        with self._lock:
+            return {"directory": None, "entries": len(self._entries), "max_entries": self.max_entries}
+
+    def clear(self):
+        with self._lock:
+            removed = len(self._entries)
+            self._entries.clear()
+        return removed
+
+
+def resolve_cache(cache):
+    # Turn the cache= argument of ezclean/ezviz into a ResultCache (or None when off):
+    # True uses the default directory, a string is a directory, and a ResultCache
+    # or MemoryCache is used as given.
+    if cache is None or cache is False:
+        return None
+    if isinstance(cache, (ResultCache, MemoryCache)):
+        return cache
+    if cache is True:
+        return ResultCache()
+    return ResultCache(directory=str(cache))
+
+
+def file_digest(path):
+    # SHA-256 of a file's contents, read in 1 MiB blocks
+    stat = os.stat(path)
+    memo_key = (os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+    if memo_key not in _digest_memo:
+        digest = hashlib.sha256()
+        with open(path, "rb") as fh:
+            for block in iter(lambda: fh.read(1024 * 1024), b""):
+                digest.update(block)
+        _digest_memo[memo_key] = digest.hexdigest()
+    return _digest_memo[memo_key]
+
+
+def frame_digest(df):
+    # SHA-256 of a DataFrame's labels and values (for inputs passed in memory)
+    digest = hashlib.sha256()
+    digest.update(json.dumps([str(c) for c in df.columns]).encode("utf-8"))
+    for col in df.columns:
+        values = df[col]
+        if isinstance(values.dtype, pd.SparseDtype):
+            values = values.sparse.to_dense()
+        digest.update(pd.util.hash_pandas_object(values, index=False).values.tobytes())
+    return digest.hexdigest()
+
+
+def _input_digest(data):
+    if isinstance(data, pd.DataFrame):
+        return frame_digest(data)
+    if isinstance(data, dict):
+        return {str(k): _input_digest(v) for k, v in data.items()}
+    return file_digest(data)
+
+
+def make_key(kind, files, **params):
+    # Cache key for one result: what produced it (kind), the contents of its
+    # inputs (files, or DataFrames passed in memory), its parameters and the
+    # installed pymbX version.
+    from . import __version__
+    payload = {
+        "kind": kind,
+        "files": [_input_digest(f) for f in files],
+        "params": params,
+        "version": __version__
+    }
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+
+def cache_info(cache=True):
+    # Location, number of entries and size of a result cache
+    return resolve_cache(cache).info()
+
+
+def clear_cache(cache=True):
+    # Remove every entry of a result cache; returns how many were removed
+    return resolve_cache(cache).clear()
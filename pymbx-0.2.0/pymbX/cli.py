@@ -0,0 +1,317 @@
+import os
+import sys
+import time
+import argparse
+import threading
+import traceback
+
+# -------------------------------
+# pymbx command line: `pymbx clean`, `pymbx viz` and `pymbx daemon`
+# -------------------------------
+# clean/viz wrap ezclean/ezviz. When a daemon is running they hand the job to
+# it over a local socket (a Unix socket, or a named pipe on Windows), so the
+# call skips interpreter start-up, the pandas/matplotlib imports and - for
+# inputs it has seen before - reading and cleaning the tables again: the daemon
+# keeps recent results in a MemoryCache. Without a daemon the job runs in the
+# current process. This module only imports the standard library until a job
+# actually runs here.
+
+DAEMON_DIR = os.environ.get("PYMBX_DAEMON_DIR",
+                            os.path.join(os.path.expanduser("~"), ".cache", "pymbX", "daemon"))
+
+
+def _daemon_address(daemon_dir):
+    if sys.platform == "win32":
+        import hashlib
+        return r"\\.\pipe\pymbX-" + hashlib.sha1(os.path.abspath(daemon_dir).encode("utf-8")).hexdigest()[:16]
+    return os.path.join(daemon_dir, "daemon.sock")
+
+
+def _daemon_key_file(daemon_dir):
+    return os.path.join(daemon_dir, "daemon.key")
+
+
+def _connect(daemon_dir):
+    # Client connection to a running daemon, or None when there is none
+    from multiprocessing.connection import Client
+    key_file = _daemon_key_file(daemon_dir)
+    if not os.path.exists(key_file):
+        return None
+    with open(key_file, "rb") as fh:
+        authkey = fh.read()
+    try:
+        return Client(_daemon_address(daemon_dir), authkey=authkey)
+    except (OSError, EOFError):
+        return None
+
+
+def _request(daemon_dir, message):
+    # Send one message to the daemon and wait for its reply (None: no daemon)
+    conn = _connect(daemon_dir)
+    if conn is None:
+        return None
+    with conn:
+        conn.send(message)
+        return conn.recv()
+
+
+# -------------------------------
+# 1. Running jobs
+# -------------------------------
+def _run_job(command, kwargs, cache=None):
+    # Run one clean/viz job in this process
+    if command == "clean":
+        from .pymbX import ezclean
+        return ezclean(cache=kwargs.pop("cache", None) or cache, **kwargs)
+    if command == "viz":
+        from .pymbX import ezviz
+        return ezviz(cache=kwargs.pop("cache", None) or cache, **kwargs)
+    raise ValueError("Unknown command: %s" % command)
+
+
+def _one_or_list(values):
+    # A repeatable option given once is passed on as a single value
+    if values is not None and len(values) == 1:
+        return values[0]
+    return values
+
+
+def _job_kwargs(args):
+    # ezclean/ezviz keyword arguments of a parsed clean/viz command line. Paths are
+    # made absolute because a daemon runs in a different working directory.
+    levels = [lv.strip() for value in args.level for lv in value.split(",")]
+    kwargs = {
+        "microbiome_data": os.path.abspath(args.microbiome_data),
+        "metadata": os.path.abspath(args.metadata),
+        "sparse": args.sparse,
+        "chunksize": args.chunksize,
+        "compact": args.compact,
+        "memmap": os.path.abspath(args.memmap) if isinstance(args.memmap, str) else args.memmap,
+        "workers": args.workers,
+        "format": args.format,
+        "cache": os.path.abspath(args.cache) if isinstance(args.cache, str) else args.cache,
+        "output_dir": os.path.abspath(args.output_dir or os.getcwd())
+    }
+    if args.command == "clean":
+        kwargs["level"] = levels[0] if len(levels) == 1 else levels
+        kwargs["append_to"] = os.path.abspath(args.append_to) if args.append_to else None
+    else:
+        if len(levels) != 1:
+            raise SystemExit("pymbx viz: give exactly one level")
+        kwargs.update({
+            "level": levels[0],
+            "selected_metadata": _one_or_list(args.selected_metadata),
+            "top_taxa": _one_or_list(args.top_taxa),
+            "threshold": _one_or_list(args.threshold),
+            "plot_format": args.plot_format,
+            "dpi": args.dpi,
+            "rasterize": args.rasterize,
+            "preview": args.preview
+        })
+    return kwargs
+
+
+def _report(result):
+    # Print the files a job wrote; ezclean/ezviz return a message string on invalid input
+    files = list(dict.fromkeys(result.values())) if isinstance(result, dict) else [result]
+    for file_name in files:
+        if not isinstance(file_name, str) or not os.path.exists(file_name):
+            print(file_name, file=sys.stderr)
+            return 1
+    for file_name in files:
+        print(file_name)
+    return 0
+
+
+# -------------------------------
+# 2. The daemon
+# -------------------------------
+class _Daemon:
+    def __init__(self, daemon_dir, max_entries=16):
+        from .cache import MemoryCache
+        self.daemon_dir = daemon_dir
+        self.cache = MemoryCache(max_entries=max_entries)
+        self.started = time.time()
+        self.jobs = 0
+        self._lock = threading.Lock()
+
+    def status(self):
+        return {"pid": os.getpid(), "uptime": time.time() - self.started, "jobs": self.jobs,
+                "cache": self.cache.info()}
+
+    def _serve(self, conn, message):
+        # Run one job on a worker thread and send the result (or the error) back
+        with conn:
+            try:
+                result = _run_job(message["command"], dict(message["kwargs"]), cache=self.cache)
+                reply = {"ok": True, "result": result}
+            except Exception as exc:
+                reply = {"ok": False, "error": "%s: %s\n%s" % (type(exc).__name__, exc, traceback.format_exc())}
+            with self._lock:
+                self.jobs += 1
+            try:
+                conn.send(reply)
+            except OSError:
+                pass
+
+    def run(self):
+        from multiprocessing import AuthenticationError
+        from multiprocessing.connection import Listener
+        # Warm up: load pandas, numpy, openpyxl and matplotlib once
+        from . import pymbX  # noqa: F401
+        import openpyxl  # noqa: F401
+        import matplotlib.figure  # noqa: F401
+
+        os.makedirs(self.daemon_dir, mode=0o700, exist_ok=True)
+        address = _daemon_address(self.daemon_dir)
+        if sys.platform != "win32" and os.path.exists(address):
+            os.remove(address)
+        authkey = os.urandom(32)
+        listener = Listener(address, authkey=authkey)
+        key_file = _daemon_key_file(self.daemon_dir)
+        # Only the owner may read the key, and with it talk to the daemon
+        fd = os.open(key_file, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, "wb") as fh:
+            fh.write(authkey)
+        print("pymbX daemon %d listening on %s" % (os.getpid(), address), flush=True)
+
+        try:
+            while True:
+                try:
+                    conn = listener.accept()
+                    message = conn.recv()
+                except (OSError, EOFError, AuthenticationError):
+                    continue
+                # Control messages are answered here; jobs go to their own thread
+                if message.get("command") == "stop":
+                    conn.send({"ok": True, "result": self.status()})
+                    conn.close()
+                    break
+                if message.get("command") == "status":
+                    conn.send({"ok": True, "result": self.status()})
+                    conn.close()
+                    continue
+                threading.Thread(target=self._serve, args=(conn, message), daemon=True).start()
+        finally:
+            listener.close()
+            if os.path.exists(key_file):
+                os.remove(key_file)
+
+
+def _start_daemon(daemon_dir, foreground=False, max_entries=16, wait=30):
+    if _request(daemon_dir, {"command": "status"}) is not None:
+        print("A pymbX daemon is already running.", file=sys.stderr)
+        return 1
+    if foreground:
+        _Daemon(daemon_dir, max_entries=max_entries).run()
+        return 0
+
+    # Start the daemon as a detached background process and wait until it answers
+    import subprocess
+    os.makedirs(daemon_dir, exist_ok=True)
+    log_file = open(os.path.join(daemon_dir, "daemon.log"), "ab")
+    cmd = [sys.executable, "-m", "pymbX.cli", "daemon", "start", "--foreground",
+           "--daemon-dir", daemon_dir, "--max-entries", str(max_entries)]
+    popen_kwargs = {"stdin": subprocess.DEVNULL, "stdout": log_file, "stderr": subprocess.STDOUT}
+    if sys.platform == "win32":
+        popen_kwargs["creationflags"] = subprocess.CREATE_NEW_PROCESS_GROUP
+    else:
+        popen_kwargs["start_new_session"] = True
+    process = subprocess.Popen(cmd, **popen_kwargs)
+    log_file.close()
+    deadline = time.time() + wait
+    while time.time() < deadline:
+        reply = _request(daemon_dir, {"command": "status"})
+        if reply is not None:
+            print("pymbX daemon started (pid %d)." % reply["result"]["pid"])
+            return 0
+        if process.poll() is not None:
+            break
+        time.sleep(0.1)
+    print("The pymbX daemon did not start; see %s" % os.path.join(daemon_dir, "daemon.log"), file=sys.stderr)
+    return 1
+
+
+# -------------------------------
+# 3. Command line
+# -------------------------------
+def _build_parser():
+    parser = argparse.ArgumentParser(prog="pymbx", description="Clean and visualize 16S rRNA microbiome tables.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument("microbiome_data", help="microbiome table (csv, xls, xlsx, parquet, feather, arrow, biom)")
+    common.add_argument("metadata", help="metadata table (txt, csv, xls, xlsx, parquet, feather, arrow)")
+    common.add_argument("-l", "--level", action="append", default=None,
+                        help="taxonomic level, e.g. g; repeat it or use g,f for several levels, or all")
+    common.add_argument("-o", "--output-dir", default=None, help="directory for the output files")
+    common.add_argument("--format", default="xlsx", help="table format: xlsx, parquet or feather")
+    common.add_argument("--sparse", action="store_true", help="use the sparse backend")
+    common.add_argument("--chunksize", type=int, default=None, help="stream csv/txt/biom input in chunks of n samples")
+    common.add_argument("--compact", action="store_true", help="categorical metadata, small integer counts, float32")
+    common.add_argument("--memmap", nargs="?", const=True, default=None,
+                        help="spill the counts to a memory-mapped file (optionally in this directory)")
+    common.add_argument("--workers", type=int, default=None,
+                        help="collapse and normalize the counts in n sample shards on n threads")
+    common.add_argument("--cache", nargs="?", const=True, default=None, help="use the result cache (optionally a directory)")
+    common.add_argument("--no-daemon", action="store_true", help="run here even when a daemon is running")
+    common.add_argument("--daemon-dir", default=DAEMON_DIR, help=argparse.SUPPRESS)
+
+    clean = subparsers.add_parser("clean", parents=[common], help="run ezclean")
+    clean.add_argument("--append-to", default=None, help="earlier mbX_cleaned_* table to add these samples to")
+
+    viz = subparsers.add_parser("viz", parents=[common], help="run ezviz")
+    viz.add_argument("-m", "--selected-metadata", action="append", required=True,
+                     help="categorical metadata column to group by; repeat it for one plot per column")
+    selection = viz.add_mutually_exclusive_group()
+    selection.add_argument("--top-taxa", type=int, nargs="+", default=None,
+                           help="keep the n most abundant taxa; several values make one plot each")
+    selection.add_argument("--threshold", type=float, nargs="+", default=None,
+                           help="keep taxa above this mean abundance; several values make one plot each")
+    viz.add_argument("--plot-format", default=None, help="pdf, png or svg")
+    viz.add_argument("--dpi", type=float, default=None, help="plot resolution")
+    viz.add_argument("--rasterize", action="store_true", help="store the bars of a vector plot as an image")
+    viz.add_argument("--preview", action="store_true", help="small, fast PNG preview")
+
+    daemon = subparsers.add_parser("daemon", help="manage the warm background worker")
+    daemon.add_argument("action", choices=["start", "stop", "status"])
+    daemon.add_argument("--foreground", action="store_true", help="run in this process instead of detaching")
+    daemon.add_argument("--max-entries", type=int, default=16, help="number of results kept in memory")
+    daemon.add_argument("--daemon-dir", default=DAEMON_DIR, help=argparse.SUPPRESS)
+    return parser
+
+
+def main(argv=None):
+    args = _build_parser().parse_args(argv)
+
+    if args.command == "daemon":
+        if args.action == "start":
+            return _start_daemon(args.daemon_dir, foreground=args.foreground, max_entries=args.max_entries)
+        reply = _request(args.daemon_dir, {"command": args.action})
+        if reply is None:
+            print("No pymbX daemon is running.", file=sys.stderr)
+            return 1
+        status = reply["result"]
+        print("pymbX daemon %s: pid %d, up %.0f s, %d jobs, %d cached results"
+              % ("stopped" if args.action == "stop" else "running", status["pid"], status["uptime"],
+                 status["jobs"], status["cache"]["entries"]))
+        return 0
+
+    args.level = args.level or ["d"]
+    kwargs = _job_kwargs(args)
+    reply = None
+    if not args.no_daemon:
+        reply = _request(args.daemon_dir, {"command": args.command, "kwargs": kwargs})
+    if reply is None:
+        # No daemon: run the job here
+        result = _run_job(args.command, kwargs)
+    elif reply["ok"]:
+        result = reply["result"]
+    else:
+        print(reply["error"], file=sys.stderr)
+        return 1
+    return _report(result)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,198 @@
+import time
+import logging
+import threading
+import contextvars
+import tracemalloc
+from contextlib import contextmanager
+
+# -------------------------------
+# Per-stage timing and memory instrumentation for ezclean / ezviz
+# -------------------------------
+# Pass profile=StageReport() to ezclean/ezviz (or a callable, which is called
+# with every stage record as it finishes) to see where the time goes. Each record
+# holds the stage name ("ezclean.parse_lineages", "ezviz.render", ...), wall
+# time, CPU time of the calling thread, peak traced memory above the level at
+# the start of the stage (tracemalloc, only with memory=True) and the rows and
+# columns of what the stage produced. Stages can nest (ezviz runs ezclean's
+# stages inside "ezviz.clean"); a stage that runs once per chunk shows up once
+# per chunk and is added up by summary().
+#
+# Peak memory comes from tracemalloc, which is process wide: with several
+# threads profiling at once the memory figures overlap.
+
+
+class _Stage:
+    # Handle yielded by StageReport.stage(): lets the stage report its output size
+    def __init__(self, record):
+        self.record = record
+
+    def output(self, value):
+        shape = getattr(value, "shape", None)
+        if shape is not None:
+            self.record["rows"] = int(shape[0])
+            self.record["cols"] = int(shape[1]) if len(shape) > 1 else None
+        return value
+
+
+class _NullStage:
+    def output(self, value):
+        return value
+
+
+@contextmanager
+def _null_stage():
+    yield _NullStage()
+
+
+class StageReport:
+    def __init__(self, callback=None, memory=True):
+        self.callback = callback
+        self.memory = memory
+        self.records = []
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._active = 0
+        self._started_tracing = False
+
+    # ---- Recording ----
+    def _start_tracing(self):
+        with self._lock:
+            if self._active == 0 and self.memory and not tracemalloc.is_tracing():
+                tracemalloc.start()
+                self._started_tracing = True
+            self._active += 1
+
+    def _stop_tracing(self):
+        with self._lock:
+            self._active -= 1
+            if self._active == 0 and self._started_tracing:
+                tracemalloc.stop()
+                self._started_tracing = False
+
+    @contextmanager
+    def stage(self, name):
+        stack = self._local.__dict__.setdefault("stack", [])
+        self._start_tracing()
+        record = {"stage": name, "wall_s": None, "cpu_s": None, "peak_bytes": None, "rows": None, "cols": None}
+        entry = {"record": record, "peak": 0, "base": 0}
+        tracing = self.memory and tracemalloc.is_tracing()
+        if tracing:
+            current, peak = tracemalloc.get_traced_memory()
+            # The enclosing stage keeps the peak it has seen so far before the reset
+            if stack:
+                stack[-1]["peak"] = max(stack[-1]["peak"], peak)
+            tracemalloc.reset_peak()
+            entry["base"] = current
+        stack.append(entry)
+        wall, cpu = time.perf_counter(), time.thread_time()
+        try:
+            yield _Stage(record)
+        finally:
+            record["wall_s"] = time.perf_counter() - wall
+            record["cpu_s"] = time.thread_time() - cpu
+            stack.pop()
+            if tracing and tracemalloc.is_tracing():
+                peak = max(tracemalloc.get_traced_memory()[1], entry["peak"])
+                record["peak_bytes"] = max(peak - entry["base"], 0)
+                if stack:
+                    stack[-1]["peak"] = max(stack[-1]["peak"], peak)
+            self._stop_tracing()
+            with self._lock:
+                self.records.append(record)
+            if self.callback is not None:
+                self.callback(dict(record))
+
+    # ---- Results ----
+    def summary(self):
+        # One entry per stage name in first-seen order: calls, total wall/CPU time,
+        # largest peak memory and the output size of the last call
+        totals = {}
+        for record in list(self.records):
+            total = totals.setdefault(record["stage"], {"stage": record["stage"], "calls": 0, "wall_s": 0.0,
+                                                        "cpu_s": 0.0, "peak_bytes": None, "rows": None,
+                                                        "cols": None})
+            total["calls"] += 1
+            total["wall_s"] += record["wall_s"]
+            total["cpu_s"] += record["cpu_s"]
+            if record["peak_bytes"] is not None:
+                total["peak_bytes"] = max(total["peak_bytes"] or 0, record["peak_bytes"])
+            if record["rows"] is not None:
+                total["rows"], total["cols"] = record["rows"], record["cols"]
+        return list(totals.values())
+
+    def to_frame(self):
+        import pandas as pd
+        return pd.DataFrame(self.records, columns=["stage", "wall_s", "cpu_s", "peak_bytes", "rows", "cols"])
+
+    def to_prometheus(self, prefix="pymbx"):
+        # Prometheus text exposition format, one series per stage
+        metrics = [
+            ("stage_calls_total", "counter", "Number of times a pymbX stage ran", "calls"),
+            ("stage_wall_seconds_total", "counter", "Wall time spent in a pymbX stage", "wall_s"),
+            ("stage_cpu_seconds_total", "counter", "CPU time spent in a pymbX stage", "cpu_s"),
+            ("stage_peak_memory_bytes", "gauge", "Peak traced memory of a pymbX stage", "peak_bytes"),
+            ("stage_output_rows", "gauge", "Rows of the table a pymbX stage produced", "rows"),
+            ("stage_output_columns", "gauge", "Columns of the table a pymbX stage produced", "cols"),
+        ]
+        summary = self.summary()
+        lines = []
+        for metric, kind, help_text, field in metrics:
+            name = "%s_%s" % (prefix, metric)
+            lines.append("# HELP %s %s" % (name, help_text))
+            lines.append("# TYPE %s %s" % (name, kind))
+            for total in summary:
+                if total[field] is not None:
+                    lines.append('%s{stage="%s"} %s' % (name, total["stage"], repr(total[field])))
+        return "\n".join(lines) + "\n"
+
+    def log(self, logger=None, level=logging.INFO):
+        # One log line per stage of the summary
+        logger = logger or logging.getLogger("pymbX")
+        for total in self.summary():
+            logger.log(level, "%s", self._format(total))
+
+    @staticmethod
+    def _format(total):
+        text = "%-28s %4d x %9.4f s wall %9.4f s cpu" % (total["stage"], total["calls"], total["wall_s"],
+                                                          total["cpu_s"])
+        if total["peak_bytes"] is not None:
+            text += " %10.1f KiB peak" % (total["peak_bytes"] / 1024)
+        if total["rows"] is not None:
+            text += "  %s x %s" % (total["rows"], total["cols"])
+        return text
+
+    def __str__(self):
+        return "\n".join(self._format(total) for total in self.summary())
+
+
+def resolve_profile(profile):
+    # Turn the profile= argument of ezclean/ezviz into a StageReport (or None):
+    # a callable gets a StageReport that calls it with every finished stage.
+    if profile is None or profile is False:
+        return None
+    if isinstance(profile, StageReport):
+        return profile
+    if callable(profile):
+        return StageReport(callback=profile)
+    raise TypeError("profile should be a StageReport or a callable")
+
+
+# Cooperative cancellation: the async API (aio.py) runs ezclean/ezviz with a
+# threading.Event in this context variable, and every stage checks it before it
+# starts. Once the event is set the run stops with StageCancelled at the next
+# stage boundary.
+cancel_event = contextvars.ContextVar("pymbx_cancel_event", default=None)
+
+
+class StageCancelled(Exception):
+    pass
+
+
+def stage(profile, name):
+    # profile.stage(name), or a stage that records nothing when profiling is off
+    event = cancel_event.get()
+    if event is not None and event.is_set():
+        raise StageCancelled("pymbX run cancelled before stage %s" % name)
+    if profile is None:
+        return _null_stage()
+    return profile.stage(name)
@@ -1,475 +1,1455 @@
 import os
 import pandas as pd
+import numpy as np
 import re
 import os
-
-def ezclean(microbiome_data, metadata, level="d"):
-    # -------------------------------
-    # 1. File Extension Checks and Data Reading
-    # -------------------------------
-    # Check the file extension for microbiome_data
-    microbiome_ext = os.path.splitext(microbiome_data)[1].lower().lstrip('.')
-    if microbiome_ext not in ['csv', 'xls', 'xlsx', 'txt']:
-        return "The file is not csv, xls, xlsx, or txt format. Please check the file type for microbiome data."
-    
-    # Check the file extension for metadata and read accordingly
-    metadata_ext = os.path.splitext(metadata)[1].lower().lstrip('.')
-    if metadata_ext == "txt":
-        metadata_df = pd.read_csv(metadata, sep="\t", header=0, dtype=str)
-    elif metadata_ext == "csv":
-        metadata_df = pd.read_csv(metadata, header=0, dtype=str)
-    elif metadata_ext in ["xls", "xlsx"]:
-        metadata_df = pd.read_excel(metadata, header=0, dtype=str)
-        metadata_df = pd.DataFrame(metadata_df)
-    else:
-        return "Please check the file format of metadata."
-    
-    # -------------------------------
-    # 2. Metadata Header Check
-    # -------------------------------
-    valid_headers = ["id", "sampleid", "sample id", "sample-id", "featureid", "feature id", "feature-id"]
-    first_header = metadata_df.columns[0].strip().lower()
-    if first_header not in valid_headers:
-        return "Please check the first header of the metadata for file format correction."
-    
-    # -------------------------------
-    # 3. Read Microbiome Data
-    # -------------------------------
-    # Note: To preserve numeric values, do not force dtype=str.
-    if microbiome_ext == "txt":
-        microbiome_df = pd.read_csv(microbiome_data, sep="\t", header=0)
-    elif microbiome_ext == "csv":
-        microbiome_df = pd.read_csv(microbiome_data, header=0)
-    elif microbiome_ext in ["xls", "xlsx"]:
-        # Skip the first row (mimicking an R skip index row) but do not force string conversion
-        microbiome_df = pd.read_excel(microbiome_data, skiprows=1)
+import csv
+import json
+import uuid
+import shutil
+import tempfile
+from collections import namedtuple
+from contextlib import contextmanager
+from . import cache as _cache
+from . import profiling as _profiling
+
+
+# ---- Lineage Parsing Helpers Start ----
+# Rank markers in lineage order and the words used for them in the
+# "unidentified_<rank>_<n>_at_<parent>_<rank>" fallback names.
+_LEVELS_ORDER = ["d__", "p__", "c__", "o__", "f__", "g__", "s__"]
+_LEVEL_MAPPING = {
+    "d__": "domain",
+    "p__": "phylum",
+    "c__": "class",
+    "o__": "order",
+    "f__": "family",
+    "g__": "genus",
+    "s__": "species"
+}
+
+
+def _parse_lineages(lineages):
+    # Split every lineage string into a 7-column rank table (d, p, c, o, f, g, s).
+    # A rank takes the text after the LAST occurrence of its marker up to the next
+    # ";" (stripped), which is what ".*<marker>\s*([^;]*)(;.*)?$" matched per row.
+    # Missing markers, blank ranks and missing lineages all come out as "".
+    # Each distinct lineage is parsed once with plain str methods (no regex), and
+    # the results are broadcast back through the factorized codes.
+    lineages = pd.Series(lineages, dtype=object).reset_index(drop=True)
+    codes, uniques = pd.factorize(lineages)
+    text = [str(x) for x in uniques]
+    
+    ranks = {}
+    for marker in _LEVELS_ORDER:
+        parts = [x.rpartition(marker) for x in text]
+        values = [tail.partition(";")[0].strip() if sep else "" for _, sep, tail in parts]
+        # Code -1 marks a missing lineage; it picks up the trailing "" entry.
+        values = np.array(values + [""], dtype=object)
+        ranks[marker[0]] = values[codes]
+    return pd.DataFrame(ranks, columns=[m[0] for m in _LEVELS_ORDER])
+
+
+def _taxa_at_level(rank_table, level_value):
+    # Pick the names at level_value from a rank table. Blank names fall back to the
+    # nearest named parent rank as "unidentified_<rank>_<n>_at_<parent>_<rank>",
+    # numbering the fallbacks in row order exactly like the old per-row counter.
+    target_idx = _LEVELS_ORDER.index(level_value)
+    names = rank_table[level_value[0]].values.copy()
+    need = names == ""
+    
+    found_value = np.full(len(names), "", dtype=object)
+    found_marker = np.full(len(names), "", dtype=object)
+    for i in range(target_idx - 1, -1, -1):
+        candidate = rank_table[_LEVELS_ORDER[i][0]].values
+        take = need & (found_value == "") & (candidate != "")
+        found_value[take] = candidate[take]
+        found_marker[take] = _LEVELS_ORDER[i]
+    
+    hit = need & (found_value != "")
+    if hit.any():
+        counter = np.cumsum(hit)[hit]
+        names[hit] = [
+            "unidentified_" + _LEVEL_MAPPING[level_value] + "_" + str(n) +
+            "_at_" + value + "_" + _LEVEL_MAPPING[marker]
+            for n, value, marker in zip(counter, found_value[hit], found_marker[hit])
+        ]
+    return pd.Series(names, dtype=object)
+# ---- Lineage Parsing Helpers End ----
+
+
+# ---- Columnar File Helpers Start ----
+# Parquet and Feather/Arrow IPC are accepted as inputs (by extension) and as
+# outputs (through format=). Both go through pyarrow, which is only needed when
+# one of these formats is actually used.
+_COLUMNAR_EXTS = ["parquet", "feather", "arrow"]
+
+_OUTPUT_EXTS = {
+    "xlsx": ".xlsx",
+    "parquet": ".parquet",
+    "feather": ".feather"
+}
+
+
+def _read_columnar(path, ext, text=False):
+    # Read a Parquet or Feather/Arrow IPC file. text=True gives every non-missing
+    # value as a string, like the dtype=str reads of csv/txt/xlsx metadata.
+    if ext == "parquet":
+        df = pd.read_parquet(path)
     else:
-        return "The microbiome file is not in a supported format. Please use txt, csv, xls, or xlsx."
-    
-    # -------------------------------
-    # 4. Taxonomic Level Mapping
-    # -------------------------------
-    levels_map = {
-        "domain": "d__", "Domain": "d__", "DOMAIN": "d__", "D": "d__", "d": "d__",
-        "kingdom": "d__", "Kingdom": "d__", "KINGDOM": "d__", "K": "d__", "k": "d__",
-        "phylum": "p__", "Phylum": "p__", "PHYLUM": "p__", "P": "p__", "p": "p__",
-        "class": "c__", "Class": "c__", "CLASS": "c__", "C": "c__", "c": "c__",
-        "order": "o__", "Order": "o__", "ORDER": "o__", "O": "o__", "o": "o__",
-        "family": "f__", "Family": "f__", "FAMILY": "f__", "F": "f__", "f": "f__",
-        "genera": "g__", "genus": "g__", "Genera": "g__", "GENERA": "g__", "G": "g__", "g": "g__",
-        "species": "s__", "Species": "s__", "SPECIES": "s__", "S": "s__", "s": "s__"
-    }
-    
-    level_key = levels_map.get(level.lower())
-    if level_key is None:
-        return ("The level value should be one of the following: domain, phylum, class, order, "
-                "family, genera, species or their abbreviations.")
-    level_value = level_key
-    
-    # -------------------------------
-    # 5. Separate Microbiome and Metadata Columns
-    # -------------------------------
-    common_cols = list(set(microbiome_df.columns).intersection(set(metadata_df.columns)))
-    just_microbiome_df = microbiome_df.loc[:, ~microbiome_df.columns.isin(common_cols)]
-    just_metadata_df = metadata_df.loc[:, metadata_df.columns.isin(common_cols)]
-    
-    # Save the separated DataFrames as Excel files
-    just_microbiome_df.to_excel("just_microbiome.xlsx", index=False)
-    just_metadata_df.to_excel("just_metadata.xlsx", index=False)
-    
-    # -------------------------------
-    # 6. Transpose the Microbiome Data
-# Read the entire Excel file without assigning any row as header.
-    orig = pd.read_excel("just_microbiome.xlsx", header=None)
-    
-    # Define the new column headers from the original first column (skip the top-left cell)
-    new_columns = orig.iloc[1:, 0].tolist()
-    
-    # Define the new row index from the original header row (skip the top-left cell)
-    new_index = orig.iloc[0, 1:].tolist()
-    
-    # Extract the data block that excludes the original header row and first column.
-    data_block = orig.iloc[1:, 1:]
-    
-    # Transpose the data block so that:
-    # - The rows become the new row labels (matching new_index)
-    # - The columns become the new column headers (matching new_columns)
-    data_transposed = data_block.T
-    
-    # Create the new DataFrame with the desired orientation.
-    df_new = pd.DataFrame(data_transposed.values, index=new_index, columns=new_columns)
-    
-    # Save the new DataFrame to an Excel file.
-    df_new.to_excel("microbiome_ezy_2.xlsx", index=True)
-
-
-    #NOTE FOR MYSELF  SINCE I USE THE MEZY 1 WHICH WAS IN TEXT AND MEZY2 WAS THE ONE WITH NUMERICAL
-    #I DID THE DIRECT NUMERICAL SO I SKIPPED MEZY_1 AND NAMED IT AS MEZY_2
-    
-    # -------------------------------
-    # 8. Add a Blank "Taxa" Column as the Second Column
-    # -------------------------------
-    df_ezy2 = pd.read_excel("microbiome_ezy_2.xlsx", header=None)
-    first_col = df_ezy2.iloc[:, [0]]
-    blank_col = pd.DataFrame([""] * df_ezy2.shape[0])
-    remaining_cols = df_ezy2.iloc[:, 1:]
-    new_matrix = pd.concat([first_col, blank_col, remaining_cols], axis=1, ignore_index=True)
-    new_matrix.iat[0, 1] = "Taxa"
-    new_matrix.to_excel("microbiome_ezy_3.xlsx", index=False, header=False)
-    
-    # -------------------------------
-    # 9. Copy microbiome_ezy_3.xlsx to microbiome_ezy_4.xlsx Without Modification
-    # -------------------------------
-    df_ezy3 = pd.read_excel("microbiome_ezy_3.xlsx", header=None)
-    df_ezy3.to_excel("microbiome_ezy_4.xlsx", index=False, header=False)
-    
-    # -------------------------------
-    # 10. Extract and Construct Taxa Names into the "Taxa" Column
-    # -------------------------------
-    df_ezy4 = pd.read_excel("microbiome_ezy_4.xlsx", header=None)
-    
-    levels_order = ["d__", "p__", "c__", "o__", "f__", "g__", "s__"]
-    level_mapping = {
-        "d__": "domain",
-        "p__": "phylum",
-        "c__": "class",
-        "o__": "order",
-        "f__": "family",
-        "g__": "genus",
-        "s__": "species"
-    }
-    
-    blank_counter = [0]
-    
-    def extract_taxa(x):
-        if pd.isna(x):
-            return ""
-        x = str(x)
-        if level_value in x:
-            pattern_target = ".*" + re.escape(level_value) + r"\s*([^;]*)(;.*)?$"
-            m = re.search(pattern_target, x)
-            candidate = m.group(1).strip() if m and m.group(1) is not None else ""
+        df = pd.read_feather(path)
+    if text:
+        df = _as_text(df)
+    return df
+
+
+def _as_text(df):
+    # Every non-missing value as a string, like reading with dtype=str
+    return df.apply(lambda col: col.astype(object).map(str, na_action="ignore"))
+
+
+def _iter_parquet(path, chunksize):
+    # Stream a Parquet file in blocks of chunksize rows (see ezclean's chunksize).
+    import pyarrow.parquet as pq
+    for batch in pq.ParquetFile(path).iter_batches(batch_size=chunksize):
+        yield batch.to_pandas()
+
+
+def _output_name(file_name, format):
+    # Swap the default .xlsx extension of an output name for the requested format.
+    return os.path.splitext(file_name)[0] + _OUTPUT_EXTS[format]
+
+
+def _output_path(output_dir, file_name):
+    # Place an output file in output_dir (created if needed); without an output_dir
+    # the bare name is used, i.e. the current working directory as before.
+    if output_dir is None:
+        return file_name
+    os.makedirs(output_dir, exist_ok=True)
+    return os.path.join(output_dir, file_name)
+
+
+@contextmanager
+def _replace_output(file_name):
+    # Yield a temporary name of this call next to file_name and move what was
+    # written there into place with os.replace, so a reader or another run that
+    # writes the same name never sees a partly written file
+    root, ext = os.path.splitext(file_name)
+    directory, base = os.path.split(root)
+    tmp_name = os.path.join(directory, ".%s.%s.tmp%s" % (base, uuid.uuid4().hex, ext))
+    try:
+        yield tmp_name
+        os.replace(tmp_name, file_name)
+    finally:
+        if os.path.exists(tmp_name):
+            os.remove(tmp_name)
+
+
+def _write_output(df, file_name, format):
+    with _replace_output(file_name) as tmp_name:
+        _write_table(df, tmp_name, format)
+
+
+def _write_table(df, file_name, format):
+    # The unidentified_* record of a cleaned table (see _UNIDENTIFIED_ATTR) goes
+    # into a second xlsx sheet or the Arrow schema metadata
+    record = df.attrs.get(_UNIDENTIFIED_ATTR)
+    if format == "xlsx":
+        if not record:
+            df.to_excel(file_name, index=False)
+            return
+        with pd.ExcelWriter(file_name) as writer:
+            df.to_excel(writer, index=False)
+            pd.DataFrame(list(record.items()), columns=["name", "lineage"]).to_excel(
+                writer, sheet_name=_UNIDENTIFIED_ATTR, index=False)
+        return
+    # Columnar formats need string column names and dense columns
+    df = df.copy()
+    df.attrs = {}
+    df.columns = [str(c) for c in df.columns]
+    for col in df.columns:
+        if isinstance(df[col].dtype, pd.SparseDtype):
+            df[col] = df[col].sparse.to_dense()
+    if record:
+        import pyarrow as pa
+        table = pa.Table.from_pandas(df, preserve_index=False)
+        table = table.replace_schema_metadata(dict(table.schema.metadata or {},
+                                                   **{_UNIDENTIFIED_ATTR: json.dumps(record)}))
+        if format == "parquet":
+            import pyarrow.parquet as pq
+            pq.write_table(table, file_name)
         else:
-            candidate = ""
-        if candidate != "":
-            return candidate
+            import pyarrow.feather as feather
+            feather.write_feather(table, file_name)
+    elif format == "parquet":
+        df.to_parquet(file_name, index=False)
+    else:
+        df.to_feather(file_name)
+
+
+def _read_unidentified(path, ext):
+    # The unidentified_* record _write_table saved with a cleaned table, or None
+    if ext == "xlsx":
+        import openpyxl
+        workbook = openpyxl.load_workbook(path, read_only=True)
+        try:
+            if _UNIDENTIFIED_ATTR not in workbook.sheetnames:
+                return None
+            rows = list(workbook[_UNIDENTIFIED_ATTR].iter_rows(min_row=2, values_only=True))
+        finally:
+            workbook.close()
+        return _UnidentifiedRecord((name, lineage) for name, lineage in rows)
+    if ext == "parquet":
+        import pyarrow.parquet as pq
+        metadata = pq.read_schema(path).metadata
+    elif ext in ["feather", "arrow"]:
+        import pyarrow.feather as feather
+        metadata = feather.read_table(path, memory_map=True).schema.metadata
+    else:
+        return None
+    saved = (metadata or {}).get(_UNIDENTIFIED_ATTR.encode("utf-8"))
+    return None if saved is None else _UnidentifiedRecord(json.loads(saved))
+# ---- Columnar File Helpers End ----
+
+
+# ---- ezclean Result Helpers Start ----
+_CLEANED_PREFIX = "mbX_cleaned_"
+
+# File names of the cleaned tables ezclean saves, per level
+_CLEANED_NAMES = {
+    "d__": "mbX_cleaned_domains_or_kingdom.xlsx",
+    "p__": "mbX_cleaned_phylum.xlsx",
+    "c__": "mbX_cleaned_classes.xlsx",
+    "o__": "mbX_cleaned_orders.xlsx",
+    "f__": "mbX_cleaned_families.xlsx",
+    "g__": "mbX_cleaned_genera.xlsx",
+    "s__": "mbX_cleaned_species.xlsx"
+}
+
+
+# A rank marker at the start of a lineage or after one of its ";" separators: raw
+# tables carry lineages as headers, cleaned tables only the bare taxa names
+_LINEAGE_MARKER = re.compile(r"(^|;)\s*[dkpcofgs]__")
+
+
+def _table_header(path):
+    # Column names of a table file, read without loading its rows
+    ext = os.path.splitext(str(path))[1].lower().lstrip('.')
+    if ext in ["csv", "txt"]:
+        with open(path, newline="", encoding="utf-8") as fh:
+            return next(csv.reader(fh, delimiter="\t" if ext == "txt" else ","), [])
+    if ext == "xlsx":
+        import openpyxl
+        workbook = openpyxl.load_workbook(path, read_only=True)
+        try:
+            row = next(workbook.active.iter_rows(max_row=1, values_only=True), ())
+        finally:
+            workbook.close()
+        return ["" if value is None else value for value in row]
+    if ext == "xls":
+        return list(pd.read_excel(path, nrows=0).columns)
+    if ext == "parquet":
+        import pyarrow.parquet as pq
+        return pq.ParquetFile(path).schema_arrow.names
+    if ext in ["feather", "arrow"]:
+        import pyarrow.feather as feather
+        return feather.read_table(path, memory_map=True).schema.names
+    return []
+
+
+def _read_table(path):
+    # A whole table file, dispatched on its extension like _table_header, with the
+    # unidentified_* record it was saved with
+    ext = os.path.splitext(str(path))[1].lower().lstrip('.')
+    if ext == "csv":
+        df = pd.read_csv(path, header=0)
+    elif ext == "txt":
+        df = pd.read_csv(path, sep="\t", header=0)
+    elif ext == "xlsx":
+        df = pd.read_excel(path, header=0, engine="openpyxl")
+    elif ext == "xls":
+        df = pd.read_excel(path, header=0)
+    elif ext in _COLUMNAR_EXTS:
+        df = _read_columnar(path, ext)
+    else:
+        raise ValueError("The cleaned table %s is not csv, txt, xls, xlsx, parquet, feather, or arrow format." % path)
+    record = _read_unidentified(path, ext)
+    if record is not None:
+        df.attrs[_UNIDENTIFIED_ATTR] = record
+    return df
+
+
+def _is_cleaned_input(data, metadata):
+    # True when ezviz was handed an ezclean result rather than a raw microbiome file:
+    # a DataFrame, a multi-level dict, a mbX_cleaned_* file, or a table file laid out
+    # like one whatever its name - the metadata's sample id header first, taxa names
+    # without lineage markers, and the other metadata columns at the end
+    if isinstance(data, (pd.DataFrame, dict)):
+        return True
+    if os.path.basename(str(data)).startswith(_CLEANED_PREFIX):
+        return True
+    try:
+        header = [str(c) for c in _table_header(data)]
+        metadata_cols = [str(c) for c in (metadata.columns if isinstance(metadata, pd.DataFrame)
+                                          else _table_header(metadata))]
+    except Exception:
+        # An unreadable file is left to ezclean to report
+        return False
+    if not metadata_cols or len(header) < 2 or header[0] != metadata_cols[0]:
+        return False
+    n_meta = len(metadata_cols) - 1
+    taxa = header[1:len(header) - n_meta]
+    if not taxa or sorted(header[len(header) - n_meta:]) != sorted(metadata_cols[1:]):
+        return False
+    return not any(_LINEAGE_MARKER.search(name) for name in taxa)
+
+
+def _cleaned_for_level(data, level_code):
+    # The cleaned table for level_code out of an ezclean result: a DataFrame is used
+    # as is, a multi-level dict is searched for a key naming that level, and a
+    # cleaned table file is read back in its own format.
+    if isinstance(data, pd.DataFrame):
+        return data
+    if isinstance(data, dict):
+        for key, value in data.items():
+            if _level_code(key) == level_code:
+                return _cleaned_for_level(value, level_code)
+        return None
+    return _read_table(data)
+
+
+def _level_code(level):
+    # "g", "Genus", "genera", ... -> "g__" (None when not a taxonomic level)
+    return _LEVEL_CODES.get(str(level).lower())
+
+
+# Lower-case level names and abbreviations accepted by ezclean/ezviz
+_LEVEL_CODES = {
+    "domain": "d__", "kingdom": "d__", "d": "d__", "k": "d__",
+    "phylum": "p__", "p": "p__",
+    "class": "c__", "c": "c__",
+    "order": "o__", "o": "o__",
+    "family": "f__", "f": "f__",
+    "genera": "g__", "genus": "g__", "g": "g__",
+    "species": "s__", "s": "s__"
+}
+# ---- ezclean Result Helpers End ----
+
+# ---- Incremental Append Helpers Start ----
+def _cleaned_metadata_cols(cleaned_df, meta_cols):
+    # The metadata columns at the end of a cleaned table: the trailing columns that
+    # are not numeric (ezclean keeps metadata as text) or that meta_cols names (a
+    # table read back from a file may hold numeric metadata)
+    cols = []
+    for col in reversed(cleaned_df.columns[1:]):
+        dtype = cleaned_df[col].dtype
+        numeric = pd.api.types.is_numeric_dtype(dtype) and not pd.api.types.is_bool_dtype(dtype)
+        if numeric and col not in meta_cols:
+            break
+        cols.insert(0, col)
+    return cols
+
+
+def _row_totals(taxa, sparse=False):
+    # Sum of every row of a taxa block (NaN for a row holding NaN); Sparse
+    # columns (with a fill value of 0) are summed over their stored values only
+    if not sparse:
+        return taxa.to_numpy(dtype=np.float64).sum(axis=1)
+    totals = np.zeros(len(taxa))
+    for col in taxa.columns:
+        values = taxa[col].array
+        totals[values.sp_index.indices] += values.sp_values
+    return totals
+
+
+# The unidentified_<rank>_<n>_at_<parent>_<rank> names are numbered in the row
+# order of the lineages a table was cleaned from, so two runs can give the same
+# name to different lineages. Every cleaned table therefore records the lineage
+# behind each of these names in df.attrs[_UNIDENTIFIED_ATTR] (kept in the saved
+# xlsx/parquet/feather files), and an appended batch is renamed to match.
+_UNIDENTIFIED_ATTR = "mbX_unidentified"
+_UNIDENTIFIED_NAME = re.compile(r"^(unidentified_[a-z]+_)(\d+)(_at_.*)$")
+
+
+class _UnidentifiedRecord(dict):
+    # {unidentified column name: lineage}. pandas deep-copies df.attrs in nearly
+    # every operation; a record is never changed once attached, so copies share it.
+    def __deepcopy__(self, memo):
+        return self
+
+
+def _unidentified_record(rank_table, level_value):
+    # The names _taxa_at_level makes up at level_value, with their lineage written
+    # out from the rank table as "d__<name>;p__<name>;...;s__<name>"
+    names = _taxa_at_level(rank_table, level_value).values
+    generated = (rank_table[level_value[0]].values == "") & (names != "")
+    names = names[generated]
+    rows = rank_table[generated]
+    lineages = _LEVELS_ORDER[0] + rows[_LEVELS_ORDER[0][0]]
+    for marker in _LEVELS_ORDER[1:]:
+        lineages = lineages + ";" + marker + rows[marker[0]]
+    return _UnidentifiedRecord(zip(names, lineages))
+
+
+def _match_unidentified(existing_df, batch_df):
+    # Rename the unidentified columns of a batch to the names the earlier table
+    # gave the same lineages (the k-th batch name of a lineage takes its k-th
+    # earlier name); lineages the earlier table never had are numbered on from its
+    # highest number. Returns the renamed batch and the record of both tables.
+    records = []
+    for df, which in [(existing_df, "table to append to"), (batch_df, "new batch")]:
+        record = df.attrs.get(_UNIDENTIFIED_ATTR)
+        if record is None and any(_UNIDENTIFIED_NAME.match(str(c)) for c in df.columns):
+            raise ValueError("The %s has unidentified_* columns but no record of their lineages, so they cannot "
+                             "be matched. Please use a table ezclean returned or saved as xlsx, parquet or "
+                             "feather." % which)
+        records.append(record or {})
+    existing_record, batch_record = records
+    
+    earlier_names = {}
+    for name, lineage in existing_record.items():
+        earlier_names.setdefault(lineage, []).append(name)
+    last_number = max([int(_UNIDENTIFIED_NAME.match(name).group(2)) for name in existing_record], default=0)
+    
+    combined_record = _UnidentifiedRecord(existing_record)
+    renames = {}
+    seen = {}
+    for name, lineage in batch_record.items():
+        k = seen[lineage] = seen.get(lineage, 0) + 1
+        if k <= len(earlier_names.get(lineage, [])):
+            renames[name] = earlier_names[lineage][k - 1]
         else:
-            try:
-                target_idx = levels_order.index(level_value) + 1
-            except ValueError:
-                target_idx = None
-            found_value = ""
-            found_marker = ""
-            if target_idx is not None and target_idx > 1:
-                for i in range(target_idx - 2, -1, -1):
-                    if levels_order[i] in x:
-                        pattern_prev = ".*" + re.escape(levels_order[i]) + r"\s*([^;]*)(;.*)?$"
-                        m_prev = re.search(pattern_prev, x)
-                        candidate_prev = m_prev.group(1).strip() if m_prev and m_prev.group(1) is not None else ""
-                        if candidate_prev != "":
-                            found_value = candidate_prev
-                            found_marker = levels_order[i]
-                            break
-            if found_value != "":
-                blank_counter[0] += 1
-                return ("unidentified_" + level_mapping[level_value] + "_" + str(blank_counter[0]) +
-                        "_at_" + found_value + "_" + level_mapping[found_marker])
-            else:
-                return ""
-    
-    if df_ezy4.shape[0] > 1:
-        extracted_text = df_ezy4.iloc[1:, 0].apply(extract_taxa)
-        df_ezy4.iloc[1:, 1] = extracted_text
-    
-    df_ezy4.to_excel("microbiome_ezy_5.xlsx", index=False, header=False)
-    
-    
-    
-    
-    
-    
-    
-    
-    
-    # ---- Additional Delete First Column Block Start ----
-    # Read the microbiome_ezy_5.xlsx file (all data, including header)
-    df_ezy5 = pd.read_excel("microbiome_ezy_5.xlsx", header=None)
-    
-    # Delete the first column entirely
-    df_ezy5 = df_ezy5.iloc[:, 1:]
-    
-    # Save the updated data as microbiome_ezy_6.xlsx without extra row or column names
-    df_ezy5.to_excel("microbiome_ezy_7.xlsx", index=False, header=False)
-    # ---- Additional Delete First Column Block End ----
-    
-        
-    
-    
-    
-    
-    
-    
-    
-    
-    
-        # ---- Additional Aggregation Block Start ----
-   # ---- Additional Aggregation Block Start ----
-    # Read the "microbiome_ezy_7.xlsx" file (all data, including the header row) without column names
-    df_ezy7 = pd.read_excel("microbiome_ezy_7.xlsx", header=None)
-    
-    # Separate the header row (first row) and the data rows (remaining rows)
-    header_row_7 = df_ezy7.iloc[0, :].tolist()
-    data_rows_7 = df_ezy7.iloc[1:, :].copy()
-    
-    # Ensure the first column is treated as text and all other columns are numeric
-    data_rows_7[0] = data_rows_7[0].astype(str)
-    for col in data_rows_7.columns[1:]:
-        data_rows_7[col] = pd.to_numeric(data_rows_7[col], errors='coerce')
-    
-    # Define replacement names based on the level_value
-    other_names = {
-        "d__": "Other_domains",
-        "p__": "Other_phyla",
-        "c__": "Other_classes",
-        "o__": "Other_orders",
-        "f__": "Other_families",
-        "g__": "Other_genera",
-        "s__": "Other_species"
-    }
-    
-    # Determine the appropriate replacement name using the level_value.
-    replacement_name = other_names.get(level_value, "Other")
-    
-    # Replace rows with missing taxa information (NA, blank, "#VALUE", or "nan" as a string)
-    data_rows_7[0] = data_rows_7[0].apply(
+            last_number += 1
+            prefix, _, suffix = _UNIDENTIFIED_NAME.match(name).groups()
+            renames[name] = prefix + str(last_number) + suffix
+            combined_record[renames[name]] = lineage
+    return batch_df.rename(columns=renames), combined_record
+
+
+def _append_cleaned(existing_df, batch_df, metadata_df, sparse=False, compact=False):
+    # Append the cleaned table of a new batch of samples to an earlier cleaned
+    # table. Percentages are per sample, so the rows of both tables stay as they
+    # are: the taxa columns are aligned on the union of both tables' taxa (in the
+    # sorted order of a full run), a taxon missing from one table is 0 for its
+    # samples (NaN for a sample whose total was zero), and the metadata columns
+    # follow. A sample id present in both tables keeps the row of the new batch.
+    # With sparse=True the taxa columns stay Sparse throughout.
+    batch_df, record = _match_unidentified(existing_df, batch_df)
+    id_col = batch_df.columns[0]
+    existing_df = existing_df.rename(columns={existing_df.columns[0]: id_col})
+    # Sample ids are text, as in ezclean; a table read back from a file may hold numbers
+    existing_df[id_col] = existing_df[id_col].map(str, na_action="ignore")
+    meta_cols = list(metadata_df.columns[1:])
+    
+    # The earlier table's own metadata columns mark the end of its taxa block; both
+    # tables must carry the same metadata
+    existing_meta = _cleaned_metadata_cols(existing_df, meta_cols)
+    if sorted(map(str, existing_meta)) != sorted(map(str, meta_cols)):
+        raise ValueError("The metadata columns of the table to append to (%s) differ from those of the new "
+                         "metadata (%s)." % (", ".join(map(str, existing_meta)), ", ".join(map(str, meta_cols))))
+    
+    def split(df):
+        # The taxa block between the sample ids and the metadata, as float64 columns
+        taxa = df.iloc[:, 1:len(df.columns) - len(meta_cols)]
+        dtype = pd.SparseDtype(np.float64, 0.0) if sparse else np.float64
+        return pd.DataFrame({
+            c: (taxa[c].sparse.to_dense() if not sparse and isinstance(taxa[c].dtype, pd.SparseDtype)
+                else taxa[c]).astype(dtype)
+            for c in taxa.columns
+        }, index=df.index)
+    
+    existing_df = existing_df[~existing_df[id_col].isin(batch_df[id_col])]
+    existing_taxa, batch_taxa = split(existing_df), split(batch_df)
+    existing_totals = _row_totals(existing_taxa, sparse)
+    if not np.all(np.isnan(existing_totals) | np.isclose(existing_totals, 100, rtol=1e-3) | (existing_totals == 0)):
+        raise ValueError("The taxa columns of the table to append to do not add up to 100% per sample. "
+                         "Please check that it is an ezclean result with the same metadata columns.")
+    taxa_cols = sorted(set(existing_taxa.columns) | set(batch_taxa.columns))
+    
+    parts = []
+    for df, taxa, totals in [(existing_df, existing_taxa, existing_totals),
+                             (batch_df, batch_taxa, _row_totals(batch_taxa, sparse))]:
+        # A taxon this table never saw is 0, or NaN in a row of NaN
+        fill = np.where(np.isnan(totals), np.nan, 0.0)
+        if sparse:
+            fill = pd.arrays.SparseArray(fill, fill_value=0.0)
+        aligned = pd.DataFrame({c: taxa[c].array if c in taxa.columns else fill for c in taxa_cols}, index=df.index)
+        meta = df[meta_cols].astype(object)
+        parts.append(pd.concat([df[[id_col]].astype(object), aligned, meta], axis=1))
+    combined = pd.concat(parts, ignore_index=True)
+    
+    if compact:
+        if not sparse:
+            combined[taxa_cols] = combined[taxa_cols].astype(np.float32)
+        combined[[id_col] + meta_cols] = _compact_metadata(combined[[id_col] + meta_cols])
+    combined.attrs[_UNIDENTIFIED_ATTR] = record
+    return combined
+# ---- Incremental Append Helpers End ----
+
+
+# ---- Level Cleaning Helpers Start ----
+_OTHER_NAMES = {
+    "d__": "Other_domains",
+    "p__": "Other_phyla",
+    "c__": "Other_classes",
+    "o__": "Other_orders",
+    "f__": "Other_families",
+    "g__": "Other_genera",
+    "s__": "Other_species"
+}
+
+
+def _level_names(rank_table, level_value):
+    # Taxa names at one level, with rows that have no usable name (NA, blank,
+    # "#VALUE", or "nan" as a string) replaced by the level's Other_* name.
+    taxa_names = _taxa_at_level(rank_table, level_value).astype(str)
+    replacement_name = _OTHER_NAMES.get(level_value, "Other")
+    return taxa_names.apply(
         lambda x: replacement_name if (pd.isna(x) or str(x).strip() in ["", "#VALUE", "nan"]) else x
     )
-    
-    # Aggregate the data by the taxa (first) column:
-    # For rows with the exact same taxa value, sum the numeric columns column-wise.
-    aggregated_df = data_rows_7.groupby(0, as_index=False).sum()
-    
-    # Set the column names of the aggregated data using the original header row.
-    new_header = header_row_7.copy()
-    new_header[0] = "Taxa"
-    aggregated_df.columns = new_header
-    
-    # Write the aggregated data (including header) to "microbiome_ezy_8.xlsx"
-    aggregated_df.to_excel("microbiome_ezy_8.xlsx", index=False)
-    # ---- Additional Aggregation Block End ----
 
-    
-        
-    ###3333 NOW CONVERTING INTO THE PERCENTAGE
 
+def _collapse_levels(counts, rank_table, level_values, compact=False):
+    # Sum a feature x sample count matrix up to every level in level_values.
+    # With one level the features are grouped by that level's names directly.
+    # With several levels the features are first grouped by their full name path
+    # down to the deepest level requested; every shallower level is then rolled
+    # up from the previous level's sums instead of from the raw features.
+    # compact=True groups on categorical taxa names, i.e. on their integer codes.
+    def group_keys(level_value):
+        names = _level_names(rank_table, level_value).values
+        return pd.Categorical(names) if compact else names
+    
+    depth = max(_LEVELS_ORDER.index(m) for m in level_values)
+    if len(level_values) == 1:
+        (level_value,) = level_values
+        return {level_value: counts.groupby(group_keys(level_value), observed=True).sum()}
+    
+    path = [group_keys(m) for m in _LEVELS_ORDER[:depth + 1]]
+    current = counts.groupby(path, observed=True).sum()
+    
+    aggregated = {}
+    for idx in range(depth, -1, -1):
+        if idx < depth:
+            current = current.groupby(level=list(range(idx + 1)), observed=True).sum()
+        level_value = _LEVELS_ORDER[idx]
+        if level_value in level_values:
+            level_sums = current.groupby(level=idx, observed=True).sum()
+            level_sums.index.name = None
+            aggregated[level_value] = level_sums
+    return aggregated
+
+
+def _finish_level(aggregated_df, metadata_df, compact=False):
+    # Turn a taxa x sample sum table into the cleaned ezclean table.
     
     # ---- Additional Column-wise Percentage Block Start ----
-    # Read the "microbiome_ezy_8.xlsx" file with header information
-    microbiome_ezy8 = pd.read_excel("microbiome_ezy_8.xlsx", header=0)
-    
-    # Extract the taxa column (first column) and numeric columns (columns 2 onward)
-    taxa_column = microbiome_ezy8.iloc[:, 0]
-    numeric_columns = microbiome_ezy8.iloc[:, 1:].copy()
-    
-    # Ensure all numeric columns are properly converted to numeric
-    numeric_columns = numeric_columns.apply(pd.to_numeric, errors='coerce')
-    
-    # Calculate the column-wise percentages:
-    # For each numeric column, divide each element by the column sum (ignoring NAs) and multiply by 100.
-    # Note: Use axis=1 to align the sums with the columns.
-    col_sums = numeric_columns.sum(axis=0, skipna=True)
-    percentage_columns = numeric_columns.div(col_sums, axis=1) * 100
-    
-    # Combine the taxa column with the calculated percentage columns
-    microbiome_ezy9 = pd.concat([taxa_column, percentage_columns], axis=1)
-    
-    # Save the resulting data frame as "microbiome_ezy_9.xlsx" without row names
-    microbiome_ezy9.to_excel("microbiome_ezy_9.xlsx", index=False)
+    # For each sample column, divide each element by the column sum (ignoring NAs) and multiply by 100.
+    col_sums = aggregated_df.sum(axis=0, skipna=True)
+    percentage_columns = aggregated_df.div(col_sums, axis=1) * 100
+    if compact:
+        percentage_columns = percentage_columns.astype(np.float32)
     # ---- Additional Column-wise Percentage Block End ----
-
-
-
-#####################--------------------------------------------------------------   
-
-
-###TRANSPOSE THE EXCEL
-
-
-
-    # Read the entire Excel file (microbiome_ezy_9.xlsx) without assigning any row as a header.
-    df_ezy_9 = pd.read_excel("microbiome_ezy_9.xlsx", header=None)
     
-    # Define new column headers from the original first column (skipping the top-left cell)
-    col_headers_ezy_9 = df_ezy_9.iloc[1:, 0].tolist()
-    
-    # Define new row labels from the original header row (skipping the top-left cell)
-    row_labels_ezy_9 = df_ezy_9.iloc[0, 1:].tolist()
-    
-    # Extract the data block that excludes the original header row and first column.
-    data_slice_ezy_9 = df_ezy_9.iloc[1:, 1:]
-    
-    # Transpose the data block so that:
-    # - The rows become the new row labels (matching row_labels_ezy_9)
-    # - The columns become the new column headers (matching col_headers_ezy_9)
-    data_trans_ezy_9 = data_slice_ezy_9.T
-    
-    # Create the new DataFrame with the desired orientation.
-    df_ezy_10 = pd.DataFrame(data_trans_ezy_9.values, index=row_labels_ezy_9, columns=col_headers_ezy_9)
-    
-    # Save the new DataFrame to an Excel file (microbiome_ezy_10.xlsx).
-    df_ezy_10.to_excel("microbiome_ezy_10.xlsx", index=True)
-
-
-
-
-####33CHANGE THE FIRST HEADER FROM THE METADATA 
-
-
-    # ---- Additional Header Replacement Block Start ----
-    # Extract the header of the first column from the metadata file
+    # Transpose back so rows are samples and columns are taxa; the sample column
+    # takes the first header of the metadata file.
     metadata_first_header = metadata_df.columns[0]
-    
-    # Read the "microbiome_ezy_10.xlsx" file; since it was written without column names,
-    # the first row actually contains the header information.
-    df_ezy10 = pd.read_excel("microbiome_ezy_10.xlsx", header=None, dtype=str)
-    
-    # Extract the first row as the current header and convert to a list of strings
-    new_header = df_ezy10.iloc[0, :].astype(str).tolist()
-    
-    # Replace the first element with the metadata header
-    new_header[0] = metadata_first_header
-    
-    # Remove the first row (which contained the original header) from the data
-    df_ezy10_data = df_ezy10.iloc[1:, :].copy()
-    
-    # Assign the new header to the data
-    df_ezy10_data.columns = new_header
-    
-    # Save the updated data as "microbiome_ezy_11.xlsx" with proper column names
-    df_ezy10_data.to_excel("microbiome_ezy_11.xlsx", index=False, header=True)
-    # ---- Additional Header Replacement Block End ----
-
-
-
+    df_ezy12 = percentage_columns.T
+    df_ezy12.columns = [str(c) for c in df_ezy12.columns]
+    df_ezy12.index.name = metadata_first_header
+    df_ezy12 = df_ezy12.reset_index()
+    return _with_metadata(df_ezy12, metadata_df)
 
-#####EVERYTHING IS  TEXT FOR THE EASE OF DATA HANDLING SO I WILL CONVERT THE NUMERICALS
-
-
-
-
-
-    # ---- Additional Numeric Conversion Block for ezy_12 Start ----
-    # Read the "microbiome_ezy_11.xlsx" file (all values as text) without column names
-    df_ezy_11 = pd.read_excel("microbiome_ezy_11.xlsx", header=None, dtype=str)
-    
-    # Separate header row (first row) and data rows (remaining rows)
-    header_row_ezy_11 = df_ezy_11.iloc[0, :].tolist()
-    data_rows_ezy_11 = df_ezy_11.iloc[1:, :].copy()
-    
-    # Convert all columns except the first in data_rows_ezy_11 to numeric
-    for col in data_rows_ezy_11.columns[1:]:
-        data_rows_ezy_11[col] = pd.to_numeric(data_rows_ezy_11[col], errors='coerce')
-    
-    # Create a new Excel file and write the header row as text (transposed) and data rows starting at row 2
-    with pd.ExcelWriter("microbiome_ezy_12.xlsx", engine="openpyxl") as writer:
-        # Write the header row as a single-row DataFrame at row 1
-        pd.DataFrame([header_row_ezy_11]).to_excel(writer, sheet_name="Sheet1", index=False, header=False, startrow=0)
-        # Write the data rows starting at row 2 (i.e., startrow=1)
-        data_rows_ezy_11.to_excel(writer, sheet_name="Sheet1", index=False, header=False, startrow=1)
-    
-    
-    
-#####333 NOW I WILL ADD THE METADATA COLUMNS TO THE CLEANED DATA SET
 
+def _array_finish_level(taxa, percentages, sample_ids, metadata_df):
+    # Counterpart of _finish_level for a samples x taxa percentage array
+    # (_memmap_levels, _sharded_levels)
+    df_ezy12 = pd.DataFrame(percentages, columns=[str(t) for t in taxa])
+    df_ezy12.insert(0, metadata_df.columns[0], sample_ids)
+    return _with_metadata(df_ezy12, metadata_df)
 
 
+def _with_metadata(df_ezy12, metadata_df):
+    # Append the metadata columns to a samples x taxa table whose first column
+    # holds the sample ids (the dense, sparse and memmap finishers all end here).
     # ---- Additional Metadata Merge Block Start ----
-    # Read the "microbiome_ezy_12.xlsx" file (with header)
-    df_ezy12 = pd.read_excel("microbiome_ezy_12.xlsx", header=0)
-    
     # In the metadata, the first column is the key.
-    # Instead of using meta_remaining (which lacks the key column),
-    # build a keyed DataFrame from the full metadata.
     metadata_keyed = metadata_df.set_index(metadata_df.columns[0])
     
-    # Extract the key values from df_ezy12 (the cleaned data)
+    # Reindex the keyed metadata with the cleaned sample ids and keep all metadata
+    # columns except the key.
     df_key = df_ezy12.iloc[:, 0]
-    
-    # Reindex the keyed metadata with df_key.
-    # Then select only the columns corresponding to the original meta_remaining,
-    # i.e. all columns except the first.
     appended_metadata = metadata_keyed.reindex(df_key)[metadata_df.columns[1:]].reset_index(drop=True)
     
-    # Combine the df_ezy12 data with the appended metadata columns.
-    # Reset the index of df_ezy12 to ensure proper alignment.
+    # Combine the cleaned data with the appended metadata columns.
     df_ezy13 = pd.concat([df_ezy12.reset_index(drop=True), appended_metadata], axis=1)
-    
-    # Save the combined data as "microbiome_ezy_13.xlsx" with headers
-    df_ezy13.to_excel("microbiome_ezy_13.xlsx", index=False)
     # ---- Additional Metadata Merge Block End ----
-    
-    
-
-
-
-##### REMOVING ANY INTERMEDIATE FILES IN THE WORKING DIR 
-
-
-    # List of intermediate files to be removed (excluding the final file "microbiome_ezy_13.xlsx")
-    intermediate_files = [
-        "just_microbiome.xlsx",
-        "just_metadata.xlsx",
-        "microbiome_ezy_2.xlsx",
-        "microbiome_ezy_3.xlsx",
-        "microbiome_ezy_4.xlsx",
-        "microbiome_ezy_5.xlsx",
-        "microbiome_ezy_6.xlsx",
-        "microbiome_ezy_7.xlsx",
-        "microbiome_ezy_8.xlsx",
-        "microbiome_ezy_9.xlsx",
-        "microbiome_ezy_10.xlsx",
-        "microbiome_ezy_11.xlsx",
-        "microbiome_ezy_12.xlsx"
-    ]
-    
-    # Remove each intermediate file if it exists
-    for f in intermediate_files:
-        if os.path.exists(f):
-            os.remove(f)
-
-##FINAL RETURN BASED ON THE TAXA LEVEL IN THE INPUT OF THE FUNCTION
-
-    # ---- Final Return Block ----
-    final_names = {
-        "d__": "mbX_cleaned_domains_or_kingdom.xlsx",
-        "p__": "mbX_cleaned_phylum.xlsx",
-        "c__": "mbX_cleaned_classes.xlsx",
-        "o__": "mbX_cleaned_orders.xlsx",
-        "f__": "mbX_cleaned_families.xlsx",
-        "g__": "mbX_cleaned_genera.xlsx",
-        "s__": "mbX_cleaned_species.xlsx"
+    return df_ezy13
+
+
+def _clean_levels(microbiome_df, metadata_df, level_values, sparse=False, profile=None, compact=False, spill=None,
+                  workers=None):
+    # Run the in-memory ezclean pipeline once and return {level_value: cleaned table}.
+    # With sparse=True the counts go through the scipy CSR backend instead.
+    #
+    # microbiome_df may also be an iterable of sample-row chunks (e.g. the reader
+    # returned by pd.read_csv(..., chunksize=n)) or of _BiomBlocks (_iter_biom). Every chunk is collapsed to taxa
+    # on its own and only the per-taxon sums are kept, so the full count matrix
+    # never exists in memory. Percentages are taken at the end from the
+    # accumulated sample totals.
+    #
+    # compact=True stores the counts in the smallest unsigned integer type that
+    # holds them, groups on categorical taxa names and returns float32 abundances.
+    #
+    # With a _CountSpill as spill, the counts of every chunk are appended to its
+    # memory-mapped file and aggregated block by block at the end (_memmap_levels).
+    #
+    # workers=n collapses and normalizes the dense counts of every chunk in n sample
+    # shards on a thread pool (_sharded_levels).
+    chunks = iter([microbiome_df] if isinstance(microbiome_df, pd.DataFrame) else microbiome_df)
+    
+    rank_table = None
+    sample_ids = []
+    taxa_labels = {}
+    accumulated = {m: [] for m in level_values}
+    groups = None
+    while True:
+        # A streamed file is actually read here, one chunk at a time
+        with _profiling.stage(profile, "ezclean.read_chunk") as st:
+            chunk = st.output(next(chunks, None))
+        if chunk is None:
+            break
+        
+        # A BIOM block already holds features x samples CSR counts, its sample ids and
+        # the feature lineages, so it goes straight to the sparse level collapse. For
+        # a dense result only the per-taxon sums are turned into a DataFrame.
+        if isinstance(chunk, _BiomBlock):
+            if rank_table is None:
+                with _profiling.stage(profile, "ezclean.parse_lineages") as st:
+                    rank_table = st.output(_parse_lineages(chunk.lineages))
+            sample_ids.extend(chunk.sample_ids)
+            with _profiling.stage(profile, "ezclean.aggregate"):
+                aggregated = _sparse_collapse_levels(chunk.counts, rank_table, level_values)
+            for m, (taxa, sums) in aggregated.items():
+                taxa_labels[m] = taxa
+                if not sparse:
+                    sums = pd.DataFrame(sums.toarray(), index=taxa, columns=chunk.sample_ids)
+                    sums = _compact_counts(sums) if compact else sums
+                accumulated[m].append(sums)
+            continue
+        
+        # Separate microbiome and metadata columns
+        with _profiling.stage(profile, "ezclean.split_columns") as st:
+            common_cols = list(set(chunk.columns).intersection(set(metadata_df.columns)))
+            just_microbiome_df = st.output(chunk.loc[:, ~chunk.columns.isin(common_cols)])
+        
+        # The original header row (skipping the top-left cell) holds the lineage
+        # strings; it is the same for every chunk, so it is parsed only once.
+        if rank_table is None:
+            with _profiling.stage(profile, "ezclean.parse_lineages") as st:
+                lineages = pd.Series(just_microbiome_df.columns[1:], dtype=object)
+                rank_table = st.output(_parse_lineages(lineages))
+        
+        # The original first column holds the sample ids. They are kept as text so they
+        # line up with the metadata, which is always read with dtype=str.
+        chunk_ids = [x if pd.isna(x) else str(x) for x in just_microbiome_df.iloc[:, 0].tolist()]
+        sample_ids.extend(chunk_ids)
+        data_block = just_microbiome_df.iloc[:, 1:]
+        
+        if spill is not None:
+            with _profiling.stage(profile, "ezclean.spill"):
+                spill.append(data_block)
+            continue
+        
+        if sparse:
+            with _profiling.stage(profile, "ezclean.sparse_counts") as st:
+                counts = st.output(_sparse_counts(data_block))
+            with _profiling.stage(profile, "ezclean.aggregate"):
+                aggregated = _sparse_collapse_levels(counts, rank_table, level_values)
+            for m, (taxa, sums) in aggregated.items():
+                taxa_labels[m] = taxa
+                accumulated[m].append(sums)
+            continue
+        
+        # Transpose the data block so that rows are features and columns are samples,
+        # making sure every sample column is numeric
+        with _profiling.stage(profile, "ezclean.transpose_numeric") as st:
+            counts = pd.DataFrame(data_block.T.values, columns=chunk_ids).apply(pd.to_numeric, errors='coerce')
+            if compact:
+                counts = _compact_counts(counts)
+            st.output(counts)
+        
+        # Collapse to every requested level from the one parse
+        with _profiling.stage(profile, "ezclean.aggregate"):
+            if workers is not None and workers > 1:
+                if groups is None:
+                    groups = _level_groups(rank_table, level_values)
+                aggregated = _sharded_levels(counts, groups, workers, compact=compact)
+            else:
+                aggregated = _collapse_levels(counts, rank_table, level_values, compact=compact)
+        for m in aggregated:
+            accumulated[m].append(aggregated[m])
+    
+    # Percentages, transpose back and metadata merge, per level
+    cleaned = {}
+    if spill is not None:
+        with _profiling.stage(profile, "ezclean.aggregate"):
+            percentages = _memmap_levels(spill.open(), rank_table, level_values, compact=compact)
+        for m, (taxa, level_percentages) in percentages.items():
+            with _profiling.stage(profile, "ezclean.percentages_merge") as st:
+                cleaned[m] = st.output(_array_finish_level(taxa, level_percentages, sample_ids, metadata_df))
+    else:
+        for m in accumulated:
+            with _profiling.stage(profile, "ezclean.percentages_merge") as st:
+                if sparse:
+                    sp = _scipy_sparse()
+                    cleaned[m] = _sparse_finish_level(taxa_labels[m], sp.hstack(accumulated[m]).tocsr(), sample_ids,
+                                                      metadata_df)
+                elif groups is not None:
+                    # The shards already hold the percentages of their samples
+                    cleaned[m] = _array_finish_level(groups[m][0], np.vstack(accumulated[m]), sample_ids,
+                                                     metadata_df)
+                else:
+                    cleaned[m] = _finish_level(pd.concat(accumulated[m], axis=1), metadata_df, compact=compact)
+                st.output(cleaned[m])
+    
+    # The lineage behind every unidentified_* name, for appending later batches
+    for m in cleaned:
+        cleaned[m].attrs[_UNIDENTIFIED_ATTR] = _unidentified_record(rank_table, m)
+    return cleaned
+# ---- Level Cleaning Helpers End ----
+
+# ---- Sharded Worker Helpers Start ----
+# workers=n splits the samples of a count matrix into n contiguous shards. The
+# taxon of every feature is factorized to an integer code once per level and
+# shared by all shards; a thread pool then sums every shard into taxa with one
+# np.add.reduceat per level and turns it into percentages on its own - a
+# sample's percentages only depend on its own counts - writing them into its own
+# rows of the preallocated result, so the result is the same as one pass over
+# the whole matrix. The numpy reductions release the GIL, so the threads use
+# several cores without the shards being copied to other processes. The group
+# statistics of ezviz/ezsummary are sharded by taxa columns the same way.
+def _shard_bounds(n, workers):
+    # (start, stop) of up to `workers` contiguous shards of n items, in order
+    edges = np.linspace(0, n, min(workers, max(n, 1)) + 1).astype(int)
+    return list(zip(edges[:-1], edges[1:]))
+
+
+def _map_shards(fn, n, workers):
+    # [fn(start, stop) for every shard], run on a thread pool
+    from concurrent.futures import ThreadPoolExecutor
+    bounds = _shard_bounds(n, workers)
+    with ThreadPoolExecutor(max_workers=len(bounds)) as executor:
+        return list(executor.map(lambda b: fn(*b), bounds))
+
+
+def _level_groups(rank_table, level_values):
+    # {level_value: (sorted taxa labels, feature order, group starts)}: the features
+    # sorted by the integer code of their taxon, so that the features of taxon i
+    # are order[starts[i]:starts[i + 1]] (the sorted labels are the groupby order)
+    groups = {}
+    for m in level_values:
+        codes, taxa = pd.factorize(_level_names(rank_table, m).values, sort=True)
+        order = np.argsort(codes, kind="stable")
+        groups[m] = (taxa, order, np.searchsorted(codes[order], np.arange(len(taxa))))
+    return groups
+
+
+def _block_percentages(block, order, starts):
+    # Per-sample percentages of one level for a samples x features float64 block
+    # without NaN (NaN counts as zero, like the groupby sum); a sample whose total
+    # is zero gives NaN, like the 0/0 of the dense division
+    if len(starts) == 0:
+        return np.empty((block.shape[0], 0))
+    sums = np.add.reduceat(block[:, order], starts, axis=1)
+    totals = sums.sum(axis=1, keepdims=True)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return sums / totals * 100
+
+
+def _sharded_levels(counts, groups, workers, compact=False):
+    # {level_value: samples x taxa percentages} of a features x samples count frame,
+    # computed shard by shard; groups is the _level_groups of its features.
+    values = counts.to_numpy(dtype=np.float64).T
+    dtype = np.float32 if compact else np.float64
+    percentages = {m: np.empty((values.shape[0], len(taxa)), dtype=dtype) for m, (taxa, _, _) in groups.items()}
+    
+    def shard(start, stop):
+        block = np.nan_to_num(values[start:stop])
+        for m, (taxa, order, starts) in groups.items():
+            percentages[m][start:stop] = _block_percentages(block, order, starts)
+    
+    _map_shards(shard, values.shape[0], workers)
+    return percentages
+# ---- Sharded Worker Helpers End ----
+
+
+# ---- Compact Dtype Helpers Start ----
+def _compact_counts(counts):
+    # Whole, non-negative read counts as the smallest unsigned integer type that
+    # holds them; anything else (fractions, negatives, NA) as float32.
+    values = counts.to_numpy()
+    if values.size == 0:
+        return counts
+    if np.isfinite(values).all() and (values >= 0).all() and (values == np.floor(values)).all():
+        return counts.astype(np.min_scalar_type(int(values.max())))
+    return counts.astype(np.float32)
+
+
+def _compact_metadata(metadata_df):
+    # Metadata columns (all but the sample id key) as categoricals when their
+    # values repeat, otherwise as Arrow strings when pyarrow is installed.
+    import importlib.util
+    has_pyarrow = importlib.util.find_spec("pyarrow") is not None
+    compact_df = metadata_df.copy()
+    for col in compact_df.columns[1:]:
+        if compact_df[col].nunique(dropna=True) <= len(compact_df) // 2:
+            compact_df[col] = compact_df[col].astype("category")
+        elif has_pyarrow:
+            compact_df[col] = compact_df[col].astype("string[pyarrow]")
+    return compact_df
+# ---- Compact Dtype Helpers End ----
+
+# ---- Memory-Mapped Count Helpers Start ----
+# With memmap set, the numeric count matrix is spilled to a memory-mapped file
+# (samples x features, rows appended as the chunks arrive) instead of being held
+# in memory. The level sums, sample totals and percentages are then computed
+# over blocks of sample rows of the mapped file, so working memory stays around
+# _MEMMAP_BLOCK_BYTES per block plus the cleaned result, whatever the size of
+# the table.
+_MEMMAP_BLOCK_BYTES = 64 * 2 ** 20
+
+
+def _block_rows(n_cols, itemsize):
+    # Sample rows per block so that one block of counts is about _MEMMAP_BLOCK_BYTES
+    return max(1, _MEMMAP_BLOCK_BYTES // max(n_cols * itemsize, 1))
+
+
+class _CountSpill:
+    # Append-only samples x features count file in its own temporary directory
+    # (under memmap when it is a directory, else under the system temp directory)
+    def __init__(self, memmap, compact=False):
+        if memmap is not True:
+            os.makedirs(memmap, exist_ok=True)
+        self.directory = tempfile.mkdtemp(prefix="mbX_memmap_", dir=None if memmap is True else memmap)
+        self.path = os.path.join(self.directory, "counts.bin")
+        self.dtype = np.dtype(np.float32 if compact else np.float64)
+        self.shape = (0, 0)
+        self._fh = open(self.path, "wb")
+    
+    def append(self, data_block):
+        # Write the samples x features block a few rows at a time; values that are
+        # not numeric become NaN, like the to_numeric of the in-memory path (which
+        # runs over the few sample columns of the transposed part, not the features)
+        numeric = all(pd.api.types.is_numeric_dtype(dtype) for dtype in data_block.dtypes)
+        rows = _block_rows(data_block.shape[1], self.dtype.itemsize)
+        for start in range(0, data_block.shape[0], rows):
+            part = data_block.iloc[start:start + rows]
+            if numeric:
+                values = part.to_numpy(dtype=self.dtype)
+            else:
+                values = pd.DataFrame(part.T.values).apply(pd.to_numeric, errors='coerce').to_numpy(dtype=self.dtype).T
+            np.ascontiguousarray(values).tofile(self._fh)
+        self.shape = (self.shape[0] + data_block.shape[0], data_block.shape[1])
+    
+    def open(self):
+        # The finished count matrix, mapped read-only
+        self._fh.close()
+        if 0 in self.shape:
+            return np.zeros(self.shape, dtype=self.dtype)
+        return np.memmap(self.path, dtype=self.dtype, mode="r", shape=self.shape)
+    
+    def remove(self):
+        self._fh.close()
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+
+def _memmap_levels(counts, rank_table, level_values, compact=False):
+    # Per-sample percentages at every level of a mapped samples x features count
+    # matrix, one block of sample rows at a time: the features of the block are
+    # summed into taxa (NaN counts as zero, like the groupby sum) and every row is
+    # divided by its sample total (0/0 gives NaN, like the dense division).
+    # Returns {level_value: (sorted taxa labels, samples x taxa percentages)}.
+    groups = _level_groups(rank_table, level_values)
+    
+    percentages = {
+        m: np.empty((counts.shape[0], len(groups[m][0])), dtype=np.float32 if compact else np.float64)
+        for m in level_values
     }
+    rows = _block_rows(counts.shape[1], counts.itemsize)
+    for start in range(0, counts.shape[0], rows):
+        block = np.nan_to_num(np.asarray(counts[start:start + rows], dtype=np.float64))
+        for m, (taxa, order, starts) in groups.items():
+            percentages[m][start:start + rows] = _block_percentages(block, order, starts)
+    return {m: (groups[m][0], percentages[m]) for m in level_values}
+# ---- Memory-Mapped Count Helpers End ----
+
+
+# ---- Sparse Backend Helpers Start ----
+# The sparse backend keeps the count matrix as a scipy CSR matrix (features x
+# samples) plus label arrays, so memory follows the non-zeros of the table.
+# scipy is only needed when sparse=True is requested.
+def _scipy_sparse():
+    try:
+        import scipy.sparse as sp
+    except ImportError:
+        raise ImportError("The sparse backend needs scipy. Install it with: pip install scipy")
+    return sp
+
+
+def _sparse_counts(data_block):
+    # Build a features x samples CSR matrix from a samples x features block. The
+    # block is made numeric a few sample rows at a time (_block_rows) and each of
+    # these row blocks becomes a CSR matrix in one step, so only one row block is
+    # ever dense. Values that are not numeric count as zero, as they do in the
+    # dense groupby sum.
+    sp = _scipy_sparse()
+    numeric = all(pd.api.types.is_numeric_dtype(dtype) for dtype in data_block.dtypes)
+    rows = _block_rows(data_block.shape[1], np.dtype(np.float64).itemsize)
+    blocks = []
+    for start in range(0, data_block.shape[0], rows):
+        part = data_block.iloc[start:start + rows]
+        if numeric:
+            values = part.to_numpy(dtype=np.float64)
+        else:
+            # to_numeric over the few sample columns of the transposed part
+            values = pd.DataFrame(part.T.values).apply(pd.to_numeric, errors='coerce').to_numpy(dtype=np.float64).T
+        values[np.isnan(values)] = 0
+        blocks.append(sp.csr_matrix(values))
+    if not blocks:
+        return sp.csr_matrix((data_block.shape[1], 0))
+    return sp.vstack(blocks).T.tocsr()
+
+
+def _sparse_chunk_rows(path, ext):
+    # Sample rows per chunk when the sparse backend streams a csv/txt/parquet file
+    # on its own: one _block_rows block of float64 counts
+    if ext == "parquet":
+        import pyarrow.parquet as pq
+        n_cols = len(pq.ParquetFile(path).schema_arrow.names)
+    else:
+        # Only the header row is needed; the csv module splits it much faster than
+        # read_csv(nrows=0) does for tables with thousands of columns
+        with open(path, newline="", encoding="utf-8") as fh:
+            n_cols = len(next(csv.reader(fh, delimiter="\t" if ext == "txt" else ","), []))
+    return _block_rows(n_cols, np.dtype(np.float64).itemsize)
+
+
+def _sparse_group_sum(matrix, keys):
+    # Sparse equivalent of DataFrame.groupby(keys).sum(): multiply by a 0/1
+    # indicator matrix. Returns the sorted group labels and the summed rows.
+    sp = _scipy_sparse()
+    codes, uniques = pd.factorize(keys, sort=True)
+    indicator = sp.csr_matrix(
+        (np.ones(len(codes)), (codes, np.arange(len(codes)))),
+        shape=(len(uniques), len(codes))
+    )
+    return uniques, (indicator @ matrix).tocsr()
+
+
+def _sparse_collapse_levels(counts, rank_table, level_values):
+    # Same roll-up as _collapse_levels, on a CSR count matrix. Returns
+    # {level_value: (taxa labels, taxa x samples CSR sums)}.
+    depth = max(_LEVELS_ORDER.index(m) for m in level_values)
+    if len(level_values) == 1:
+        (level_value,) = level_values
+        names = _level_names(rank_table, level_value).values
+        return {level_value: _sparse_group_sum(counts, names)}
+    
+    path = pd.MultiIndex.from_arrays([_level_names(rank_table, m).values for m in _LEVELS_ORDER[:depth + 1]])
+    path, current = _sparse_group_sum(counts, path)
+    
+    aggregated = {}
+    for idx in range(depth, -1, -1):
+        if idx < depth:
+            path, current = _sparse_group_sum(current, path.droplevel(-1))
+        level_value = _LEVELS_ORDER[idx]
+        if level_value in level_values:
+            aggregated[level_value] = _sparse_group_sum(current, path.get_level_values(idx))
+    return aggregated
+
+
+def _sparse_percentages(aggregated):
+    # Column-wise percentages of a taxa x samples CSR matrix, returned as a
+    # samples x taxa CSR matrix. Samples whose total is zero come out as a row of
+    # NaN, matching the 0/0 result of the dense division.
+    sp = _scipy_sparse()
+    col_sums = np.asarray(aggregated.sum(axis=0)).ravel()
+    empty = col_sums == 0
+    scale = np.divide(100.0, col_sums, out=np.zeros_like(col_sums, dtype=float), where=~empty)
+    percentages = (aggregated @ sp.diags(scale)).T.tocsr()
+    if empty.any():
+        rows = np.repeat(np.flatnonzero(empty), percentages.shape[1])
+        cols = np.tile(np.arange(percentages.shape[1]), int(empty.sum()))
+        percentages = percentages + sp.csr_matrix(
+            (np.full(len(rows), np.nan), (rows, cols)), shape=percentages.shape
+        )
+    return percentages
+
+
+def _sparse_finish_level(taxa, aggregated, sample_ids, metadata_df):
+    # Sparse counterpart of _finish_level: the taxa columns of the cleaned table
+    # are pandas Sparse columns built straight from the CSR percentages.
+    percentages = _sparse_percentages(aggregated)
+    df_ezy12 = pd.DataFrame.sparse.from_spmatrix(percentages, columns=[str(t) for t in taxa])
+    df_ezy12.insert(0, metadata_df.columns[0], sample_ids)
+    return _with_metadata(df_ezy12, metadata_df)
+# ---- Sparse Backend Helpers End ----
+
+# ---- Group Summary Helpers Start ----
+# Per-group statistics of the taxa columns of a cleaned table for several
+# categorical metadata columns at once. The taxa columns are read into one
+# samples x taxa matrix; each metadata column only adds integer group codes,
+# and all its statistics are grouped reductions of that matrix on those codes.
+_SUMMARY_STATS = ["mean", "count", "median", "std"]
+
+# Metadata values that do not name a group; their rows are left out of every group
+_INVALID_GROUP_VALUES = ["", "Na", "NA", "#VALUE!", "#NAME?"]
+
+
+def _summary_taxa_cols(cleaned_df, metadata_df):
+    # The taxa columns of a cleaned table: its sparse columns on the sparse
+    # backend, otherwise the numeric columns that are not metadata
+    dtypes = cleaned_df.dtypes
+    sparse_cols = [col for col, dtype in dtypes.items() if isinstance(dtype, pd.SparseDtype)]
+    if sparse_cols:
+        return sparse_cols
+    metadata_cols = set(metadata_df.columns)
+    return [col for col, dtype in dtypes.items()
+            if col not in metadata_cols and pd.api.types.is_numeric_dtype(dtype) and not pd.api.types.is_bool_dtype(dtype)]
+
+
+def _group_codes(labels):
+    # Sorted group labels and one code per row (-1 for rows in no group)
+    labels = pd.Series(labels).reset_index(drop=True)
+    labels = labels.where(labels.notna() & ~labels.isin(_INVALID_GROUP_VALUES))
+    codes, groups = pd.factorize(labels, sort=True)
+    return codes, pd.Index(groups, name=labels.name)
+
+
+def _dense_group_stats(values_df, codes, n_groups, stats, workers=None):
+    # Statistics of a samples x taxa float frame per group, from pandas' grouped
+    # reductions on the integer codes: NaN cells are skipped and std is the sample
+    # standard deviation, exactly as groupby(column)[taxa].mean() etc. give them.
+    # workers=n computes them for n shards of taxa columns on a thread pool.
+    if workers is not None and workers > 1:
+        shards = _map_shards(lambda start, stop: _dense_group_stats(values_df.iloc[:, start:stop], codes, n_groups,
+                                                                    stats), values_df.shape[1], workers)
+        return {stat: np.hstack([shard[stat] for shard in shards]) for stat in stats}
+    grouped = values_df.groupby(codes, sort=True)
+    groups = np.arange(n_groups)
+    return {stat: getattr(grouped, stat)().reindex(groups).to_numpy() for stat in stats}
+
+
+def _sparse_group_stats(matrix, nan_rows, codes, n_groups, stats):
+    # Same statistics on a samples x taxa CSR matrix (NaN entries set to zero) whose
+    # NaN rows - samples with a zero total - are flagged in nan_rows and skipped.
+    # Only a group's own rows are ever made dense, for its median.
+    sp = _scipy_sparse()
+    rows = np.flatnonzero((codes >= 0) & ~nan_rows)
+    indicator = sp.csr_matrix((np.ones(len(rows)), (codes[rows], rows)), shape=(n_groups, matrix.shape[0]))
+    n_valid = np.bincount(codes[rows], minlength=n_groups)
+    
+    count = np.repeat(n_valid[:, None], matrix.shape[1], axis=1)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mean = (indicator @ matrix).toarray() / count
+    result = {"mean": mean, "count": count}
+    if "std" in stats:
+        squares = (indicator @ matrix.multiply(matrix)).toarray()
+        with np.errstate(invalid="ignore", divide="ignore"):
+            variance = (squares - count * mean ** 2) / (count - 1)
+        result["std"] = np.sqrt(np.clip(variance, 0, None))
+        result["std"][count < 2] = np.nan
+    if "median" in stats:
+        result["median"] = np.array([
+            np.median(matrix[rows[codes[rows] == g]].toarray(), axis=0) if n_valid[g] else
+            np.full(matrix.shape[1], np.nan)
+            for g in range(n_groups)
+        ])
+    return result
+
+
+def _group_summaries(cleaned_df, metadata_df, columns, stats=("mean",), workers=None):
+    # {column: {"groups": sorted group labels, "taxa": taxa columns,
+    #           <stat>: groups x taxa array for every stat}} for each metadata column
+    taxa_cols = _summary_taxa_cols(cleaned_df, metadata_df)
+    sparse = bool(taxa_cols) and isinstance(cleaned_df[taxa_cols[0]].dtype, pd.SparseDtype)
+    if sparse:
+        sp = _scipy_sparse()
+        matrix = sp.csr_matrix(cleaned_df[taxa_cols].sparse.to_coo())
+        entry_rows = np.repeat(np.arange(matrix.shape[0]), np.diff(matrix.indptr))
+        nan_rows = np.zeros(matrix.shape[0], dtype=bool)
+        nan_rows[entry_rows[np.isnan(matrix.data)]] = True
+        matrix.data = np.nan_to_num(matrix.data)
+    else:
+        values_df = pd.DataFrame(cleaned_df[taxa_cols].to_numpy(dtype=np.float64))
     
-    final_file_name = final_names[level_value]
-    os.rename("microbiome_ezy_13.xlsx", final_file_name)
-    
-    return final_file_name
-    
-    
-    
-    
-    
-    
-    
+    summaries = {}
+    for column in columns:
+        codes, groups = _group_codes(cleaned_df[column])
+        if sparse:
+            summary = _sparse_group_stats(matrix, nan_rows, codes, len(groups), stats)
+        else:
+            summary = _dense_group_stats(values_df, codes, len(groups), stats, workers=workers)
+        summary = {stat: summary[stat] for stat in stats}
+        summary.update({"groups": groups, "taxa": taxa_cols})
+        summaries[column] = summary
+    return summaries
+
+
+def _summary_frame(summaries, level_code):
+    # Long table of group summaries: one row per metadata column, group and taxon
+    frames = []
+    for column, summary in summaries.items():
+        stats = [stat for stat in _SUMMARY_STATS if stat in summary]
+        n_groups, n_taxa = len(summary["groups"]), len(summary["taxa"])
+        frame = pd.DataFrame({
+            "metadata": column,
+            "group": np.repeat(np.asarray(summary["groups"], dtype=object), n_taxa),
+            _LEVEL_MAPPING[level_code]: np.tile(np.asarray(summary["taxa"], dtype=object), n_groups)
+        })
+        for stat in stats:
+            frame[stat] = summary[stat].reshape(-1)
+        frames.append(frame)
+    return pd.concat(frames, ignore_index=True)
+# ---- Group Summary Helpers End ----
+
+# ---- Taxa Collapse Helpers Start ----
+# ezviz keeps the most abundant taxa of a group means table (one row per taxon)
+# and sums the rest into an Other_* row. The taxa are ranked once per table, and
+# a whole list of top_taxa or threshold values is collapsed from that ranking:
+# the Other_* row of every value comes from one reverse cumulative sum.
+def _rank_taxa(row_avg, k=None):
+    # Row positions by descending row_avg, ties in table order and NaN last, as
+    # sort_values(ascending=False, kind="stable") orders them. With k only the
+    # first k are returned: a partial selection (np.partition) finds the k-th
+    # largest value and only the rows up to it are sorted.
+    keys = -np.asarray(row_avg, dtype=float)
+    keys[np.isnan(keys)] = np.inf
+    if k is not None and k < len(keys):
+        if k <= 0:
+            return np.array([], dtype=np.intp)
+        kth = np.partition(keys, k - 1)[k - 1]
+        better = np.flatnonzero(keys < kth)
+        tied = np.flatnonzero(keys == kth)[:k - len(better)]
+        rows = np.sort(np.concatenate([better, tied]))
+    else:
+        rows = np.arange(len(keys))
+    return rows[np.argsort(keys[rows], kind="stable")]
+
+
+def _collapse_taxa(df_clean5, level_code, top_taxa=None, threshold=None):
+    # {value: visualization table} for every top_taxa value, or every threshold value
+    # (each a single value or a list); {None: whole ranked table} without either.
+    # top_taxa=k keeps the k taxa with the highest average over the groups when
+    # there are more than k; threshold=t keeps the taxa averaging at least t when
+    # some average less. The taxa that are not kept are summed into the Other_* row.
+    row_avg = df_clean5.iloc[:, 1:].mean(axis=1, skipna=True).to_numpy()
+    n_taxa = len(row_avg)
+    if threshold is not None:
+        sweep = threshold if isinstance(threshold, (list, tuple)) else [threshold]
+        # Number of kept taxa, or None to keep the whole table (no Other_* row)
+        kept = {t: int(np.sum(row_avg >= t)) if np.any(row_avg < t) else None for t in sweep}
+    elif top_taxa is not None:
+        sweep = top_taxa if isinstance(top_taxa, (list, tuple)) else [top_taxa]
+        kept = {k: k if n_taxa > k else None for k in sweep}
+    else:
+        kept = {None: None}
+    
+    whole_table = any(m is None for m in kept.values())
+    depth = max([m for m in kept.values() if m is not None], default=0)
+    order = _rank_taxa(row_avg, None if whole_table else depth)
+    
+    # Other_* sums: the taxa below the deepest cut, plus the reverse cumulative sum
+    # of the ranked taxa above it (tail[m] = taxa m .. depth-1 of the ranking)
+    values = np.nan_to_num(df_clean5.iloc[:, 1:].to_numpy(dtype=np.float64))
+    below = np.ones(n_taxa, dtype=bool)
+    below[order[:depth]] = False
+    rest = values[below].sum(axis=0)
+    tail = np.zeros((depth + 1, values.shape[1]))
+    tail[:depth] = np.cumsum(values[order[:depth]][::-1], axis=0)[::-1]
+    
+    other_row_name = _OTHER_NAMES.get(level_code)
+    tables = {}
+    for value, m in kept.items():
+        if m is None:
+            tables[value] = df_clean5.iloc[order].reset_index(drop=True)
+            continue
+        other_row = pd.DataFrame([[other_row_name] + list(rest + tail[m])], columns=df_clean5.columns)
+        tables[value] = pd.concat([df_clean5.iloc[order[:m]], other_row], ignore_index=True)
+    return tables
+# ---- Taxa Collapse Helpers End ----
+
+# ---- BIOM Reader Helpers Start ----
+# BIOM 2.1 feature tables (HDF5, e.g. QIIME2's feature-table.biom) are read with
+# h5py straight from their datasets: the sample ids, one lineage per observation
+# and the counts as a features x samples CSR matrix. The counts never become a
+# dense feature table; they go through the sparse level collapse even when the
+# cleaned result is dense. h5py and scipy are only needed for .biom input.
+_BIOM_EXTS = ["biom"]
+
+# One block of samples of a BIOM table: features x samples CSR counts, the ids of
+# its sample columns and the lineage of every feature row
+_BiomBlock = namedtuple("_BiomBlock", ["counts", "sample_ids", "lineages"])
+
+
+def _h5py():
+    try:
+        import h5py
+    except ImportError:
+        raise ImportError("Reading BIOM files needs h5py. Install it with: pip install h5py")
+    return h5py
+
+
+def _biom_text(values):
+    # HDF5 string datasets come back as bytes; decode them (keeping the shape)
+    values = np.asarray(values, dtype=object)
+    decoded = [v.decode("utf-8") if isinstance(v, bytes) else str(v) for v in values.ravel()]
+    return np.array(decoded, dtype=object).reshape(values.shape)
+
+
+def _biom_lineage(value):
+    # Observation metadata that is not a list of strings is stored JSON encoded
+    # (e.g. '"d__Bacteria; p__Firmicutes"' or '["d__Bacteria", "p__Firmicutes"]')
+    if value[:1] in ['"', "["]:
+        try:
+            value = json.loads(value)
+        except ValueError:
+            pass
+    if isinstance(value, list):
+        return "; ".join(str(rank) for rank in value if str(rank).strip())
+    return str(value)
+
+
+def _biom_lineages(h5):
+    # The "taxonomy" observation metadata (one row of ranks per observation, or one
+    # string), or else the observation ids, which hold the lineages of a table
+    # collapsed by taxonomy (qiime taxa collapse).
+    group = h5.get("observation/metadata")
+    key = None
+    if group is not None:
+        key = next((k for k in ["taxonomy", "Taxonomy", "taxon", "Taxon"] if k in group), None)
+    if key is None:
+        return list(_biom_text(h5["observation/ids"][()]))
+    taxonomy = _biom_text(group[key][()])
+    if taxonomy.ndim == 2:
+        # Rows of ranks are padded with empty strings to the longest lineage
+        return ["; ".join(rank for rank in row if rank.strip()) for row in taxonomy]
+    return [_biom_lineage(value) for value in taxonomy]
+
+
+def _iter_biom(path, chunksize=None):
+    # Yield _BiomBlocks of a BIOM 2.1 file: the whole table from the observation-major
+    # (CSR) matrix, or with chunksize set, blocks of that many samples sliced out of
+    # the sample-major (CSC) matrix, so only one block's non-zeros are in memory.
+    sp = _scipy_sparse()
+    with _h5py().File(path, "r") as h5:
+        lineages = _biom_lineages(h5)
+        sample_ids = list(_biom_text(h5["sample/ids"][()]))
+        shape = (len(lineages), len(sample_ids))
+        if chunksize is None:
+            matrix = h5["observation/matrix"]
+            counts = sp.csr_matrix((matrix["data"][()], matrix["indices"][()], matrix["indptr"][()]), shape=shape)
+            yield _BiomBlock(counts, sample_ids, lineages)
+            return
+        
+        matrix = h5["sample/matrix"]
+        indptr = matrix["indptr"][()]
+        for start in range(0, shape[1], chunksize):
+            stop = min(start + chunksize, shape[1])
+            lo, hi = indptr[start], indptr[stop]
+            block = sp.csc_matrix((matrix["data"][lo:hi], matrix["indices"][lo:hi], indptr[start:stop + 1] - lo),
+                                  shape=(shape[0], stop - start))
+            yield _BiomBlock(block.tocsr(), sample_ids[start:stop], lineages)
+# ---- BIOM Reader Helpers End ----
+
+
+def ezclean(microbiome_data, metadata, level="d", save=True, sparse=False, chunksize=None, format="xlsx",
+            cache=None, output_dir=None, profile=None, compact=False, memmap=None, append_to=None, workers=None):
+    # profile: a profiling.StageReport (or a callable taking each stage record)
+    # that records the wall/CPU time, peak memory and output size of every stage.
+    # compact=True keeps the metadata as categoricals (or Arrow strings), the
+    # counts as the smallest unsigned integers and the abundances as float32.
+    # memmap=True (or a directory for the scratch file) spills the count matrix to
+    # a memory-mapped file and aggregates it block by block; use it together with
+    # chunksize to keep memory bounded for tables larger than RAM.
+    # append_to: an earlier ezclean result (see step 7); microbiome_data then only
+    # needs to hold the new samples.
+    # workers=n collapses and normalizes the counts in n shards of samples on a
+    # thread pool (dense backend only; the sparse and memmap paths ignore it).
+    profile = _profiling.resolve_profile(profile)
     
+    # -------------------------------
+    # 1. File Extension Checks and Data Reading
+    # -------------------------------
+    # Check the file extension for microbiome_data
+    microbiome_ext = os.path.splitext(microbiome_data)[1].lower().lstrip('.')
+    if microbiome_ext not in ['csv', 'xls', 'xlsx', 'txt'] + _COLUMNAR_EXTS + _BIOM_EXTS:
+        return ("The file is not csv, xls, xlsx, txt, parquet, feather, arrow, or biom format. "
+                "Please check the file type for microbiome data.")
+    
+    # Check the requested output format
+    if format not in _OUTPUT_EXTS:
+        return "The output format should be one of the following: xlsx, parquet, feather."
+    if sparse and memmap:
+        return "The sparse backend and memmap cannot be used together."
+    if workers is not None and (not isinstance(workers, int) or isinstance(workers, bool) or workers < 1):
+        return "workers should be a positive integer."
     
+    # Check the file extension for metadata and read accordingly
+    # (a metadata DataFrame is used directly, with its values taken as text)
+    with _profiling.stage(profile, "ezclean.read_metadata"):
+        metadata_ext = None if isinstance(metadata, pd.DataFrame) else os.path.splitext(metadata)[1].lower().lstrip('.')
+        if metadata_ext is None:
+            metadata_df = _as_text(metadata)
+        elif metadata_ext == "txt":
+            metadata_df = pd.read_csv(metadata, sep="\t", header=0, dtype=str)
+        elif metadata_ext == "csv":
+            metadata_df = pd.read_csv(metadata, header=0, dtype=str)
+        elif metadata_ext in ["xls", "xlsx"]:
+            metadata_df = pd.read_excel(metadata, header=0, dtype=str)
+            metadata_df = pd.DataFrame(metadata_df)
+        elif metadata_ext in _COLUMNAR_EXTS:
+            metadata_df = _read_columnar(metadata, metadata_ext, text=True)
+        else:
+            return "Please check the file format of metadata."
     
+    # -------------------------------
+    # 2. Metadata Header Check
+    # -------------------------------
+    valid_headers = ["id", "sampleid", "sample id", "sample-id", "featureid", "feature id", "feature-id"]
+    first_header = metadata_df.columns[0].strip().lower()
+    if first_header not in valid_headers:
+        return "Please check the first header of the metadata for file format correction."
+    if compact:
+        metadata_df = _compact_metadata(metadata_df)
     
+    # -------------------------------
+    # 3. Taxonomic Level Mapping
+    # -------------------------------
+    # Level names and abbreviations map to rank markers through _LEVEL_CODES.
+    # A single level returns a single result; a list of levels (or "all") returns
+    # a dict keyed by the levels as given, all computed from one read and parse.
+    multi_level = not isinstance(level, str) or level.lower() == "all"
+    if isinstance(level, str) and level.lower() == "all":
+        requested = [_LEVEL_MAPPING[m] for m in _LEVELS_ORDER]
+    elif multi_level:
+        requested = list(level)
+    else:
+        requested = [level]
     
+    level_values = {}
+    for lv in requested:
+        level_key = _level_code(lv)
+        if level_key is None:
+            return ("The level value should be one of the following: domain, phylum, class, order, "
+                    "family, genera, species or their abbreviations.")
+        level_values[lv] = level_key
     
+    # -------------------------------
+    # 4. Result Cache Lookup
+    # -------------------------------
+    # With cache set, levels already cleaned from identical input files are taken
+    # from the cache and only the remaining levels are computed (and then stored).
+    result_cache = _cache.resolve_cache(cache)
+    cache_keys = {}
+    cleaned = {}
+    if result_cache is not None:
+        with _profiling.stage(profile, "ezclean.cache_lookup"):
+            for level_value in set(level_values.values()):
+                cache_keys[level_value] = _cache.make_key(
+                    "ezclean", [microbiome_data, metadata], level=level_value, sparse=sparse, compact=compact
+                )
+                hit = result_cache.get(cache_keys[level_value])
+                if hit is not None:
+                    cleaned[level_value] = hit
+    missing_levels = set(level_values.values()) - set(cleaned)
+    
+    if missing_levels:
+        # -------------------------------
+        # 5. Read Microbiome Data
+        # -------------------------------
+        # Note: To preserve numeric values, do not force dtype=str.
+        # With chunksize set, txt/csv/parquet files are streamed in blocks of that many
+        # sample rows instead of being loaded whole (Excel and Feather files are always
+        # read whole). A BIOM file is read from its sparse HDF5 datasets, with
+        # chunksize in blocks of that many samples. The sparse backend always streams
+        # txt/csv/parquet files, so the dense table is never loaded whole.
+        with _profiling.stage(profile, "ezclean.read_microbiome"):
+            if sparse and chunksize is None and microbiome_ext in ["txt", "csv", "parquet"]:
+                chunksize = _sparse_chunk_rows(microbiome_data, microbiome_ext)
+            if microbiome_ext == "txt":
+                microbiome_df = pd.read_csv(microbiome_data, sep="\t", header=0, chunksize=chunksize)
+            elif microbiome_ext == "csv":
+                microbiome_df = pd.read_csv(microbiome_data, header=0, chunksize=chunksize)
+            elif microbiome_ext in ["xls", "xlsx"]:
+                # Skip the first row (mimicking an R skip index row) but do not force string conversion
+                microbiome_df = pd.read_excel(microbiome_data, skiprows=1)
+            elif microbiome_ext == "parquet" and chunksize is not None:
+                microbiome_df = _iter_parquet(microbiome_data, chunksize)
+            elif microbiome_ext in _COLUMNAR_EXTS:
+                microbiome_df = _read_columnar(microbiome_data, microbiome_ext)
+            elif microbiome_ext in _BIOM_EXTS:
+                if not _h5py().is_hdf5(microbiome_data):
+                    return ("The BIOM file is not in the HDF5 (BIOM 2.1) format. "
+                            "Please convert it with: biom convert --to-hdf5")
+                microbiome_df = _iter_biom(microbiome_data, chunksize)
+            else:
+                return "The microbiome file is not in a supported format. Please use txt, csv, xls, or xlsx."
+    
+        # -------------------------------
+        # 6. Clean Every Missing Level
+        # -------------------------------
+        # BIOM files are already read sparse, so they are never spilled
+        spill = _CountSpill(memmap, compact) if memmap and microbiome_ext not in _BIOM_EXTS else None
+        try:
+            computed = _clean_levels(microbiome_df, metadata_df, missing_levels, sparse=sparse, profile=profile,
+                                     compact=compact, spill=spill, workers=workers)
+        finally:
+            if not isinstance(microbiome_df, pd.DataFrame):
+                microbiome_df.close()
+            if spill is not None:
+                spill.remove()
+        for level_value, cleaned_df in computed.items():
+            cleaned[level_value] = cleaned_df
+            if result_cache is not None:
+                result_cache.put(cache_keys[level_value], cleaned_df)
     
+    # -------------------------------
+    # 7. Append To An Earlier Cleaned Table
+    # -------------------------------
+    # With append_to (a cleaned DataFrame, a dict of them from a multi-level call,
+    # or a mbX_cleaned_* file), the samples cleaned above are a new batch: they are
+    # appended to the earlier table of each level, so the cost follows the size of
+    # the batch rather than of the whole cohort.
+    if append_to is not None:
+        if len(set(level_values.values())) > 1 and not isinstance(append_to, dict):
+            return "To append several levels, pass the dict of cleaned tables a multi-level ezclean returned."
+        with _profiling.stage(profile, "ezclean.append"):
+            for level_value in set(level_values.values()):
+                existing_df = _cleaned_for_level(append_to, level_value)
+                if existing_df is None:
+                    return "The table to append to does not contain the requested taxonomic level."
+                cleaned[level_value] = _append_cleaned(existing_df, cleaned[level_value], metadata_df, sparse=sparse,
+                                                       compact=compact)
     
-    return "Processing complete."
+##FINAL RETURN BASED ON THE TAXA LEVEL IN THE INPUT OF THE FUNCTION
+
+    # ---- Final Return Block ----
+    results = {}
+    for lv, level_value in level_values.items():
+        if not save:
+            results[lv] = cleaned[level_value]
+            continue
+        final_file_name = _output_path(output_dir, _output_name(_CLEANED_NAMES[level_value], format))
+        if final_file_name not in results.values():
+            with _profiling.stage(profile, "ezclean.write") as st:
+                _write_output(st.output(cleaned[level_value]), final_file_name, format)
+        results[lv] = final_file_name
+    
+    if multi_level:
+        return results
+    return results[level]
 
 # Example usage:
 # result = ezclean("microbiome2.csv", "metadata2.txt", "s")
@@ -495,387 +1475,44 @@ import pandas.api.types as ptypes
 
 
 
-def ezviz(microbiome_data, metadata, level, selected_metadata, top_taxa=None, threshold=None):
-    import os
-    import pandas as pd
-    import numpy as np
-    # Check the file extension for microbiome_data
-    microbiome_ext = os.path.splitext(microbiome_data)[1].lower().lstrip('.')
-    if microbiome_ext not in ['csv', 'xls', 'xlsx']:
-        return "The file is not csv, xls, or xlsx format. Please check the file type for microbiome data."
-    
-    # Check the file extension for metadata
-    metadata_ext = os.path.splitext(metadata)[1].lower().lstrip('.')
-    if metadata_ext == 'txt':
-        metadata_df = pd.read_csv(metadata, sep="\t", header=0)
-    elif metadata_ext == 'csv':
-        metadata_df = pd.read_csv(metadata, header=0)
-    elif metadata_ext in ['xls', 'xlsx']:
-        metadata_df = pd.read_excel(metadata, header=0, engine='openpyxl')
-    else:
-        return "Please check the file format of metadata."
-    
-
-
-
-
-
-
-
-
-
-
-
-    # Check the first header of metadata
-    valid_headers = ["id", "sampleid", "sample id", "sample-id", 
-                     "featureid", "feature id", "feature-id"]
-    first_header = metadata_df.columns[0].strip().lower()
-    if first_header not in valid_headers:
-        return "Please check the first header of the metadata for file format correction."
-    
-    # Check if the selected_metadata is a valid categorical column in metadata_df.
-    # We consider categorical columns as those with dtype 'object' (strings) or 'category'
-    if (selected_metadata not in metadata_df.columns or 
-        not (ptypes.is_categorical_dtype(metadata_df[selected_metadata]) or 
-             ptypes.is_object_dtype(metadata_df[selected_metadata]))):
-        return "The selected metadata is either not in the metadata or not a categorical value"
-    
-
-
-
-
-
-
-
-
-    # Read microbiome data based on file extension
-    if microbiome_ext == "txt":
-        microbiome_df = pd.read_csv(microbiome_data, sep="\t", header=0)
-    elif microbiome_ext == "csv":
-        microbiome_df = pd.read_csv(microbiome_data, header=0)
-    elif microbiome_ext in ["xls", "xlsx"]:
-        # Mimic the R behavior of skipping the first row
-        microbiome_df = pd.read_excel(microbiome_data, skiprows=1, engine="openpyxl")
-    else:
-        return "The microbiome file is not in a supported format. Please use txt, csv, xls, or xlsx."
-
-
-
-
-
-
-
-    
-    levels_map = {
-        "domain": "d__",
-        "Domain": "d__",
-        "DOMAIN": "d__",
-        "D": "d__",
-        "d": "d__",
-        "kingdom": "d__",
-        "Kingdom": "d__",
-        "KINGDOM": "d__",
-        "K": "d__",
-        "k": "d__",
-        "phylum": "p__",
-        "Phylum": "p__",
-        "PHYLUM": "p__",
-        "P": "p__",
-        "p": "p__",
-        "class": "c__",
-        "Class": "c__",
-        "CLASS": "c__",
-        "C": "c__",
-        "c": "c__",
-        "order": "o__",
-        "Order": "o__",
-        "ORDER": "o__",
-        "O": "o__",
-        "o": "o__",
-        "family": "f__",
-        "Family": "f__",
-        "FAMILY": "f__",
-        "F": "f__",
-        "f": "f__",
-        "genera": "g__",
-        "Genera": "g__",
-        "GENERA": "g__",
-        "G": "g__",
-        "g": "g__",
-        "species": "s__",
-        "Species": "s__",
-        "SPECIES": "s__",
-        "S": "s__",
-        "s": "s__"
-    }
-
-
-
-
-    # Get the corresponding level code using the lower-case version of level
-    level_code = levels_map.get(level.lower())
-    if level_code is None:
-        return "Invalid taxonomic level provided."
-    
-    # Ensure that only one of top_taxa or threshold is provided
-    if top_taxa is not None and threshold is not None:
-        return "Only one of the parameter can be selected between top_taxa and threshold"
-    
-    # Determine the threshold value based on the provided parameter
-    if threshold is not None:
-        threshold_value = threshold
-    elif top_taxa is not None:
-        threshold_value = top_taxa
-    else:
-        threshold_value = None
-    
-    ##### File Handling: Run ezclean and use its output #####
-    cleaned_file_ezviz = ezclean(microbiome_data, metadata, level)
-    print("ezclean returned:", cleaned_file_ezviz)
-    
-    import os
-    if not os.path.exists(cleaned_file_ezviz):
-        raise FileNotFoundError(f"The file returned by ezclean does not exist: {cleaned_file_ezviz}")
-    
-
-
-
-
-
-
-
-##READING THE CLEANED FILE FROM THE EZCLEAN
-
-    cleaned_data = pd.read_excel(cleaned_file_ezviz, header=0, engine="openpyxl")
-
-
-
-
-
-
-    # Identify metadata columns in cleaned_data that are also present in metadata_df
-    metadata_cols_in_cleaned = list(set(metadata_df.columns).intersection(cleaned_data.columns))
-    
-    # Check that the selected_metadata is indeed present in the cleaned data
-    if selected_metadata not in metadata_cols_in_cleaned:
-        raise Exception(f"The selected metadata column '{selected_metadata}' was not found in the cleaned data.")
-    
-    # Determine which metadata columns (that are present) should be removed
-    metadata_to_remove = set(metadata_cols_in_cleaned) - {selected_metadata}
-    
-    # Subset the cleaned_data to keep only non-metadata columns plus the selected_metadata column
-    subset_data = cleaned_data.loc[:, [col for col in cleaned_data.columns if col not in metadata_to_remove]]
-    
-    # Write the resulting subset_data to "mbX_cleaning_1.xlsx"
-    subset_data.to_excel("mbX_cleaning_1.xlsx", index=False)
-    
-    
-    
-
-
-
-
-
-
-
-
-
-  
-    
-        # Read in the "mbX_cleaning_1.xlsx" file
-    data_cleaning_mbX_1 = pd.read_excel("mbX_cleaning_1.xlsx", engine="openpyxl")
+def _ezviz_data(summary, selected_metadata, level_code, top_taxa, threshold, profile=None):
+    # Everything ezviz does between the group means and plotting: lay the means of
+    # one metadata column (a _group_summaries entry) out with one row per taxon,
+    # and collapse the rare taxa into an Other_* row. Returns the visualization
+    # tables as {top_taxa or threshold value: table} (see _collapse_taxa).
     
-    # Define invalid values for the selected metadata column
-    invalid_values = ["", "Na", "NA", "#VALUE!", "#NAME?"]
+    with _profiling.stage(profile, "ezviz.reshape") as st:
+        # One row per taxon and one column per group; the first column holds the
+        # taxon names under the selected metadata's name
+        df_clean5 = pd.DataFrame(summary["mean"].T, columns=list(summary["groups"]))
+        df_clean5.insert(0, selected_metadata, list(summary["taxa"]), allow_duplicates=True)
+        st.output(df_clean5)
     
-    # Filter out rows where the selected_metadata column is empty, NA, or contains an invalid value
-    data_cleaning_mbX_1 = data_cleaning_mbX_1[
-        data_cleaning_mbX_1[selected_metadata].notna() &
-        (~data_cleaning_mbX_1[selected_metadata].isin(invalid_values))
-    ]
-    
-    # Group the data by the selected_metadata column and calculate the mean for each numeric column
-    numeric_cols = data_cleaning_mbX_1.select_dtypes(include=[np.number]).columns
-    data_summary_mbX_2 = data_cleaning_mbX_1.groupby(selected_metadata)[numeric_cols].mean().reset_index()
-    
-    # Write the summarized data to "mbX_cleaning_2.xlsx"
-    data_summary_mbX_2.to_excel("mbX_cleaning_2.xlsx", index=False)
-    
-        
-    
-
-
-
-
-    # Read in the "mbX_cleaning_2.xlsx" file with headers
-    data_cleaning_mbX_2 = pd.read_excel("mbX_cleaning_2.xlsx", engine="openpyxl")
-    
-    # Transpose the DataFrame using .T (this converts rows to columns and vice versa)
-    data_transposed_mbX_3 = data_cleaning_mbX_2.T
-    
-    # Write the transposed DataFrame to "mbX_cleaning_3.xlsx", including the index (row names)
-    data_transposed_mbX_3.to_excel("mbX_cleaning_3.xlsx", index=True)
-    
-
-
-
-
-
-
-
-
-
-
-
-
-    # Read in the "mbX_cleaning_3.xlsx" file without using a header
-    raw_data_mbX_3 = pd.read_excel("mbX_cleaning_3.xlsx", header=None, engine="openpyxl")
-    
-    # Remove the very first row (assumed to be the unwanted index row)
-    raw_data_no_index = raw_data_mbX_3.iloc[1:, :]
-    
-    # Now, the first row of raw_data_no_index is the actual header.
-    header_row = raw_data_no_index.iloc[0]
-    data_without_index = raw_data_no_index.iloc[1:, :].copy()
-    
-    # Assign the header row as column names
-    data_without_index.columns = header_row
-    
-    # Write the cleaned data to "mbX_cleaning_4.xlsx" without row names
-    data_without_index.to_excel("mbX_cleaning_5.xlsx", index=False)
-    
-    
-    
-
-
-
+    with _profiling.stage(profile, "ezviz.select_taxa"):
+        # Keep the most abundant taxa and sum the rest into the Other_* row, for
+        # every top_taxa / threshold value at once
+        return _collapse_taxa(df_clean5, level_code, top_taxa=top_taxa, threshold=threshold)
 
 
+# Plot file types ezviz can write, and the settings of preview=True: a small
+# low-resolution PNG that is quick to draw, e.g. for dashboard thumbnails
+_PLOT_FORMATS = ["pdf", "png", "svg"]
+_PREVIEW_PLOT = {"plot_format": "png", "dpi": 72, "max_size": (12, 15)}
 
 
-
-
-    
-    
-    import pandas as pd
-    import numpy as np
-    import os
-    
-    # Read in "mbX_cleaning_5.xlsx"
-    df_clean5 = pd.read_excel("mbX_cleaning_5.xlsx", engine="openpyxl")
-    
-    # Assume the first column contains taxon names and the remaining columns are numeric.
-    # Compute the row averages (ignoring the first column)
-    numeric_matrix = df_clean5.iloc[:, 1:]
-    row_avg = numeric_matrix.mean(axis=1, skipna=True)
-    
-    # Attach the computed averages as a new column "RowAvg"
-    df_clean5["RowAvg"] = row_avg
-    
-    # Sort the data frame in descending order by the row average
-    df_sorted = df_clean5.sort_values(by="RowAvg", ascending=False).reset_index(drop=True)
-    
-    # Define the mapping for the aggregated "Other" row names
-    other_name_map = {
-        "d__": "Other_domains",
-        "p__": "Other_phyla",
-        "c__": "Other_classes",
-        "o__": "Other_orders",
-        "f__": "Other_families",
-        "g__": "Other_genera",
-        "s__": "Other_species"
-    }
-    
-    # Retrieve the proper "Other" name based on level_code (assumed defined previously)
-    other_row_name = other_name_map.get(level_code)
-    
-    # Initialize final data frame variable
-    final_df = None
-    
-    if threshold is not None:
-        # --- THRESHOLD LOGIC ---
-        # Keep rows with average >= threshold
-        rows_keep = df_sorted[df_sorted["RowAvg"] >= threshold].copy()
-        # Rows with average below threshold will be aggregated
-        rows_agg = df_sorted[df_sorted["RowAvg"] < threshold].copy()
-        
-        if not rows_agg.empty:
-            # Sum the numeric values (columns 2 to second-to-last, excluding the first taxon column and the last "RowAvg" column)
-            agg_values = rows_agg.iloc[:, 1:-1].sum(skipna=True)
-            # Create a new row: first column is the Other row name; numeric columns are the aggregated sums.
-            agg_row = pd.DataFrame([[""] * df_sorted.shape[1]], columns=df_sorted.columns)
-            agg_row.iloc[0, 0] = other_row_name
-            agg_row.iloc[0, 1:-1] = agg_values.values
-            agg_row.iloc[0, -1] = np.nan
-            # Combine the kept rows with the aggregated row.
-            final_df = pd.concat([rows_keep, agg_row], ignore_index=True)
-        else:
-            final_df = df_sorted.copy()
-            
-    elif top_taxa is not None:
-        # --- TOP_TAXA LOGIC ---
-        if df_sorted.shape[0] > top_taxa:
-            rows_keep = df_sorted.iloc[:top_taxa, :].copy()
-            rows_agg = df_sorted.iloc[top_taxa:, :].copy()
-            
-            if not rows_agg.empty:
-                agg_values = rows_agg.iloc[:, 1:-1].sum(skipna=True)
-                agg_row = pd.DataFrame([[""] * df_sorted.shape[1]], columns=df_sorted.columns)
-                agg_row.iloc[0, 0] = other_row_name
-                agg_row.iloc[0, 1:-1] = agg_values.values
-                agg_row.iloc[0, -1] = np.nan
-                final_df = pd.concat([rows_keep, agg_row], ignore_index=True)
-            else:
-                final_df = df_sorted.copy()
-        else:
-            final_df = df_sorted.copy()
-    else:
-        final_df = df_sorted.copy()
-    
-    # Remove the helper "RowAvg" column before writing the output
-    final_df = final_df.drop(columns=["RowAvg"])
-    
-    # Define a mapping for visualization data file names based on level_code
-    vizDataNames = {
-        "d__": "mbX_vizualization_data_domains.xlsx",
-        "p__": "mbX_vizualization_data_phyla.xlsx",
-        "c__": "mbX_vizualization_data_classes.xlsx",
-        "o__": "mbX_vizualization_data_orders.xlsx",
-        "f__": "mbX_vizualization_data_families.xlsx",
-        "g__": "mbX_vizualization_data_genera.xlsx",
-        "s__": "mbX_vizualization_data_species.xlsx"
-    }
-    
-    # Determine the output file name based on level_code
-    outputVizFile = vizDataNames.get(level_code)
-    
-    # Write the final data frame to the dynamic file name without row names
-    final_df.to_excel(outputVizFile, index=False)
-    
-    # --- Later, when reading the file for plotting ---
-    
-    # Check if the file exists before reading
-    if not os.path.exists(outputVizFile):
-        raise FileNotFoundError(f"The file {outputVizFile} does not exist in the working directory: {os.getcwd()}")
-    
-    df_clean6 = pd.read_excel(outputVizFile, engine="openpyxl")
-    
-    
-    
-    
-
-
-
-
-    
-    
-    import re
-    import os
+def _render_plot(df_clean6, level_code, selected_metadata, output_plot_filename, dpi=1200, rasterize=False,
+                 max_size=None):
+    # Draw the stacked relative-abundance bar plot of a visualization table
+    # (taxa as rows, selected_metadata groups as columns) and save it. The file
+    # type follows the extension of output_plot_filename; rasterize=True turns the
+    # bar layer of a PDF/SVG into an image at dpi, and max_size=(width, height)
+    # caps the figure size in inches.
     import gc
     import warnings
-    import numpy as np
-    import pandas as pd
-    import matplotlib.pyplot as plt
+    from matplotlib.figure import Figure
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.collections import PolyCollection
+    from matplotlib.patches import Patch
     
     # --- LEN FOR THE ROTATION OF THE TEXT IN THE X AXIS ---
     
@@ -964,26 +1601,51 @@ def ezviz(microbiome_data, metadata, level, selected_metadata, top_taxa=None, th
     pivot_df = df_long.pivot(index="Sample", columns=taxa_col, values="Abundance").fillna(0)
     pivot_df = pivot_df.sort_index()  # sort samples alphabetically
     
-    # Create the stacked bar plot using matplotlib
-    fig, ax = plt.subplots()
-    bottom = np.zeros(len(pivot_df))
-    # Use the order of taxa as in the original df_clean6 for consistent ordering
-    for taxon in df_clean6[taxa_col]:
-        if taxon in pivot_df.columns:
-            values = pivot_df[taxon].values
-            ax.bar(pivot_df.index, values, bottom=bottom,
-                   label=taxon, color=taxon_to_color.get(taxon))
-            bottom += values
+    # Create the stacked bar plot on its own Figure and Agg canvas; nothing goes
+    # through pyplot's global current-figure state, so plots can be drawn from
+    # several threads at once.
+    fig = Figure()
+    FigureCanvasAgg(fig)
+    ax = fig.add_subplot()
     
+    # Use the order of taxa as in the original df_clean6 for consistent ordering
+    stacked_taxa = [taxon for taxon in df_clean6[taxa_col] if taxon in pivot_df.columns]
+    values = pivot_df[stacked_taxa].to_numpy(dtype=float)
+    tops = np.cumsum(values, axis=1)
+    bottoms = tops - values
+    
+    # Every segment of the stack is a rectangle [x - 0.4, x + 0.4] x [bottom, top]
+    # (the geometry of ax.bar). All segments of a taxon go into one PolyCollection,
+    # so the number of artists no longer grows with samples x taxa.
+    x = np.arange(len(pivot_df))
+    left, right = x - 0.4, x + 0.4
+    handles = []
+    for i, taxon in enumerate(stacked_taxa):
+        bottom, top = bottoms[:, i], tops[:, i]
+        segments = np.stack([np.column_stack([left, bottom]), np.column_stack([left, top]),
+                             np.column_stack([right, top]), np.column_stack([right, bottom])], axis=1)
+        color = taxon_to_color.get(taxon)
+        collection = PolyCollection(segments, facecolors=color, edgecolors="none", linewidths=0)
+        # Bars start on the x axis without a bottom margin, as with ax.bar
+        collection.sticky_edges.y.append(0)
+        collection.set_rasterized(rasterize)
+        ax.add_collection(collection)
+        handles.append(Patch(facecolor=color, label=taxon))
+    ax.autoscale_view()
+    
+    ax.set_xticks(x)
+    ax.set_xticklabels(pivot_df.index)
     ax.set_title(plot_title, fontsize=18, fontweight="bold", loc="center")
     ax.set_xlabel(selected_metadata)
     ax.set_ylabel("Relative Abundance (%)")
-    plt.xticks(rotation=axis_x_angle, ha=axis_x_ha, fontsize=12)
+    for tick_label in ax.get_xticklabels():
+        tick_label.set_rotation(axis_x_angle)
+        tick_label.set_horizontalalignment(axis_x_ha)
+        tick_label.set_fontsize(12)
     # Reverse legend order so that it matches the stacking order
-    handles, labels = ax.get_legend_handles_labels()
-    ax.legend(handles[::-1], labels[::-1], title=legend_title, fontsize=12, title_fontsize=14,
-              loc="center left", bbox_to_anchor=(1, 0.5))
-    plt.tight_layout(rect=[0, 0, 0.85, 1])
+    ax.legend(handles[::-1], [h.get_label() for h in handles[::-1]], title=legend_title, fontsize=12,
+              title_fontsize=14, loc="center left", bbox_to_anchor=(1, 0.5))
+    fig.tight_layout(rect=[0, 0, 0.85, 1])
 
 
     # Determine dynamic plot dimensions based on the shape of df_clean6
@@ -997,9 +1659,199 @@ def ezviz(microbiome_data, metadata, level, selected_metadata, top_taxa=None, th
     else:
         plot_height = 15
     #print("Calculated plot width:", plot_width, "and height:", plot_height)
+    if max_size is not None:
+        plot_width = min(plot_width, max_size[0])
+        plot_height = min(plot_height, max_size[1])
     
     fig.set_size_inches(plot_width, plot_height)
     
+    # Save the plot with the requested DPI and the calculated dimensions
+    fig.savefig(output_plot_filename, dpi=dpi, bbox_inches="tight")
+
+
+def _read_viz_metadata(metadata):
+    # Metadata for ezviz/ezsummary, read with its own dtypes (a DataFrame is used as
+    # is) so that categorical columns can be told apart; None for an unknown format
+    if isinstance(metadata, pd.DataFrame):
+        return metadata
+    metadata_ext = os.path.splitext(metadata)[1].lower().lstrip('.')
+    if metadata_ext == 'txt':
+        return pd.read_csv(metadata, sep="\t", header=0)
+    if metadata_ext == 'csv':
+        return pd.read_csv(metadata, header=0)
+    if metadata_ext in ['xls', 'xlsx']:
+        return pd.read_excel(metadata, header=0, engine='openpyxl')
+    if metadata_ext in _COLUMNAR_EXTS:
+        return _read_columnar(metadata, metadata_ext)
+    return None
+
+
+def ezviz(microbiome_data, metadata, level, selected_metadata, top_taxa=None, threshold=None, sparse=False, chunksize=None,
+          format="xlsx", cache=None, output_dir=None, plot_format=None, dpi=None, rasterize=False, preview=False,
+          profile=None, compact=False, memmap=None, workers=None):
+    # microbiome_data is either a raw microbiome file (cleaned here through ezclean)
+    # or what ezclean already returned: a cleaned DataFrame, a dict of them from a
+    # multi-level call, or a mbX_cleaned_* file. metadata is a file or a DataFrame.
+    # Passing an ezclean result skips the whole cleaning pipeline.
+    #
+    # selected_metadata may also be a list of columns: their group means come from
+    # one pass over the cleaned table, every column gets its own data file and plot
+    # (named with the column at the end) and a dict {column: plot file} is returned.
+    # Likewise top_taxa or threshold may be a list (e.g. top_taxa=[5, 10, 20, 50]):
+    # the taxa are ranked once and a plot is made per value, named _top<k> or
+    # _threshold<t>; the dict is then keyed by value, or by (column, value).
+    #
+    # The plot is a 1200 dpi PDF unless plot_format ("pdf", "png", "svg") or dpi
+    # say otherwise; rasterize=True draws the bars of a PDF/SVG as an image.
+    # preview=True makes a small 72 dpi PNG instead (explicit settings still win).
+    # profile: see ezclean; ezviz adds its own stages and those of the ezclean run.
+    # compact, memmap: see ezclean; they apply to the cleaning of a raw microbiome file.
+    # workers: see ezclean; the group means are sharded by taxa columns as well.
+    profile = _profiling.resolve_profile(profile)
+    
+    # Check the requested output format
+    if format not in _OUTPUT_EXTS:
+        return "The output format should be one of the following: xlsx, parquet, feather."
+    
+    # Resolve the plot settings
+    max_size = None
+    if preview:
+        plot_format = plot_format or _PREVIEW_PLOT["plot_format"]
+        dpi = dpi or _PREVIEW_PLOT["dpi"]
+        max_size = _PREVIEW_PLOT["max_size"]
+    plot_format = (plot_format or "pdf").lower()
+    dpi = dpi or 1200
+    if plot_format not in _PLOT_FORMATS:
+        return "The plot format should be one of the following: pdf, png, svg."
+    if not isinstance(dpi, (int, float)) or dpi <= 0:
+        return "The dpi should be a positive number."
+    
+    # Check the file extension for microbiome_data (raw microbiome files only)
+    cleaned_input = _is_cleaned_input(microbiome_data, metadata)
+    if not cleaned_input:
+        microbiome_ext = os.path.splitext(microbiome_data)[1].lower().lstrip('.')
+        if microbiome_ext not in ['csv', 'xls', 'xlsx'] + _COLUMNAR_EXTS + _BIOM_EXTS:
+            return ("The file is not csv, xls, xlsx, parquet, feather, arrow, or biom format. "
+                    "Please check the file type for microbiome data.")
+    
+    # Check the file extension for metadata
+    with _profiling.stage(profile, "ezviz.read_metadata"):
+        metadata_df = _read_viz_metadata(metadata)
+        if metadata_df is None:
+            return "Please check the file format of metadata."
+    
+    # Check the first header of metadata
+    valid_headers = ["id", "sampleid", "sample id", "sample-id", 
+                     "featureid", "feature id", "feature-id"]
+    first_header = metadata_df.columns[0].strip().lower()
+    if first_header not in valid_headers:
+        return "Please check the first header of the metadata for file format correction."
+    
+    # Check if the selected_metadata is a valid categorical column in metadata_df.
+    # We consider categorical columns as those with dtype 'object' (strings) or 'category'
+    selected_columns = [selected_metadata] if isinstance(selected_metadata, str) else list(selected_metadata)
+    for column in selected_columns:
+        if (column not in metadata_df.columns or
+            not (ptypes.is_categorical_dtype(metadata_df[column]) or
+                 ptypes.is_object_dtype(metadata_df[column]))):
+            return "The selected metadata is either not in the metadata or not a categorical value"
+    
+    # Get the corresponding level code (see _LEVEL_CODES)
+    level_code = _level_code(level)
+    if level_code is None:
+        return "Invalid taxonomic level provided."
+    
+    # Ensure that only one of top_taxa or threshold is provided
+    if top_taxa is not None and threshold is not None:
+        return "Only one of the parameter can be selected between top_taxa and threshold"
+    
+    # Determine the threshold value based on the provided parameter
+    if threshold is not None:
+        threshold_value = threshold
+    elif top_taxa is not None:
+        threshold_value = top_taxa
+    else:
+        threshold_value = None
+    # A list of top_taxa or threshold values makes one plot per value
+    sweep_values = threshold_value if isinstance(threshold_value, (list, tuple)) else [threshold_value]
+    
+    def sweep_params(value):
+        # top_taxa/threshold of a single ezviz call for one value of the sweep
+        if threshold is not None:
+            return {"top_taxa": None, "threshold": value}
+        return {"top_taxa": value, "threshold": None}
+    
+    # With cache set, the visualization table for identical inputs and settings is
+    # taken from the cache instead of re-running the cleaning and summary steps.
+    # Each selected metadata column and top_taxa/threshold value has its own entry.
+    jobs = [(column, value) for column in selected_columns for value in sweep_values]
+    result_cache = _cache.resolve_cache(cache)
+    final_dfs = {}
+    cache_keys = {}
+    if result_cache is not None:
+        for column, value in jobs:
+            cache_keys[(column, value)] = _cache.make_key(
+                "ezviz", [microbiome_data, metadata], level=level_code, selected_metadata=column,
+                sparse=sparse, compact=compact, **sweep_params(value)
+            )
+            final_df = result_cache.get(cache_keys[(column, value)])
+            if final_df is not None:
+                final_dfs[(column, value)] = final_df
+    missing_columns = list(dict.fromkeys(column for column, value in jobs if (column, value) not in final_dfs))
+    if missing_columns:
+        with _profiling.stage(profile, "ezviz.clean"):
+            if cleaned_input:
+                ##### Use the ezclean result that was passed in #####
+                cleaned_data = _cleaned_for_level(microbiome_data, level_code)
+                if cleaned_data is None:
+                    return "The cleaned data does not contain the requested taxonomic level."
+            elif sparse:
+                ##### Sparse backend: clean in memory; the cleaned table never becomes dense #####
+                cleaned_data = ezclean(microbiome_data, metadata, level, save=False, sparse=True, chunksize=chunksize,
+                                       cache=cache, profile=profile, compact=compact, memmap=memmap,
+                                       workers=workers)
+            else:
+                ##### Run ezclean in memory and save its cleaned table as before #####
+                # The table is used as it is, never read back from the file, so runs
+                # sharing a directory cannot pick up each other's (or a partial) file
+                cleaned_data = ezclean(microbiome_data, metadata, level, save=False, chunksize=chunksize,
+                                       cache=cache, profile=profile, compact=compact, memmap=memmap,
+                                       workers=workers)
+                if not isinstance(cleaned_data, str):
+                    cleaned_file_ezviz = _output_path(output_dir, _output_name(_CLEANED_NAMES[level_code], format))
+                    with _profiling.stage(profile, "ezclean.write") as st:
+                        _write_output(st.output(cleaned_data), cleaned_file_ezviz, format)
+                    print("ezclean returned:", cleaned_file_ezviz)
+            if isinstance(cleaned_data, str):
+                return cleaned_data
+        
+        # The group means of every selected column come from one pass over the taxa
+        with _profiling.stage(profile, "ezviz.group_means"):
+            for column in missing_columns:
+                if column not in cleaned_data.columns:
+                    raise Exception(f"The selected metadata column '{column}' was not found in the cleaned data.")
+            summaries = _group_summaries(cleaned_data, metadata_df, missing_columns, workers=workers)
+        
+        for column in missing_columns:
+            values = [value for value in sweep_values if (column, value) not in final_dfs]
+            tables = _ezviz_data(summaries[column], column, level_code, values if top_taxa is not None else None,
+                                 values if threshold is not None else None, profile=profile)
+            for value in values:
+                final_dfs[(column, value)] = tables[value]
+                if result_cache is not None:
+                    result_cache.put(cache_keys[(column, value)], tables[value])
+    
+    # Define a mapping for visualization data file names based on level_code
+    vizDataNames = {
+        "d__": "mbX_vizualization_data_domains.xlsx",
+        "p__": "mbX_vizualization_data_phyla.xlsx",
+        "c__": "mbX_vizualization_data_classes.xlsx",
+        "o__": "mbX_vizualization_data_orders.xlsx",
+        "f__": "mbX_vizualization_data_families.xlsx",
+        "g__": "mbX_vizualization_data_genera.xlsx",
+        "s__": "mbX_vizualization_data_species.xlsx"
+    }
+    
     # Define output filename dynamically based on level_code
     final_names_viz = {
         "d__": "mbX_viz_domains_or_kingdom",
@@ -1010,25 +1862,174 @@ def ezviz(microbiome_data, metadata, level, selected_metadata, top_taxa=None, th
         "g__": "mbX_viz_genera",
         "s__": "mbX_viz_species"
     }
-    output_plot_filename = final_names_viz.get(level_code, "mbX_viz") + ".pdf"
     
-    # Save the plot with high DPI and the calculated dimensions
-    plt.savefig(output_plot_filename, dpi=1200, bbox_inches="tight")
-    plt.close(fig)
+    column_sweep = not isinstance(selected_metadata, str)
+    value_sweep = isinstance(threshold_value, (list, tuple))
+    output_plot_filenames = {}
+    for column, value in jobs:
+        # With several selected columns or top_taxa/threshold values, every output
+        # name ends in its column and value
+        suffix = ""
+        if column_sweep:
+            suffix += "_" + re.sub(r"[^\w.-]+", "_", str(column))
+        if value_sweep:
+            suffix += ("_top%s" % value) if threshold is None else ("_threshold%s" % value)
+        
+        # Determine the output file name based on level_code
+        data_name = _output_name(vizDataNames.get(level_code), format)
+        outputVizFile = _output_path(output_dir, os.path.splitext(data_name)[0] + suffix + _OUTPUT_EXTS[format])
+        
+        with _profiling.stage(profile, "ezviz.write_data") as st:
+            # Write the final data frame to the dynamic file name without row names;
+            # the plot is drawn from the table in memory
+            df_clean6 = st.output(final_dfs[(column, value)])
+            _write_output(df_clean6, outputVizFile, format)
+        
+        output_plot_filename = _output_path(output_dir, final_names_viz.get(level_code, "mbX_viz") + suffix +
+                                            "." + plot_format)
+        
+        with _profiling.stage(profile, "ezviz.render"), _replace_output(output_plot_filename) as tmp_name:
+            _render_plot(df_clean6, level_code, column, tmp_name, dpi=dpi, rasterize=rasterize, max_size=max_size)
+        if column_sweep and value_sweep:
+            output_plot_filenames[(column, value)] = output_plot_filename
+        else:
+            output_plot_filenames[column if column_sweep else value] = output_plot_filename
     #print(f"Output plot '{output_plot_filename}' has been created.")
     
-    # Delete temporary cleaning files before closing the function
-    temp_files = ["mbX_cleaning_1.xlsx", "mbX_cleaning_2.xlsx", 
-                  "mbX_cleaning_3.xlsx", "mbX_cleaning_4.xlsx", 
-                  "mbX_cleaning_5.xlsx"]
-    for file in temp_files:
-        if os.path.exists(file):
-            os.remove(file)
-            #print("Deleted file:", file)
-        # else:
-            #print("File not found (already deleted or never created):", file)
-    
     print("Done with the visualization, cite us!")
+    if not column_sweep and not value_sweep:
+        return output_plot_filename
+    return output_plot_filenames
+
+
+def ezsummary(microbiome_data, metadata, level, selected_metadata, stats=None, save=True, sparse=False,
+              chunksize=None, format="xlsx", cache=None, output_dir=None, profile=None, compact=False, memmap=None,
+              workers=None):
+    # Group statistics of the taxa at one level for one or several categorical
+    # metadata columns, e.g. ezsummary(..., "g", ["Treatment", "Timepoint", "Site"]).
+    # stats is any of "mean", "count", "median" and "std" (all by default). All the
+    # columns share one pass over the cleaned table, so summarizing three columns
+    # costs about the same as one. microbiome_data is a raw microbiome file or an
+    # ezclean result, as for ezviz.
+    #
+    # Returns a long table with the columns metadata, group, <level name> and one
+    # per statistic, or with save=True the mbX_summary_<level>.xlsx file holding it.
+    # workers: see ezclean; the statistics are sharded by taxa columns as well.
+    profile = _profiling.resolve_profile(profile)
+    
+    if format not in _OUTPUT_EXTS:
+        return "The output format should be one of the following: xlsx, parquet, feather."
+    stats = list(stats or _SUMMARY_STATS)
+    if not stats or any(stat not in _SUMMARY_STATS for stat in stats):
+        return "The stats should be one or more of the following: " + ", ".join(_SUMMARY_STATS) + "."
+    level_code = _level_code(level)
+    if level_code is None:
+        return "Invalid taxonomic level provided."
+    
+    with _profiling.stage(profile, "ezsummary.read_metadata"):
+        metadata_df = _read_viz_metadata(metadata)
+        if metadata_df is None:
+            return "Please check the file format of metadata."
+    
+    with _profiling.stage(profile, "ezsummary.clean"):
+        if _is_cleaned_input(microbiome_data, metadata_df):
+            cleaned_data = _cleaned_for_level(microbiome_data, level_code)
+            if cleaned_data is None:
+                return "The cleaned data does not contain the requested taxonomic level."
+        else:
+            cleaned_data = ezclean(microbiome_data, metadata, level, save=False, sparse=sparse, chunksize=chunksize,
+                                   cache=cache, profile=profile, compact=compact, memmap=memmap, workers=workers)
+            if isinstance(cleaned_data, str):
+                return cleaned_data
+    
+    selected_columns = [selected_metadata] if isinstance(selected_metadata, str) else list(selected_metadata)
+    for column in selected_columns:
+        if column not in metadata_df.columns or column not in cleaned_data.columns:
+            return "The selected metadata is not in the metadata: " + str(column)
+    
+    with _profiling.stage(profile, "ezsummary.group_stats") as st:
+        summaries = _group_summaries(cleaned_data, metadata_df, selected_columns, stats=stats, workers=workers)
+        summary_df = st.output(_summary_frame(summaries, level_code))
+    
+    if not save:
+        return summary_df
+    summary_file = _output_path(output_dir, _output_name("mbX_summary_" + _LEVEL_MAPPING[level_code] + ".xlsx",
+                                                         format))
+    with _profiling.stage(profile, "ezsummary.write") as st:
+        _write_output(st.output(summary_df), summary_file, format)
+    return summary_file
+
+
+def _viz_job_dir(level, selected_metadata, top_taxa, threshold):
+    # Sub-directory name of one ezviz_many combination, e.g. "g_Treatment_top10"
+    name = f"{level}_{selected_metadata}"
+    if top_taxa is not None:
+        name += f"_top{top_taxa}"
+    if threshold is not None:
+        name += f"_threshold{threshold}"
+    return re.sub(r"[^\w.-]+", "_", name)
+
+
+def ezviz_many(microbiome_data, metadata, combinations, max_workers=None, processes=False, sparse=False,
+               chunksize=None, format="xlsx", cache=None, output_dir=None, plot_format=None, dpi=None,
+               rasterize=False, preview=False, profile=None, compact=False, memmap=None, workers=None):
+    # Render many plots from one dataset in parallel. combinations is a list of
+    # (level, selected_metadata) or (level, selected_metadata, top_taxa) tuples, or
+    # of dicts with the keys level, selected_metadata, top_taxa and threshold.
+    #
+    # The microbiome data is cleaned once for all requested levels, then every
+    # combination runs ezviz on that result in a thread pool (processes=True uses
+    # a process pool instead). Each combination writes into its own sub-directory
+    # of output_dir, so file names never collide. Returns a dict mapping each
+    # combination tuple (level, selected_metadata, top_taxa, threshold) to the
+    # saved plot, or to the message ezviz returned for an invalid combination.
+    # A StageReport passed as profile collects the stages of every combination
+    # (thread pool only; it cannot be shared with worker processes).
+    # workers only shards the one ezclean; the plots are already spread over the pool.
+    import functools
+    import contextvars
+    from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+    
+    jobs = []
+    for combination in combinations:
+        if isinstance(combination, dict):
+            job = (combination["level"], combination["selected_metadata"],
+                   combination.get("top_taxa"), combination.get("threshold"))
+        else:
+            job = tuple(combination) + (None,) * (4 - len(combination))
+        jobs.append(job)
+    
+    # One ezclean for every valid level that is asked for; invalid ones get
+    # their message from ezviz below
+    if _is_cleaned_input(microbiome_data, metadata):
+        cleaned_data = microbiome_data
+    else:
+        levels = list(dict.fromkeys(job[0] for job in jobs if _level_code(job[0]) is not None))
+        cleaned_data = ezclean(microbiome_data, metadata, levels, save=False, sparse=sparse, chunksize=chunksize,
+                               cache=cache, profile=profile, compact=compact, memmap=memmap, workers=workers)
+        if isinstance(cleaned_data, str):
+            return cleaned_data
+    
+    executor_class = ProcessPoolExecutor if processes else ThreadPoolExecutor
+    results = {}
+    with executor_class(max_workers=max_workers) as executor:
+        futures = {}
+        for level, selected_metadata, top_taxa, threshold in jobs:
+            job_dir = os.path.join(output_dir or os.getcwd(),
+                                   _viz_job_dir(level, selected_metadata, top_taxa, threshold))
+            job = functools.partial(
+                ezviz, cleaned_data, metadata, level, selected_metadata, top_taxa=top_taxa, threshold=threshold,
+                format=format, cache=cache, output_dir=job_dir, plot_format=plot_format, dpi=dpi,
+                rasterize=rasterize, preview=preview, profile=None if processes else profile
+            )
+            # Threads run each job in a copy of this context, so a cancellation set by
+            # the async API (see profiling.cancel_event) reaches them too
+            futures[(level, selected_metadata, top_taxa, threshold)] = (
+                executor.submit(job) if processes else executor.submit(contextvars.copy_context().run, job)
+            )
+        for job, future in futures.items():
+            results[job] = future.result()
+    return results
     
     
 
@@ -20,14 +20,27 @@ setup(
     packages=find_packages(),  #
     classifiers=[
         "Programming Language :: Python :: 3",
+        "Programming Language :: Python :: 3 :: Only",
+        "Programming Language :: Python :: 3.9",
+        "Programming Language :: Python :: 3.10",
+        "Programming Language :: Python :: 3.11",
+        "Programming Language :: Python :: 3.12",
         "License :: OSI Approved :: MIT License",  
         "Operating System :: OS Independent",
     ],
-    python_requires='>=3.6',
+    python_requires='>=3.9',  #lazy module __getattr__ (3.7) and tracemalloc.reset_peak (3.9)
     install_requires=[
         "pandas",
         "openpyxl",
         "matplotlib",
         "numpy"
     ],
+    extras_require={
+        "sparse": ["scipy"],
+        "columnar": ["pyarrow"],
+        "biom": ["h5py", "scipy"],
+    },
+    entry_points={
+        "console_scripts": ["pymbx=pymbX.cli:main"],
+    },
 )
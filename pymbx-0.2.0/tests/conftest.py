@@ -0,0 +1,78 @@
+import os
+
+import pandas as pd
+import pytest
+
+# -------------------------------
+# Shared fixture data
+# -------------------------------
+# tests/data holds a small QIIME2-style microbiome table (12 samples, 50
+# features and a trailing Treatment column) with its metadata, and
+# tests/data/baseline the tables the original workbook-based pipeline wrote for
+# them. Every backend and mode of ezclean/ezviz has to give the same tables.
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data")
+MICROBIOME = os.path.join(DATA_DIR, "microbiome.csv")
+METADATA = os.path.join(DATA_DIR, "metadata.txt")
+
+LEVELS = ["d", "p", "c", "o", "f", "g", "s"]
+
+CLEANED_NAMES = {
+    "d": "mbX_cleaned_domains_or_kingdom",
+    "p": "mbX_cleaned_phylum",
+    "c": "mbX_cleaned_classes",
+    "o": "mbX_cleaned_orders",
+    "f": "mbX_cleaned_families",
+    "g": "mbX_cleaned_genera",
+    "s": "mbX_cleaned_species"
+}
+
+
+def read_baseline(name):
+    return pd.read_csv(os.path.join(DATA_DIR, "baseline", name + ".csv"), dtype={"sample-id": str})
+
+
+def cleaned_baseline(level):
+    # Baseline cleaned table of one level ("d" ... "s")
+    return read_baseline(CLEANED_NAMES[level])
+
+
+def assert_same_table(actual, expected, rtol=1e-9):
+    # Compare a cleaned table with its baseline. Sparse columns are made dense and
+    # every column is compared on its values; the baseline csv files hold the
+    # floats as text, so they are compared to rtol (use 1e-5 for float32 tables).
+    actual = actual.copy()
+    for col in actual.columns:
+        if isinstance(actual[col].dtype, pd.SparseDtype):
+            actual[col] = actual[col].sparse.to_dense()
+    assert list(actual.columns) == list(expected.columns)
+    for col in expected.columns:
+        if pd.api.types.is_numeric_dtype(expected[col]):
+            pd.testing.assert_series_equal(actual[col].astype("float64"), expected[col].astype("float64"),
+                                           check_exact=False, rtol=rtol, atol=rtol)
+        else:
+            assert [None if pd.isna(v) else str(v) for v in actual[col]] == \
+                   [None if pd.isna(v) else str(v) for v in expected[col]], col
+
+
+@pytest.fixture
+def microbiome():
+    return MICROBIOME
+
+
+@pytest.fixture
+def metadata():
+    return METADATA
+
+
+# (level, top_taxa/threshold, visualization data file, baseline) of the stored ezviz tables
+VIZ_CASES = [
+    ("g", {"top_taxa": 5}, "mbX_vizualization_data_genera", "mbX_vizualization_data_genera_top5"),
+    ("f", {"threshold": 3.0}, "mbX_vizualization_data_families", "mbX_vizualization_data_families_threshold3"),
+    ("s", {}, "mbX_vizualization_data_species", "mbX_vizualization_data_species"),
+]
+
+
+def viz_table(output_dir, data_name):
+    # The visualization data table ezviz wrote into output_dir
+    return pd.read_excel(os.path.join(output_dir, data_name + ".xlsx"))
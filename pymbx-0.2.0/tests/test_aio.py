@@ -0,0 +1,151 @@
+import asyncio
+import os
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+import pytest
+
+from pymbX import StageCancelled, ezclean_async, ezsummary_async, ezviz_async, ezviz_many_async
+
+from conftest import assert_same_table, cleaned_baseline, read_baseline, viz_table
+
+# -------------------------------
+# asyncio API
+# -------------------------------
+# The coroutines are driven with asyncio.run; the temporary mbX_async_*
+# directories are created under tmp_path so the tests can see which remain.
+
+
+@pytest.fixture
+def temp_root(tmp_path, monkeypatch):
+    root = tmp_path / "temp"
+    root.mkdir()
+    monkeypatch.setattr(tempfile, "tempdir", str(root))
+    return root
+
+
+def _run_dirs(temp_root):
+    return sorted(name for name in os.listdir(temp_root) if name.startswith("mbX_async_"))
+
+
+def _slow_stages(stages):
+    # A profile callback that records the finished stages and makes each take a while
+    def slow(record):
+        stages.append(record["stage"])
+        time.sleep(0.1)
+    return slow
+
+
+def test_ezclean_async_matches_baseline(microbiome, metadata, temp_root):
+    cleaned = asyncio.run(ezclean_async(microbiome, metadata, ["g", "f"], save=False))
+    assert_same_table(cleaned["g"], cleaned_baseline("g"))
+    assert_same_table(cleaned["f"], cleaned_baseline("f"))
+    # Nothing is written without save, so no directory is made
+    assert _run_dirs(temp_root) == []
+
+
+def test_ezviz_async_writes_into_its_own_directory(microbiome, metadata, temp_root):
+    async def two_plots():
+        return await asyncio.gather(
+            ezviz_async(microbiome, metadata, "g", "Treatment", top_taxa=5, plot_format="png", dpi=20),
+            ezviz_async(microbiome, metadata, "g", "Treatment", top_taxa=5, plot_format="png", dpi=20),
+        )
+
+    plots = asyncio.run(two_plots())
+    dirs = [os.path.dirname(plot) for plot in plots]
+    assert dirs[0] != dirs[1] and sorted(os.path.basename(d) for d in dirs) == _run_dirs(temp_root)
+    for directory in dirs:
+        pd.testing.assert_frame_equal(viz_table(directory, "mbX_vizualization_data_genera"),
+                                      read_baseline("mbX_vizualization_data_genera_top5"))
+    assert not os.path.exists(os.path.join(os.getcwd(), "mbX_viz_genera.png"))
+
+
+def test_output_dir_is_respected(microbiome, metadata, temp_root, tmp_path):
+    out = tmp_path / "out"
+    path = asyncio.run(ezclean_async(microbiome, metadata, "p", output_dir=str(out)))
+    assert os.path.dirname(path) == str(out)
+    summary = asyncio.run(ezsummary_async(microbiome, metadata, "p", "Treatment", output_dir=str(out)))
+    assert os.path.dirname(summary) == str(out)
+    assert _run_dirs(temp_root) == []
+
+
+def test_ezsummary_and_ezviz_many_async(microbiome, metadata, temp_root):
+    summary = asyncio.run(ezsummary_async(microbiome, metadata, "g", "Treatment", save=False, stats=["mean"]))
+    assert list(summary.columns) == ["metadata", "group", "genus", "mean"]
+    plots = asyncio.run(ezviz_many_async(microbiome, metadata, [("g", "Treatment", 5)], plot_format="png", dpi=20,
+                                         max_workers=1))
+    (plot,) = plots.values()
+    assert os.path.exists(plot) and plot.startswith(str(temp_root / _run_dirs(temp_root)[0]))
+
+
+def test_returned_message_leaves_no_directory(microbiome, metadata, temp_root):
+    message = asyncio.run(ezviz_async(microbiome, metadata, "g", "Color", plot_format="png"))
+    assert isinstance(message, str)
+    assert _run_dirs(temp_root) == []
+
+
+def test_timeout_stops_the_run_and_removes_its_directory(microbiome, metadata, temp_root):
+    stages = []
+    with ThreadPoolExecutor(1) as pool:
+        with pytest.raises(asyncio.TimeoutError):
+            asyncio.run(ezviz_async(microbiome, metadata, "g", "Treatment", plot_format="png", dpi=20,
+                                    executor=pool, timeout=0.2, profile=_slow_stages(stages)))
+    # The worker has stopped: the run was cut short and its directory is gone
+    assert stages and "ezviz.render" not in stages
+    assert _run_dirs(temp_root) == []
+
+
+def test_cancel_stops_the_run_and_removes_its_directory(microbiome, metadata, temp_root):
+    stages = []
+
+    async def cancel_soon(pool):
+        task = asyncio.ensure_future(ezviz_async(microbiome, metadata, "g", "Treatment", plot_format="png", dpi=20,
+                                                 executor=pool, profile=_slow_stages(stages)))
+        await asyncio.sleep(0.25)
+        task.cancel()
+        await task
+
+    with ThreadPoolExecutor(1) as pool:
+        with pytest.raises(asyncio.CancelledError):
+            asyncio.run(cancel_soon(pool))
+    assert stages and "ezviz.render" not in stages
+    assert _run_dirs(temp_root) == []
+
+
+def test_failure_removes_the_directory(microbiome, metadata, temp_root):
+    def fail_after_write(record):
+        if record["stage"] == "ezviz.render":
+            raise RuntimeError("render failed")
+
+    with pytest.raises(RuntimeError, match="render failed"):
+        asyncio.run(ezviz_async(microbiome, metadata, "g", "Treatment", plot_format="png", dpi=20,
+                                profile=fail_after_write))
+    assert _run_dirs(temp_root) == []
+
+
+def test_cancelled_before_start_never_runs(microbiome, metadata, temp_root):
+    # A run given up while it still waits for a worker never starts
+    async def queued(pool):
+        blocker = asyncio.get_running_loop().run_in_executor(pool, time.sleep, 0.3)
+        task = asyncio.ensure_future(ezclean_async(microbiome, metadata, "g", executor=pool))
+        await asyncio.sleep(0.05)
+        task.cancel()
+        await blocker
+        return task
+
+    with ThreadPoolExecutor(1) as pool:
+        task = asyncio.run(queued(pool))
+    assert task.cancelled()
+    assert _run_dirs(temp_root) == []
+
+
+def test_stage_cancelled_inside_the_run_propagates(microbiome, metadata, temp_root):
+    # A run cancelled from inside (here by a stage callback) fails like any other
+    def cancel(record):
+        raise StageCancelled("stopped")
+
+    with pytest.raises(StageCancelled):
+        asyncio.run(ezclean_async(microbiome, metadata, "g", profile=cancel))
+    assert _run_dirs(temp_root) == []
@@ -0,0 +1,115 @@
+import pandas as pd
+import pytest
+
+from pymbX import ezclean
+from pymbX.pymbX import _UNIDENTIFIED_ATTR
+
+from conftest import MICROBIOME, assert_same_table, cleaned_baseline
+
+# -------------------------------
+# append_to: a new batch of samples appended to an earlier cleaned table
+# -------------------------------
+
+
+def _split_batches(tmp_path, features=50):
+    # The fixture samples in two csv batches; with features < 50 each batch only
+    # has some of the features (the first batch the first `features`, the second
+    # the last), and full.csv is the whole table with the counts a batch lacks set
+    # to 0, i.e. what one run over all samples sees
+    table = pd.read_csv(MICROBIOME)
+    lineages = list(table.columns[1:-1])
+    first, second = table.iloc[:6].copy(), table.iloc[6:].copy()
+    first_cols, second_cols = lineages[:features], lineages[len(lineages) - features:]
+    full = table.copy()
+    full.loc[first.index, [c for c in lineages if c not in first_cols]] = 0
+    full.loc[second.index, [c for c in lineages if c not in second_cols]] = 0
+    paths = []
+    for name, df, cols in [("full", full, lineages), ("first", first, first_cols), ("second", second, second_cols)]:
+        df[[table.columns[0]] + cols + [table.columns[-1]]].to_csv(tmp_path / (name + ".csv"), index=False)
+        paths.append(str(tmp_path / (name + ".csv")))
+    return paths
+
+
+@pytest.mark.parametrize("level", ["g", "s", "p"])
+def test_append_matches_one_run(level, metadata, tmp_path):
+    _, first, second = _split_batches(tmp_path)
+    earlier = ezclean(first, metadata, level, save=False)
+    appended = ezclean(second, metadata, level, save=False, append_to=earlier)
+    assert_same_table(appended, cleaned_baseline(level))
+
+
+@pytest.mark.parametrize("level", ["g", "s", "o"])
+def test_append_batch_with_other_features_matches_one_run(level, metadata, tmp_path):
+    # The unidentified_* names of the second batch are numbered on its own rows;
+    # they must be matched to the earlier table by lineage rather than by number
+    full, first, second = _split_batches(tmp_path, features=35)
+    earlier = ezclean(first, metadata, level, save=False)
+    appended = ezclean(second, metadata, level, save=False, append_to=earlier)
+    one_run = ezclean(full, metadata, level, save=False)
+    assert len(appended.columns) == len(one_run.columns)
+    assert_same_table(appended, one_run)
+    assert appended.attrs[_UNIDENTIFIED_ATTR] == one_run.attrs[_UNIDENTIFIED_ATTR]
+
+
+def test_same_lineage_keeps_its_earlier_name(metadata, tmp_path):
+    _, first, second = _split_batches(tmp_path, features=35)
+    earlier = ezclean(first, metadata, "s", save=False)
+    batch = ezclean(second, metadata, "s", save=False)
+    appended = ezclean(second, metadata, "s", save=False, append_to=earlier)
+    earlier_names = {lineage: name for name, lineage in earlier.attrs[_UNIDENTIFIED_ATTR].items()}
+    batch_record = batch.attrs[_UNIDENTIFIED_ATTR]
+    shared = [name for name, lineage in batch_record.items() if lineage in earlier_names]
+    assert shared and any(earlier_names[batch_record[name]] != name for name in shared)
+    for name in shared:
+        renamed = earlier_names[batch_record[name]]
+        assert appended[renamed].iloc[6:].tolist() == pytest.approx(batch[name].tolist(), nan_ok=True)
+
+
+@pytest.mark.parametrize("format", ["xlsx", "parquet", "feather"])
+def test_append_to_saved_table(format, metadata, tmp_path):
+    if format != "xlsx":
+        pytest.importorskip("pyarrow")
+    full, first, second = _split_batches(tmp_path, features=35)
+    saved = ezclean(first, metadata, "g", format=format, output_dir=str(tmp_path / "out"))
+    appended = ezclean(second, metadata, "g", save=False, append_to=saved)
+    assert_same_table(appended, ezclean(full, metadata, "g", save=False))
+    # The appended table can itself be saved and appended to again
+    resaved = ezclean(second, metadata, "g", format=format, output_dir=str(tmp_path / "again"), append_to=saved)
+    again = ezclean(second, metadata, "g", save=False, append_to=resaved)
+    assert list(again.columns) == list(appended.columns)
+
+
+def test_append_sparse_stays_sparse(metadata, tmp_path):
+    pytest.importorskip("scipy")
+    full, first, second = _split_batches(tmp_path, features=35)
+    earlier = ezclean(first, metadata, "g", save=False, sparse=True)
+    appended = ezclean(second, metadata, "g", save=False, sparse=True, append_to=earlier)
+    assert all(isinstance(appended[col].dtype, pd.SparseDtype) for col in appended.columns[1:-3])
+    assert_same_table(appended, ezclean(full, metadata, "g", save=False))
+
+
+def test_append_several_levels(metadata, tmp_path):
+    full, first, second = _split_batches(tmp_path, features=35)
+    earlier = ezclean(first, metadata, ["g", "f"], save=False)
+    appended = ezclean(second, metadata, ["g", "f"], save=False, append_to=earlier)
+    one_run = ezclean(full, metadata, ["g", "f"], save=False)
+    for level in ["g", "f"]:
+        assert_same_table(appended[level], one_run[level])
+    assert ezclean(second, metadata, ["g", "f"], save=False, append_to=earlier["g"]) == \
+        "To append several levels, pass the dict of cleaned tables a multi-level ezclean returned."
+
+
+def test_append_with_other_metadata_columns_raises(metadata, tmp_path):
+    _, first, second = _split_batches(tmp_path)
+    earlier = ezclean(first, metadata, "g", save=False).drop(columns=["Site"])
+    with pytest.raises(ValueError, match="metadata columns"):
+        ezclean(second, metadata, "g", save=False, append_to=earlier)
+
+
+def test_append_to_table_without_record_raises(metadata, tmp_path):
+    # A table written by other means (here csv) cannot tell which lineages its
+    # unidentified_* columns stand for
+    _, first, second = _split_batches(tmp_path, features=35)
+    ezclean(first, metadata, "g", save=False).to_csv(tmp_path / "mbX_cleaned_genera.csv", index=False)
+    with pytest.raises(ValueError, match="no record of their lineages"):
+        ezclean(second, metadata, "g", save=False, append_to=str(tmp_path / "mbX_cleaned_genera.csv"))
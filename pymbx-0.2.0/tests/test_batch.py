@@ -0,0 +1,55 @@
+import os
+
+import pandas as pd
+
+from pymbX import run_batch
+
+from conftest import CLEANED_NAMES, assert_same_table, cleaned_baseline, read_baseline, viz_table
+
+# -------------------------------
+# run_batch: many datasets on a process pool
+# -------------------------------
+
+
+def test_batch_reports_every_job_in_manifest_order(microbiome, metadata, tmp_path):
+    manifest = [
+        {"microbiome_data": microbiome, "metadata": metadata, "level": "g"},
+        {"microbiome_data": str(tmp_path / "missing.csv"), "metadata": metadata, "level": "g"},
+        {"microbiome_data": microbiome, "metadata": metadata, "level": "g,f", "selected_metadata": "Treatment",
+         "top_taxa": 5, "plot_format": "png", "dpi": 20},
+        {"microbiome_data": microbiome, "metadata": metadata, "level": "x"},
+    ]
+    report = run_batch(manifest, max_workers=2, output_root=str(tmp_path / "runs"))
+    assert list(report["job"]) == [0, 1, 2, 3]
+    assert list(report["status"]) == ["ok", "failed", "ok", "failed"]
+    
+    assert report.loc[0, "result"] == os.path.join(str(tmp_path / "runs" / "0"), CLEANED_NAMES["g"] + ".xlsx")
+    assert_same_table(pd.read_excel(report.loc[0, "result"], dtype={"sample-id": str}), cleaned_baseline("g"))
+    # A missing file fails with its exception, an invalid level with ezclean's message
+    assert "FileNotFoundError" in report.loc[1, "error"]
+    assert report.loc[3, "error"].startswith("The level value should be one of the following")
+    
+    plots = report.loc[2, "result"]
+    assert sorted(plots) == ["f", "g"] and all(os.path.exists(p) for p in plots.values())
+    pd.testing.assert_frame_equal(viz_table(tmp_path / "runs" / "2", "mbX_vizualization_data_genera"),
+                                  read_baseline("mbX_vizualization_data_genera_top5"))
+    assert (report["seconds"] >= 0).all()
+
+
+def test_manifest_file_with_empty_cells(microbiome, metadata, tmp_path):
+    manifest = pd.DataFrame({
+        "microbiome_data": [microbiome, microbiome],
+        "metadata": [metadata, metadata],
+        "level": ["p", "f"],
+        "selected_metadata": [None, "Treatment"],
+        "threshold": [None, 3.0],
+        "plot_format": [None, "png"],
+        "dpi": [None, 20],
+        "output_dir": [str(tmp_path / "clean"), str(tmp_path / "viz")]
+    })
+    manifest.to_csv(tmp_path / "manifest.csv", index=False)
+    report = run_batch(str(tmp_path / "manifest.csv"), max_workers=2)
+    assert list(report["status"]) == ["ok", "ok"], list(report["error"])
+    assert os.path.exists(tmp_path / "clean" / (CLEANED_NAMES["p"] + ".xlsx"))
+    pd.testing.assert_frame_equal(viz_table(tmp_path / "viz", "mbX_vizualization_data_families"),
+                                  read_baseline("mbX_vizualization_data_families_threshold3"))
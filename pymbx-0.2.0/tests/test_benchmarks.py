@@ -0,0 +1,59 @@
+import os
+import sys
+
+import pandas as pd
+
+from pymbX import ezclean
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "benchmarks"))
+
+import run_benchmarks  # noqa: E402
+from synthetic import make_feature_table, write_feature_table  # noqa: E402
+
+# -------------------------------
+# Synthetic tables and the benchmark runner
+# -------------------------------
+
+
+def test_synthetic_table_shape_and_lineages():
+    microbiome_df, metadata_df = make_feature_table(n_features=200, n_samples=30, sparsity=0.8, seed=1)
+    assert microbiome_df.shape == (30, 1 + 200 + 1)
+    assert list(microbiome_df.columns[[0, -1]]) == ["index", "Treatment"]
+    lineages = list(microbiome_df.columns[1:-1])
+    assert len(set(lineages)) == 200 and all(lin.count(";") == 6 for lin in lineages)
+    counts = microbiome_df[lineages].to_numpy()
+    assert (counts >= 0).all() and 0.7 < (counts == 0).mean() < 0.9
+    assert list(metadata_df.columns) == ["sample-id", "Treatment", "Site", "Timepoint"]
+    assert list(metadata_df["sample-id"]) == list(microbiome_df["index"])
+
+
+def test_synthetic_tables_are_reproducible():
+    first, _ = make_feature_table(n_features=50, n_samples=5, seed=3)
+    second, _ = make_feature_table(n_features=50, n_samples=5, seed=3)
+    pd.testing.assert_frame_equal(first, second)
+
+
+def test_synthetic_files_clean(tmp_path):
+    microbiome_file, metadata_file = write_feature_table(str(tmp_path), n_features=100, n_samples=10, depth=5)
+    cleaned = ezclean(microbiome_file, metadata_file, "all", save=False)
+    totals = cleaned["domain"].iloc[:, 1:-3].sum(axis=1)
+    assert ((totals - 100).abs() < 1e-9).all()
+    assert cleaned["species"].shape[0] == 10
+
+
+def test_benchmark_run_reports_every_stage(tmp_path, capsys):
+    document = run_benchmarks.run(["small"], repeat=1, memory=False, data_dir=str(tmp_path),
+                                  generator={"n_features": 60, "n_samples": 8})
+    rows = pd.DataFrame(document["results"])
+    assert {"ezclean", "ezviz"} <= set(rows["pipeline"])
+    assert "total" in set(rows["stage"]) and "ezclean.aggregate" in set(rows["stage"])
+    assert (rows["wall_s"] >= 0).all()
+    run_benchmarks.compare(document, document)
+    assert "1.00x" in capsys.readouterr().out
+
+
+def test_workers_pipeline_only_runs_with_several_workers():
+    names = [name for name, _ in run_benchmarks._pipelines("m.csv", "meta.csv", "g", "Treatment", 10, ".", workers=2)]
+    assert "ezclean_workers" in names
+    names = [name for name, _ in run_benchmarks._pipelines("m.csv", "meta.csv", "g", "Treatment", 10, ".", workers=1)]
+    assert "ezclean_workers" not in names
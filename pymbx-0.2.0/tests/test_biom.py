@@ -0,0 +1,98 @@
+import json
+
+import pandas as pd
+import pytest
+
+from pymbX import ezclean, ezviz
+
+from conftest import MICROBIOME, VIZ_CASES, assert_same_table, cleaned_baseline, read_baseline, viz_table
+
+h5py = pytest.importorskip("h5py")
+sp = pytest.importorskip("scipy.sparse")
+
+# -------------------------------
+# BIOM 2.1 (HDF5) microbiome input
+# -------------------------------
+# The fixture table is written as a BIOM file the way QIIME2 exports one: the
+# counts as an observation-major (CSR) and a sample-major (CSC) matrix and the
+# lineages as "taxonomy" observation metadata.
+
+
+def _write_biom(path, taxonomy="ranks"):
+    # taxonomy: "ranks" (one row of ranks per observation), "json" (JSON encoded
+    # strings) or None (the lineages are the observation ids)
+    table = pd.read_csv(MICROBIOME)
+    lineages = list(table.columns[1:-1])
+    counts = table.iloc[:, 1:-1].to_numpy(dtype=float).T
+    csr, csc = sp.csr_matrix(counts), sp.csc_matrix(counts)
+    text = h5py.string_dtype()
+    with h5py.File(path, "w") as h5:
+        h5.attrs["format-version"] = [2, 1]
+        h5.create_dataset("observation/ids", data=lineages if taxonomy is None else
+                          ["F%d" % i for i in range(len(lineages))], dtype=text)
+        h5.create_dataset("sample/ids", data=table.iloc[:, 0].astype(str).tolist(), dtype=text)
+        for name, matrix in [("observation/matrix", csr), ("sample/matrix", csc)]:
+            h5.create_dataset(name + "/data", data=matrix.data)
+            h5.create_dataset(name + "/indices", data=matrix.indices)
+            h5.create_dataset(name + "/indptr", data=matrix.indptr)
+        if taxonomy == "ranks":
+            ranks = [lineage.split(";") for lineage in lineages]
+            width = max(len(row) for row in ranks)
+            h5.create_dataset("observation/metadata/taxonomy", data=[row + [""] * (width - len(row)) for row in ranks],
+                              dtype=text)
+        elif taxonomy == "json":
+            h5.create_dataset("observation/metadata/taxonomy", data=[json.dumps(x) for x in lineages], dtype=text)
+    return str(path)
+
+
+@pytest.mark.parametrize("taxonomy", ["ranks", "json", None])
+def test_biom_matches_baseline(taxonomy, metadata, tmp_path):
+    biom = _write_biom(tmp_path / "feature-table.biom", taxonomy)
+    cleaned = ezclean(biom, metadata, ["g", "s", "d"], save=False)
+    for level in ["g", "s", "d"]:
+        assert_same_table(cleaned[level], cleaned_baseline(level))
+
+
+@pytest.mark.parametrize("chunksize", [1, 5, 100])
+def test_biom_sample_chunks_match_baseline(chunksize, metadata, tmp_path):
+    biom = _write_biom(tmp_path / "feature-table.biom")
+    cleaned = ezclean(biom, metadata, ["g", "p"], save=False, chunksize=chunksize)
+    assert_same_table(cleaned["g"], cleaned_baseline("g"))
+    assert_same_table(cleaned["p"], cleaned_baseline("p"))
+
+
+def test_biom_sparse_output(metadata, tmp_path):
+    biom = _write_biom(tmp_path / "feature-table.biom")
+    cleaned = ezclean(biom, metadata, "f", save=False, sparse=True, chunksize=4)
+    assert all(isinstance(cleaned[col].dtype, pd.SparseDtype) for col in cleaned.columns[1:-3])
+    assert_same_table(cleaned, cleaned_baseline("f"))
+
+
+@pytest.mark.parametrize("level, kwargs, data_name, baseline_name", VIZ_CASES[:1])
+def test_biom_ezviz_matches_baseline(level, kwargs, data_name, baseline_name, metadata, tmp_path):
+    biom = _write_biom(tmp_path / "feature-table.biom")
+    ezviz(biom, metadata, level, "Treatment", output_dir=str(tmp_path), plot_format="png", dpi=20, **kwargs)
+    pd.testing.assert_frame_equal(viz_table(tmp_path, data_name), read_baseline(baseline_name))
+
+
+def test_biom_that_is_not_hdf5_is_reported(metadata, tmp_path):
+    path = tmp_path / "table.biom"
+    path.write_text(json.dumps({"format": "Biological Observation Matrix 1.0.0"}))
+    message = ezclean(str(path), metadata, "g", save=False)
+    assert isinstance(message, str) and message.startswith("The BIOM file is not in the HDF5 (BIOM 2.1) format.")
+
+
+def test_biom_counts_stay_sparse(metadata, tmp_path, monkeypatch):
+    # The observation matrix is never expanded into a dense feature table
+    biom = _write_biom(tmp_path / "feature-table.biom")
+    densified = []
+    original = sp.csr_matrix.toarray
+
+    def toarray(self, *args, **kwargs):
+        densified.append(self.shape)
+        return original(self, *args, **kwargs)
+
+    monkeypatch.setattr(sp.csr_matrix, "toarray", toarray)
+    cleaned = ezclean(biom, metadata, "g", save=False)
+    # Only the per-genus sums are made dense
+    assert densified == [(len(cleaned.columns) - 4, 12)]
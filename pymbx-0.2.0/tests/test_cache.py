@@ -0,0 +1,138 @@
+import os
+import time
+
+import pandas as pd
+
+from pymbX import ResultCache, StageReport, cache_info, clear_cache, ezclean, ezviz
+from pymbX.cache import MemoryCache, make_key
+
+from conftest import assert_same_table, cleaned_baseline
+
+# -------------------------------
+# Content-addressed result cache
+# -------------------------------
+
+
+def _stages(report):
+    return {row["stage"] for row in report.summary()}
+
+
+def test_second_call_is_served_from_the_cache(microbiome, metadata, tmp_path):
+    cache_dir = str(tmp_path / "cache")
+    first, second = StageReport(memory=False), StageReport(memory=False)
+    ezclean(microbiome, metadata, ["g", "f"], save=False, cache=cache_dir, profile=first)
+    cleaned = ezclean(microbiome, metadata, ["g", "f"], save=False, cache=cache_dir, profile=second)
+    assert "ezclean.aggregate" in _stages(first)
+    assert "ezclean.read_microbiome" not in _stages(second)
+    assert cache_info(cache_dir)["entries"] == 2
+    assert_same_table(cleaned["g"], cleaned_baseline("g"))
+    assert_same_table(cleaned["f"], cleaned_baseline("f"))
+
+
+def test_only_missing_levels_are_computed(microbiome, metadata, tmp_path):
+    cache_dir = str(tmp_path / "cache")
+    ezclean(microbiome, metadata, "g", save=False, cache=cache_dir)
+    report = StageReport(memory=False)
+    cleaned = ezclean(microbiome, metadata, ["g", "p"], save=False, cache=cache_dir, profile=report)
+    assert "ezclean.aggregate" in _stages(report)
+    assert cache_info(cache_dir)["entries"] == 2
+    assert_same_table(cleaned["p"], cleaned_baseline("p"))
+
+
+def test_changed_input_is_a_miss(microbiome, metadata, tmp_path):
+    cache_dir = str(tmp_path / "cache")
+    micro_copy = tmp_path / "micro.csv"
+    micro_df = pd.read_csv(microbiome)
+    micro_df.to_csv(micro_copy, index=False)
+    ezclean(str(micro_copy), metadata, "g", save=False, cache=cache_dir)
+    micro_df.iloc[0, 1] += 1000
+    micro_df.to_csv(micro_copy, index=False)
+    report = StageReport(memory=False)
+    cleaned = ezclean(str(micro_copy), metadata, "g", save=False, cache=cache_dir, profile=report)
+    assert "ezclean.aggregate" in _stages(report)
+    # The first sample now has 1000 more reads in its first feature
+    assert list(cleaned.iloc[0, 1:-3]) != list(cleaned_baseline("g").iloc[0, 1:-3])
+    assert cache_info(cache_dir)["entries"] == 2
+
+
+def test_ezviz_tables_are_cached(microbiome, metadata, tmp_path):
+    cache_dir = str(tmp_path / "cache")
+    ezviz(microbiome, metadata, "g", "Treatment", top_taxa=5, cache=cache_dir, output_dir=str(tmp_path / "a"),
+          plot_format="png", dpi=20)
+    report = StageReport(memory=False)
+    ezviz(microbiome, metadata, "g", "Treatment", top_taxa=5, cache=cache_dir, output_dir=str(tmp_path / "b"),
+          plot_format="png", dpi=20, profile=report)
+    assert "ezviz.clean" not in _stages(report)
+    assert "ezviz.render" in _stages(report)
+
+
+def test_corrupt_entry_is_a_miss_and_removed(tmp_path):
+    cache = ResultCache(str(tmp_path))
+    cache.put("a" * 64, pd.DataFrame({"x": [1, 2]}))
+    path = os.path.join(str(tmp_path), "a" * 64 + ".pkl")
+    with open(path, "wb") as fh:
+        fh.write(b"not a pickle")
+    assert cache.get("a" * 64) is None
+    assert not os.path.exists(path)
+
+
+def test_truncated_entry_is_a_miss_and_removed(tmp_path):
+    cache = ResultCache(str(tmp_path))
+    cache.put("b" * 64, pd.DataFrame({"x": range(1000)}))
+    path = os.path.join(str(tmp_path), "b" * 64 + ".pkl")
+    with open(path, "rb") as fh:
+        data = fh.read()
+    with open(path, "wb") as fh:
+        fh.write(data[:len(data) // 2])
+    assert cache.get("b" * 64) is None
+    assert not os.path.exists(path)
+
+
+def test_evicted_entry_is_a_miss(tmp_path):
+    cache = ResultCache(str(tmp_path))
+    cache.put("c" * 64, pd.DataFrame({"x": [1]}))
+    clear_cache(cache)
+    assert cache.get("c" * 64) is None
+    assert ResultCache(str(tmp_path / "never_created")).get("c" * 64) is None
+
+
+def test_put_leaves_no_temporary_files(tmp_path):
+    cache = ResultCache(str(tmp_path))
+    for key in ["d" * 64, "e" * 64]:
+        cache.put(key, pd.DataFrame({"x": [1]}))
+    assert sorted(os.listdir(tmp_path)) == ["d" * 64 + ".pkl", "e" * 64 + ".pkl"]
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path):
+    cache = ResultCache(str(tmp_path))
+    value = pd.DataFrame({"x": range(2000)})
+    for key in ["1" * 64, "2" * 64, "3" * 64]:
+        cache.put(key, value)
+        time.sleep(0.02)
+    # Using the oldest entry makes the second one the least recently used
+    assert cache.get("1" * 64) is not None
+    size = cache.info()["total_bytes"] // 3
+    cache.max_bytes = 2 * size + size // 2
+    cache.evict()
+    assert cache.get("2" * 64) is None
+    assert cache.get("1" * 64) is not None and cache.get("3" * 64) is not None
+
+
+def test_keys_follow_parameters_and_contents(microbiome, metadata, tmp_path):
+    key = make_key("ezclean", [microbiome, metadata], level="g__", sparse=False)
+    assert key == make_key("ezclean", [microbiome, metadata], level="g__", sparse=False)
+    assert key != make_key("ezclean", [microbiome, metadata], level="g__", sparse=True)
+    assert key != make_key("ezclean", [microbiome, metadata], level="f__", sparse=False)
+    frame = pd.read_csv(metadata, sep="\t")
+    assert make_key("ezclean", [frame], level="g__") == make_key("ezclean", [frame.copy()], level="g__")
+
+
+def test_memory_cache_returns_copies():
+    cache = MemoryCache(max_entries=2)
+    cache.put("a", pd.DataFrame({"x": [1]}))
+    cache.get("a").loc[0, "x"] = 99
+    assert cache.get("a").loc[0, "x"] == 1
+    cache.put("b", pd.DataFrame({"x": [2]}))
+    cache.put("c", pd.DataFrame({"x": [3]}))
+    assert cache.get("a") is None
+    assert cache.info()["entries"] == 2
@@ -0,0 +1,39 @@
+import pandas as pd
+import pytest
+
+from pymbX import StageReport, ezclean, ezviz
+
+from conftest import LEVELS, VIZ_CASES, assert_same_table, cleaned_baseline, read_baseline, viz_table
+
+# -------------------------------
+# chunksize=n: streamed csv/txt tables
+# -------------------------------
+
+
+@pytest.mark.parametrize("chunksize", [1, 5, 12, 100])
+def test_chunks_match_baseline(chunksize, microbiome, metadata):
+    cleaned = ezclean(microbiome, metadata, "all", save=False, chunksize=chunksize)
+    for key, level in zip(cleaned, LEVELS):
+        assert_same_table(cleaned[key], cleaned_baseline(level))
+
+
+def test_tab_separated_chunks_match_baseline(microbiome, metadata, tmp_path):
+    pd.read_csv(microbiome).to_csv(tmp_path / "microbiome.txt", sep="\t", index=False)
+    cleaned = ezclean(str(tmp_path / "microbiome.txt"), metadata, "f", save=False, chunksize=5)
+    assert_same_table(cleaned, cleaned_baseline("f"))
+
+
+def test_table_is_read_one_chunk_at_a_time(microbiome, metadata):
+    report = StageReport(memory=False)
+    ezclean(microbiome, metadata, "g", save=False, chunksize=5, profile=report)
+    calls = {row["stage"]: row["calls"] for row in report.summary()}
+    # Three chunks of 5, 5 and 2 samples, then the end of the file
+    assert calls["ezclean.read_chunk"] == 4
+    assert calls["ezclean.aggregate"] == 3
+
+
+@pytest.mark.parametrize("level, kwargs, data_name, baseline_name", VIZ_CASES)
+def test_chunked_ezviz_matches_baseline(level, kwargs, data_name, baseline_name, microbiome, metadata, tmp_path):
+    ezviz(microbiome, metadata, level, "Treatment", chunksize=4, output_dir=str(tmp_path), plot_format="png", dpi=20,
+          **kwargs)
+    pd.testing.assert_frame_equal(viz_table(tmp_path, data_name), read_baseline(baseline_name))
@@ -0,0 +1,84 @@
+import os
+import importlib.util
+
+import pandas as pd
+import pytest
+
+from pymbX import ezclean, ezsummary, ezviz
+from pymbX.pymbX import _is_cleaned_input
+
+from conftest import CLEANED_NAMES, VIZ_CASES, read_baseline, viz_table
+
+# -------------------------------
+# ezviz / ezsummary on an ezclean result
+# -------------------------------
+# A cleaned DataFrame, a multi-level dict or a cleaned table file in any of the
+# supported formats (under any name) skips the cleaning and must give the same
+# visualization tables as a raw microbiome file.
+
+needs_pyarrow = pytest.mark.skipif(importlib.util.find_spec("pyarrow") is None, reason="needs pyarrow")
+
+
+def _write_cleaned(cleaned, tmp_path, name):
+    # Write a cleaned table the way a user might keep it, by the extension of name
+    path = str(tmp_path / name)
+    ext = os.path.splitext(name)[1]
+    if ext == ".csv":
+        cleaned.to_csv(path, index=False)
+    elif ext == ".txt":
+        cleaned.to_csv(path, sep="\t", index=False)
+    elif ext == ".xlsx":
+        cleaned.to_excel(path, index=False)
+    elif ext == ".parquet":
+        cleaned.to_parquet(path, index=False)
+    else:
+        cleaned.to_feather(path)
+    return path
+
+
+@pytest.mark.parametrize("name", [
+    CLEANED_NAMES["g"] + ".csv",
+    "genera.csv",
+    "genera.txt",
+    "genera.xlsx",
+    pytest.param("genera.parquet", marks=needs_pyarrow),
+    pytest.param("genera.feather", marks=needs_pyarrow),
+])
+def test_cleaned_file_gives_baseline_viz_table(name, microbiome, metadata, tmp_path):
+    level, kwargs, data_name, baseline_name = VIZ_CASES[0]
+    path = _write_cleaned(ezclean(microbiome, metadata, level, save=False), tmp_path, name)
+    assert _is_cleaned_input(path, metadata)
+    out = tmp_path / "out"
+    ezviz(path, metadata, level, "Treatment", output_dir=str(out), plot_format="png", dpi=20, **kwargs)
+    pd.testing.assert_frame_equal(viz_table(out, data_name), read_baseline(baseline_name))
+    # Only the visualization outputs are written, no cleaned table
+    assert not any(f.startswith("mbX_cleaned_") for f in os.listdir(out))
+
+
+@pytest.mark.parametrize("level, kwargs, data_name, baseline_name", VIZ_CASES)
+def test_cleaned_frames_give_baseline_viz_tables(level, kwargs, data_name, baseline_name, microbiome, metadata,
+                                                 tmp_path):
+    cleaned = ezclean(microbiome, metadata, ["g", "f", "s"], save=False)
+    metadata_df = pd.read_csv(metadata, sep="\t")
+    for data, meta, out in [(cleaned, metadata, tmp_path / "dict"), (cleaned[level], metadata_df, tmp_path / "df")]:
+        ezviz(data, meta, level, "Treatment", output_dir=str(out), plot_format="png", dpi=20, **kwargs)
+        pd.testing.assert_frame_equal(viz_table(out, data_name), read_baseline(baseline_name))
+
+
+def test_missing_level_in_a_dict_is_reported(microbiome, metadata, tmp_path):
+    cleaned = ezclean(microbiome, metadata, ["g"], save=False)
+    assert ezviz(cleaned, metadata, "f", "Treatment", output_dir=str(tmp_path)) == \
+        "The cleaned data does not contain the requested taxonomic level."
+
+
+def test_ezsummary_on_a_cleaned_csv(microbiome, metadata, tmp_path):
+    path = _write_cleaned(ezclean(microbiome, metadata, "g", save=False), tmp_path, "genera.csv")
+    from_file = ezsummary(path, metadata, "g", "Treatment", save=False)
+    from_raw = ezsummary(microbiome, metadata, "g", "Treatment", save=False)
+    pd.testing.assert_frame_equal(from_file, from_raw)
+
+
+def test_raw_tables_are_not_taken_for_cleaned_ones(microbiome, metadata, tmp_path):
+    assert not _is_cleaned_input(microbiome, metadata)
+    pd.read_csv(microbiome).to_csv(tmp_path / "raw.txt", sep="\t", index=False)
+    assert not _is_cleaned_input(str(tmp_path / "raw.txt"), metadata)
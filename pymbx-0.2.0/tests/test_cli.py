@@ -0,0 +1,84 @@
+import os
+import sys
+
+import pandas as pd
+import pytest
+
+from pymbX import cli
+
+from conftest import CLEANED_NAMES, assert_same_table, cleaned_baseline, read_baseline, viz_table
+
+# -------------------------------
+# pymbx command line and daemon
+# -------------------------------
+
+
+def test_clean_writes_and_prints_the_files(microbiome, metadata, tmp_path, capsys):
+    out = tmp_path / "out"
+    assert cli.main(["clean", microbiome, metadata, "-l", "g,f", "-o", str(out), "--no-daemon"]) == 0
+    printed = capsys.readouterr().out.split()
+    assert printed == [os.path.join(str(out), CLEANED_NAMES[lv] + ".xlsx") for lv in ["g", "f"]]
+    for lv in ["g", "f"]:
+        assert_same_table(pd.read_excel(out / (CLEANED_NAMES[lv] + ".xlsx"), dtype={"sample-id": str}),
+                          cleaned_baseline(lv))
+
+
+def _printed_plots(capsys):
+    # ezviz prints its own progress lines before the files the command reports
+    return sorted(line for line in capsys.readouterr().out.splitlines() if line.endswith(".png"))
+
+
+def test_viz_with_several_columns(microbiome, metadata, tmp_path, capsys):
+    out = tmp_path / "out"
+    assert cli.main(["viz", microbiome, metadata, "-l", "g", "-m", "Treatment", "--top-taxa", "5", "-o", str(out),
+                     "--plot-format", "png", "--dpi", "20", "--no-daemon"]) == 0
+    (plot,) = _printed_plots(capsys)
+    assert plot == os.path.join(str(out), "mbX_viz_genera.png")
+    pd.testing.assert_frame_equal(viz_table(out, "mbX_vizualization_data_genera"),
+                                  read_baseline("mbX_vizualization_data_genera_top5"))
+    assert cli.main(["viz", microbiome, metadata, "-l", "g", "-m", "Treatment", "-m", "Timepoint", "-o", str(out),
+                     "--plot-format", "png", "--dpi", "20", "--no-daemon"]) == 0
+    assert _printed_plots(capsys) == [
+        os.path.join(str(out), "mbX_viz_genera_Timepoint.png"), os.path.join(str(out), "mbX_viz_genera_Treatment.png")]
+
+
+def test_invalid_input_exits_with_the_message(microbiome, metadata, tmp_path, capsys):
+    assert cli.main(["clean", microbiome, metadata, "-l", "strain", "-o", str(tmp_path), "--no-daemon"]) == 1
+    assert capsys.readouterr().err.startswith("The level value should be one of the following")
+
+
+def test_paths_are_made_absolute(microbiome, metadata, tmp_path, monkeypatch):
+    # A daemon runs in its own working directory
+    monkeypatch.chdir(tmp_path)
+    args = cli._build_parser().parse_args(["clean", os.path.relpath(microbiome), os.path.relpath(metadata), "-l", "g",
+                                           "--memmap", "scratch", "--cache", "cache", "--append-to", "old.xlsx"])
+    kwargs = cli._job_kwargs(args)
+    for key, name in [("memmap", "scratch"), ("cache", "cache"), ("append_to", "old.xlsx"), ("output_dir", "")]:
+        assert kwargs[key] == os.path.abspath(name), key
+    assert kwargs["microbiome_data"] == os.path.abspath(microbiome)
+    # Bare --memmap / --cache keep their default locations
+    args = cli._build_parser().parse_args(["clean", microbiome, metadata, "-l", "g", "--memmap", "--cache"])
+    kwargs = cli._job_kwargs(args)
+    assert kwargs["memmap"] is True and kwargs["cache"] is True
+
+
+@pytest.mark.skipif(sys.platform == "win32", reason="uses a Unix socket path under tmp_path")
+def test_daemon_runs_jobs_and_keeps_results(microbiome, metadata, tmp_path, capsys):
+    daemon_dir = str(tmp_path / "daemon")
+    assert cli.main(["daemon", "status", "--daemon-dir", daemon_dir]) == 1
+    assert cli.main(["daemon", "start", "--daemon-dir", daemon_dir]) == 0
+    try:
+        for out in ["a", "b"]:
+            assert cli.main(["clean", microbiome, metadata, "-l", "g", "-o", str(tmp_path / out),
+                             "--daemon-dir", daemon_dir]) == 0
+            assert_same_table(pd.read_excel(tmp_path / out / (CLEANED_NAMES["g"] + ".xlsx"),
+                                            dtype={"sample-id": str}), cleaned_baseline("g"))
+        status = cli._request(daemon_dir, {"command": "status"})["result"]
+        assert status["jobs"] == 2 and status["cache"]["entries"] == 1
+        assert status["pid"] != os.getpid()
+        # Errors inside the daemon come back as a failed job
+        assert cli.main(["viz", microbiome, metadata, "-l", "g", "-m", "Nope", "-o", str(tmp_path),
+                         "--daemon-dir", daemon_dir]) == 1
+    finally:
+        assert cli.main(["daemon", "stop", "--daemon-dir", daemon_dir]) == 0
+    assert cli._request(daemon_dir, {"command": "status"}) is None
@@ -0,0 +1,65 @@
+import os
+
+import pandas as pd
+import pytest
+
+from pymbX import ezclean, ezviz
+
+from conftest import CLEANED_NAMES, VIZ_CASES, assert_same_table, cleaned_baseline, read_baseline
+
+pytest.importorskip("pyarrow")
+
+# -------------------------------
+# Parquet and Feather input and output
+# -------------------------------
+
+
+@pytest.fixture
+def columnar_inputs(microbiome, metadata, tmp_path):
+    # The fixture tables as Parquet and Feather files
+    micro_df = pd.read_csv(microbiome)
+    meta_df = pd.read_csv(metadata, sep="\t", dtype=str)
+    paths = {}
+    for ext in ["parquet", "feather"]:
+        getattr(micro_df, "to_" + ext)(tmp_path / ("microbiome." + ext))
+        getattr(meta_df, "to_" + ext)(tmp_path / ("metadata." + ext))
+        paths[ext] = (str(tmp_path / ("microbiome." + ext)), str(tmp_path / ("metadata." + ext)))
+    return paths
+
+
+@pytest.mark.parametrize("ext", ["parquet", "feather"])
+@pytest.mark.parametrize("level", ["p", "g", "s"])
+def test_columnar_input_matches_baseline(ext, level, columnar_inputs):
+    microbiome, metadata = columnar_inputs[ext]
+    assert_same_table(ezclean(microbiome, metadata, level, save=False), cleaned_baseline(level))
+
+
+@pytest.mark.parametrize("chunksize", [1, 5])
+def test_parquet_row_groups_stream_like_csv(chunksize, columnar_inputs):
+    microbiome, metadata = columnar_inputs["parquet"]
+    cleaned = ezclean(microbiome, metadata, "g", save=False, chunksize=chunksize)
+    assert_same_table(cleaned, cleaned_baseline("g"))
+
+
+@pytest.mark.parametrize("format", ["parquet", "feather"])
+def test_columnar_output_round_trips(format, microbiome, metadata, tmp_path):
+    path = ezclean(microbiome, metadata, "g", format=format, output_dir=str(tmp_path))
+    assert path == os.path.join(str(tmp_path), CLEANED_NAMES["g"] + "." + format)
+    read = pd.read_parquet if format == "parquet" else pd.read_feather
+    assert_same_table(read(path), cleaned_baseline("g"))
+
+
+@pytest.mark.parametrize("format", ["parquet", "feather"])
+def test_columnar_ezviz_outputs(format, microbiome, metadata, tmp_path):
+    level, kwargs, data_name, baseline_name = VIZ_CASES[0]
+    ezviz(microbiome, metadata, level, "Treatment", format=format, output_dir=str(tmp_path), plot_format="png",
+          dpi=20, **kwargs)
+    read = pd.read_parquet if format == "parquet" else pd.read_feather
+    pd.testing.assert_frame_equal(read(os.path.join(tmp_path, data_name + "." + format)),
+                                  read_baseline(baseline_name))
+    assert os.path.exists(os.path.join(tmp_path, CLEANED_NAMES[level] + "." + format))
+
+
+def test_unknown_output_format_is_reported(microbiome, metadata):
+    assert ezclean(microbiome, metadata, "g", format="hdf5") == \
+        "The output format should be one of the following: xlsx, parquet, feather."
@@ -0,0 +1,59 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from pymbX import ezclean, ezviz
+from pymbX.pymbX import _compact_counts, _compact_metadata
+
+from conftest import LEVELS, VIZ_CASES, assert_same_table, cleaned_baseline, read_baseline, viz_table
+
+# -------------------------------
+# compact=True: small integer counts, float32 abundances, categorical metadata
+# -------------------------------
+# The abundances are float32, so they are compared to the baseline to 1e-5.
+
+
+@pytest.mark.parametrize("level", LEVELS)
+def test_compact_matches_baseline(level, microbiome, metadata):
+    cleaned = ezclean(microbiome, metadata, level, save=False, compact=True)
+    taxa = cleaned.columns[1:-3]
+    assert all(cleaned[col].dtype == np.float32 for col in taxa)
+    assert all(isinstance(cleaned[col].dtype, pd.CategoricalDtype) for col in ["Treatment", "Site", "Timepoint"])
+    assert_same_table(cleaned, cleaned_baseline(level), rtol=1e-5)
+
+
+@pytest.mark.parametrize("kwargs", [{"chunksize": 5}, {"sparse": True}])
+def test_compact_with_other_backends_matches_baseline(kwargs, microbiome, metadata):
+    if kwargs.get("sparse"):
+        pytest.importorskip("scipy")
+    cleaned = ezclean(microbiome, metadata, ["g", "p"], save=False, compact=True, **kwargs)
+    assert_same_table(cleaned["g"], cleaned_baseline("g"), rtol=1e-5)
+    assert_same_table(cleaned["p"], cleaned_baseline("p"), rtol=1e-5)
+
+
+@pytest.mark.parametrize("level, kwargs, data_name, baseline_name", VIZ_CASES)
+def test_compact_ezviz_matches_baseline(level, kwargs, data_name, baseline_name, microbiome, metadata, tmp_path):
+    ezviz(microbiome, metadata, level, "Treatment", compact=True, output_dir=str(tmp_path), plot_format="png",
+          dpi=20, **kwargs)
+    assert_same_table(viz_table(tmp_path, data_name), read_baseline(baseline_name), rtol=1e-5)
+
+
+def test_compact_counts_pick_the_smallest_type():
+    assert _compact_counts(pd.DataFrame({"a": [0, 255]}))["a"].dtype == np.uint8
+    assert _compact_counts(pd.DataFrame({"a": [1, 300]}))["a"].dtype == np.uint16
+    assert _compact_counts(pd.DataFrame({"a": [1, 70000]}))["a"].dtype == np.uint32
+    # Fractions, negatives and missing values keep a float type
+    assert _compact_counts(pd.DataFrame({"a": [1.5, 3]}))["a"].dtype == np.float32
+    assert _compact_counts(pd.DataFrame({"a": [-1, 3]}))["a"].dtype == np.float32
+    assert _compact_counts(pd.DataFrame({"a": [np.nan, 3]}))["a"].dtype == np.float32
+
+
+def test_compact_metadata_keeps_the_key_and_unique_values():
+    pytest.importorskip("pyarrow")
+    metadata_df = pd.DataFrame({"sample-id": ["S1", "S2", "S3", "S4"], "Group": ["a", "a", "b", "b"],
+                                "Note": ["w", "x", "y", "z"]})
+    compact_df = _compact_metadata(metadata_df)
+    assert compact_df["sample-id"].dtype == object
+    assert isinstance(compact_df["Group"].dtype, pd.CategoricalDtype)
+    assert compact_df["Note"].dtype == "string[pyarrow]"
+    assert metadata_df["Group"].dtype == object
@@ -0,0 +1,66 @@
+import os
+
+import pandas as pd
+import pytest
+
+from pymbX import ezclean, ezviz
+
+# -------------------------------
+# ezclean / ezviz outputs against a stored baseline
+# -------------------------------
+# tests/data/baseline holds the tables the original workbook-based pipeline (one
+# intermediate .xlsx per step) wrote for tests/data/microbiome.csv and
+# metadata.txt. The in-memory pipeline has to give the same cleaned and
+# collapsed tables.
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data")
+MICROBIOME = os.path.join(DATA_DIR, "microbiome.csv")
+METADATA = os.path.join(DATA_DIR, "metadata.txt")
+
+CLEANED_NAMES = {
+    "d": "mbX_cleaned_domains_or_kingdom",
+    "p": "mbX_cleaned_phylum",
+    "c": "mbX_cleaned_classes",
+    "o": "mbX_cleaned_orders",
+    "f": "mbX_cleaned_families",
+    "g": "mbX_cleaned_genera",
+    "s": "mbX_cleaned_species"
+}
+
+
+def _baseline(name):
+    return pd.read_csv(os.path.join(DATA_DIR, "baseline", name + ".csv"), dtype={"sample-id": str})
+
+
+@pytest.mark.parametrize("level", list(CLEANED_NAMES))
+def test_cleaned_file_matches_baseline(level, tmp_path):
+    path = ezclean(MICROBIOME, METADATA, level, output_dir=str(tmp_path))
+    assert os.path.basename(path) == CLEANED_NAMES[level] + ".xlsx"
+    # Only the documented output is written, no intermediate workbooks
+    assert os.listdir(tmp_path) == [CLEANED_NAMES[level] + ".xlsx"]
+    pd.testing.assert_frame_equal(pd.read_excel(path, dtype={"sample-id": str}), _baseline(CLEANED_NAMES[level]))
+
+
+@pytest.mark.parametrize("level", list(CLEANED_NAMES))
+def test_cleaned_frame_matches_baseline(level):
+    cleaned = ezclean(MICROBIOME, METADATA, level, save=False)
+    pd.testing.assert_frame_equal(cleaned, _baseline(CLEANED_NAMES[level]))
+
+
+def test_multi_level_matches_single_levels():
+    cleaned = ezclean(MICROBIOME, METADATA, ["g", "f", "p"], save=False)
+    for level in ["g", "f", "p"]:
+        pd.testing.assert_frame_equal(cleaned[level], _baseline(CLEANED_NAMES[level]))
+
+
+@pytest.mark.parametrize("level, kwargs, data_name, baseline_name", [
+    ("g", {"top_taxa": 5}, "mbX_vizualization_data_genera", "mbX_vizualization_data_genera_top5"),
+    ("f", {"threshold": 3.0}, "mbX_vizualization_data_families", "mbX_vizualization_data_families_threshold3"),
+    ("s", {}, "mbX_vizualization_data_species", "mbX_vizualization_data_species"),
+])
+def test_collapsed_table_matches_baseline(level, kwargs, data_name, baseline_name, tmp_path):
+    plot = ezviz(MICROBIOME, METADATA, level, "Treatment", output_dir=str(tmp_path), plot_format="png", dpi=20,
+                 **kwargs)
+    assert os.path.exists(plot)
+    collapsed = pd.read_excel(os.path.join(tmp_path, data_name + ".xlsx"))
+    pd.testing.assert_frame_equal(collapsed, _baseline(baseline_name))
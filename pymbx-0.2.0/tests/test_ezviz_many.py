@@ -0,0 +1,56 @@
+import os
+
+import pandas as pd
+
+from pymbX import ezviz, ezviz_many
+
+from conftest import read_baseline, viz_table
+
+# -------------------------------
+# ezviz_many: parallel plots of one dataset
+# -------------------------------
+
+COMBINATIONS = [("g", "Treatment", 5), {"level": "f", "selected_metadata": "Treatment", "threshold": 3.0},
+                ("s", "Treatment"), ("x", "Treatment")]
+
+
+def _check(results, output_dir):
+    assert list(results) == [("g", "Treatment", 5, None), ("f", "Treatment", None, 3.0),
+                             ("s", "Treatment", None, None), ("x", "Treatment", None, None)]
+    assert results[("x", "Treatment", None, None)] == "Invalid taxonomic level provided."
+    for (level, column, top_taxa, threshold), data_name, baseline_name in [
+        (("g", "Treatment", 5, None), "mbX_vizualization_data_genera", "mbX_vizualization_data_genera_top5"),
+        (("f", "Treatment", None, 3.0), "mbX_vizualization_data_families",
+         "mbX_vizualization_data_families_threshold3"),
+        (("s", "Treatment", None, None), "mbX_vizualization_data_species", "mbX_vizualization_data_species"),
+    ]:
+        plot = results[(level, column, top_taxa, threshold)]
+        job_dir = os.path.dirname(plot)
+        assert os.path.dirname(job_dir) == str(output_dir)
+        pd.testing.assert_frame_equal(viz_table(job_dir, data_name), read_baseline(baseline_name))
+
+
+def test_threads_match_baseline(microbiome, metadata, tmp_path):
+    results = ezviz_many(microbiome, metadata, COMBINATIONS, max_workers=3, output_dir=str(tmp_path),
+                         plot_format="png", dpi=20)
+    _check(results, tmp_path)
+    assert os.path.basename(os.path.dirname(results[("g", "Treatment", 5, None)])) == "g_Treatment_top5"
+
+
+def test_processes_match_baseline(microbiome, metadata, tmp_path):
+    results = ezviz_many(microbiome, metadata, COMBINATIONS, max_workers=2, processes=True, output_dir=str(tmp_path),
+                         plot_format="png", dpi=20)
+    _check(results, tmp_path)
+
+
+def test_parallel_plots_match_a_single_plot(microbiome, metadata, tmp_path):
+    # Plots drawn on several threads at once come out as drawn one at a time
+    single = ezviz(microbiome, metadata, "g", "Treatment", top_taxa=5, output_dir=str(tmp_path / "single"),
+                   plot_format="png", dpi=30)
+    with open(single, "rb") as fh:
+        expected = fh.read()
+    for i in range(3):
+        results = ezviz_many(microbiome, metadata, [("g", "Treatment", 5), ("f", "Treatment", 5), ("p", "Treatment")],
+                             max_workers=3, output_dir=str(tmp_path / str(i)), plot_format="png", dpi=30)
+        with open(results[("g", "Treatment", 5, None)], "rb") as fh:
+            assert fh.read() == expected
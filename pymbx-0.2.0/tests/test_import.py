@@ -0,0 +1,31 @@
+import subprocess
+import sys
+
+import pytest
+
+# -------------------------------
+# import pymbX stays cheap and silent
+# -------------------------------
+
+_PROBE = """
+import sys
+import pymbX
+heavy = [m for m in ["pandas", "numpy", "openpyxl", "matplotlib"] if m in sys.modules]
+assert not heavy, heavy
+assert sorted(dir(pymbX)) == sorted(set(dir(pymbX)))
+assert "ezclean" in dir(pymbX) and "ezclean" not in vars(pymbX)
+pymbX.ezclean
+assert "ezclean" in vars(pymbX) and "pandas" in sys.modules
+"""
+
+
+def test_import_loads_no_heavy_dependency():
+    completed = subprocess.run([sys.executable, "-c", _PROBE], capture_output=True, text=True)
+    assert completed.returncode == 0, completed.stderr
+    assert completed.stdout == ""
+
+
+def test_unknown_attribute_raises_attribute_error():
+    import pymbX
+    with pytest.raises(AttributeError, match="does_not_exist"):
+        pymbX.does_not_exist
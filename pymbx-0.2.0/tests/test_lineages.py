@@ -0,0 +1,87 @@
+import pandas as pd
+import pytest
+
+from pymbX import ezclean
+from pymbX.pymbX import _parse_lineages, _taxa_at_level
+
+# -------------------------------
+# unidentified_<rank>_<n>_at_<parent>_<rank> naming
+# -------------------------------
+# Blank ranks fall back to the nearest named parent and are numbered in row
+# order; a repeated lineage gets a new number each time it occurs. The expected
+# names are what the original per-row extract_taxa produced for these lineages.
+
+LINEAGES = [
+    "d__Bacteria;p__Firmicutes;c__Bacilli;o__Lactobacillales;f__Lactobacillaceae;g__Lactobacillus;s__",
+    "d__Bacteria;p__Firmicutes;c__Clostridia;o__Oscillospirales;f__Ruminococcaceae;g__;s__",
+    "d__Bacteria;p__Bacteroidota;c__Bacteroidia;__;__;__;__",
+    "d__Bacteria;p__Firmicutes;c__Clostridia;o__Oscillospirales;f__Ruminococcaceae;g__;s__",
+    "d__Bacteria;p__Firmicutes;c__Bacilli;o__Lactobacillales;f__Lactobacillaceae;g__Lactobacillus;s__",
+    "d__Bacteria;p__ ;c__;o__;f__;g__ ;s__",
+    None,
+    "Unassigned",
+    "g__Prevotella",
+    "d__Archaea;p__Halobacterota;c__;o__;f__;g__;s__x",
+    "d__Bacteria;p__Firmicutes;c__Clostridia;o__Oscillospirales;f__Ruminococcaceae;g__;s__"
+]
+
+
+def test_unidentified_genera_names_and_order():
+    assert list(_taxa_at_level(_parse_lineages(LINEAGES), "g__")) == [
+        "Lactobacillus",
+        "unidentified_genus_1_at_Ruminococcaceae_family",
+        "unidentified_genus_2_at_Bacteroidia_class",
+        "unidentified_genus_3_at_Ruminococcaceae_family",
+        "Lactobacillus",
+        "unidentified_genus_4_at_Bacteria_domain",
+        "",
+        "",
+        "Prevotella",
+        "unidentified_genus_5_at_Halobacterota_phylum",
+        "unidentified_genus_6_at_Ruminococcaceae_family"
+    ]
+
+
+def test_unidentified_species_names_and_order():
+    assert list(_taxa_at_level(_parse_lineages(LINEAGES), "s__")) == [
+        "unidentified_species_1_at_Lactobacillus_genus",
+        "unidentified_species_2_at_Ruminococcaceae_family",
+        "unidentified_species_3_at_Bacteroidia_class",
+        "unidentified_species_4_at_Ruminococcaceae_family",
+        "unidentified_species_5_at_Lactobacillus_genus",
+        "unidentified_species_6_at_Bacteria_domain",
+        "",
+        "",
+        "unidentified_species_7_at_Prevotella_genus",
+        "x",
+        "unidentified_species_8_at_Ruminococcaceae_family"
+    ]
+
+
+def test_top_rank_is_never_renamed():
+    assert list(_taxa_at_level(_parse_lineages(LINEAGES), "d__")) == ["Bacteria"] * 6 + ["", "", ""] + [
+        "Archaea", "Bacteria"]
+
+
+def test_cleaned_genera_columns(tmp_path):
+    # Through ezclean the names become the taxa columns, in the same order; the
+    # two blank Ruminococcaceae genera stay separate columns
+    lineages = [x for x in LINEAGES if x is not None and x.startswith("d__")][:7]
+    microbiome = pd.DataFrame([[10, 5, 3, 7, 2, 1, 4], [1, 2, 3, 4, 5, 6, 7]], columns=lineages)
+    microbiome.insert(0, "index", ["S1", "S2"])
+    microbiome.to_csv(tmp_path / "microbiome.csv", index=False)
+    pd.DataFrame({"sample-id": ["S1", "S2"], "Group": ["a", "b"]}).to_csv(tmp_path / "metadata.txt", sep="\t",
+                                                                           index=False)
+
+    cleaned = ezclean(str(tmp_path / "microbiome.csv"), str(tmp_path / "metadata.txt"), "g", save=False)
+    assert list(cleaned.columns) == [
+        "sample-id",
+        "Lactobacillus",
+        "unidentified_genus_1_at_Ruminococcaceae_family",
+        "unidentified_genus_2_at_Bacteroidia_class",
+        "unidentified_genus_3_at_Ruminococcaceae_family",
+        "unidentified_genus_4_at_Bacteria_domain",
+        "unidentified_genus_5_at_Halobacterota_phylum",
+        "Group"
+    ]
+    assert cleaned["Lactobacillus"].tolist() == pytest.approx([12 / 32 * 100, 6 / 28 * 100])
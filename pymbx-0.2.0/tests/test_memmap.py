@@ -0,0 +1,80 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from pymbX import ezclean, ezviz
+import pymbX.pymbX as mbx
+
+from conftest import LEVELS, VIZ_CASES, assert_same_table, cleaned_baseline, read_baseline, viz_table
+
+# -------------------------------
+# memmap: count matrix spilled to a memory-mapped scratch file
+# -------------------------------
+
+
+@pytest.mark.parametrize("level", LEVELS)
+def test_memmap_matches_baseline(level, microbiome, metadata):
+    assert_same_table(ezclean(microbiome, metadata, level, save=False, memmap=True), cleaned_baseline(level))
+
+
+@pytest.mark.parametrize("chunksize", [1, 5, 100])
+def test_memmap_chunks_match_baseline(chunksize, microbiome, metadata, tmp_path):
+    scratch = tmp_path / "scratch"
+    cleaned = ezclean(microbiome, metadata, ["g", "p"], save=False, memmap=str(scratch), chunksize=chunksize)
+    assert_same_table(cleaned["g"], cleaned_baseline("g"))
+    assert_same_table(cleaned["p"], cleaned_baseline("p"))
+    # The scratch directory is created and the spilled file removed afterwards
+    assert scratch.is_dir() and os.listdir(scratch) == []
+
+
+def test_memmap_blocks_match_baseline(microbiome, metadata, monkeypatch):
+    # Blocks of a few sample rows give the same percentages as one block
+    monkeypatch.setattr(mbx, "_MEMMAP_BLOCK_BYTES", 50 * 8 * 5)
+    assert_same_table(ezclean(microbiome, metadata, "f", save=False, memmap=True), cleaned_baseline("f"))
+
+
+def test_memmap_compact_matches_baseline(microbiome, metadata):
+    cleaned = ezclean(microbiome, metadata, "g", save=False, memmap=True, compact=True)
+    assert cleaned.iloc[:, 1].dtype == np.float32
+    assert_same_table(cleaned, cleaned_baseline("g"), rtol=1e-5)
+
+
+@pytest.mark.parametrize("level, kwargs, data_name, baseline_name", VIZ_CASES[:2])
+def test_memmap_ezviz_matches_baseline(level, kwargs, data_name, baseline_name, microbiome, metadata, tmp_path):
+    ezviz(microbiome, metadata, level, "Treatment", memmap=True, output_dir=str(tmp_path), plot_format="png", dpi=20,
+          **kwargs)
+    pd.testing.assert_frame_equal(viz_table(tmp_path, data_name), read_baseline(baseline_name))
+
+
+def test_memmap_scratch_is_removed_on_failure(microbiome, metadata, tmp_path, monkeypatch):
+    def fail(*args, **kwargs):
+        raise RuntimeError("aggregation failed")
+
+    monkeypatch.setattr(mbx, "_memmap_levels", fail)
+    with pytest.raises(RuntimeError):
+        ezclean(microbiome, metadata, "g", save=False, memmap=str(tmp_path))
+    assert os.listdir(tmp_path) == []
+
+
+def test_memmap_spills_text_counts_as_nan(tmp_path):
+    microbiome = pd.DataFrame({"index": ["S1", "S2"], "d__A;p__B": [3, "x"], "d__A;p__C": [1, 4]})
+    microbiome.to_csv(tmp_path / "micro.csv", index=False)
+    metadata = pd.DataFrame({"sample-id": ["S1", "S2"], "Group": ["x", "y"]})
+    dense = ezclean(str(tmp_path / "micro.csv"), metadata, "p", save=False)
+    spilled = ezclean(str(tmp_path / "micro.csv"), metadata, "p", save=False, memmap=True)
+    assert_same_table(spilled, dense)
+
+
+def test_memmap_with_sparse_is_reported(microbiome, metadata):
+    assert ezclean(microbiome, metadata, "g", save=False, sparse=True, memmap=True) == \
+        "The sparse backend and memmap cannot be used together."
+
+
+def test_with_metadata_aligns_on_the_sample_ids():
+    metadata_df = pd.DataFrame({"sample-id": ["S2", "S1"], "Group": ["b", "a"], "Site": ["y", "x"]})
+    table = pd.DataFrame({"sample-id": ["S1", "S3", "S2"], "A": [1.0, 2.0, 3.0]}, index=[5, 6, 7])
+    merged = mbx._with_metadata(table, metadata_df)
+    assert list(merged.columns) == ["sample-id", "A", "Group", "Site"]
+    assert merged["Group"].tolist()[::2] == ["a", "b"] and pd.isna(merged["Group"][1])
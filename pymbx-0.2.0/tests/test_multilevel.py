@@ -0,0 +1,35 @@
+import os
+
+from pymbX import ezclean
+
+from conftest import CLEANED_NAMES, LEVELS, assert_same_table, cleaned_baseline
+
+# -------------------------------
+# Several levels from one read (level=[...] / "all")
+# -------------------------------
+
+
+def test_all_levels_match_single_levels(microbiome, metadata):
+    cleaned = ezclean(microbiome, metadata, "all", save=False)
+    assert list(cleaned) == ["domain", "phylum", "class", "order", "family", "genus", "species"]
+    for key, level in zip(cleaned, LEVELS):
+        assert_same_table(cleaned[key], cleaned_baseline(level))
+
+
+def test_results_are_keyed_by_the_levels_as_given(microbiome, metadata):
+    cleaned = ezclean(microbiome, metadata, ["Genus", "f", "genera"], save=False)
+    assert list(cleaned) == ["Genus", "f", "genera"]
+    assert_same_table(cleaned["Genus"], cleaned_baseline("g"))
+    assert_same_table(cleaned["f"], cleaned_baseline("f"))
+    assert cleaned["genera"] is cleaned["Genus"]
+
+
+def test_saved_levels_write_one_file_each(microbiome, metadata, tmp_path):
+    paths = ezclean(microbiome, metadata, ["g", "genus", "p"], output_dir=str(tmp_path))
+    assert paths["g"] == paths["genus"]
+    assert sorted(os.listdir(tmp_path)) == sorted([CLEANED_NAMES["g"] + ".xlsx", CLEANED_NAMES["p"] + ".xlsx"])
+
+
+def test_unknown_level_in_a_list_is_reported(microbiome, metadata):
+    message = ezclean(microbiome, metadata, ["g", "strain"], save=False)
+    assert isinstance(message, str) and message.startswith("The level value should be one of the following")
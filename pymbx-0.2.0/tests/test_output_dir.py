@@ -0,0 +1,61 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+import pytest
+
+from pymbX import ezclean, ezviz
+from pymbX.pymbX import _replace_output
+
+from conftest import CLEANED_NAMES, VIZ_CASES, assert_same_table, cleaned_baseline, read_baseline, viz_table
+
+# -------------------------------
+# output_dir and atomic outputs
+# -------------------------------
+
+
+def test_outputs_go_to_output_dir(microbiome, metadata, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    out = tmp_path / "nested" / "out"
+    path = ezclean(microbiome, metadata, "g", output_dir=str(out))
+    assert path == os.path.join(str(out), CLEANED_NAMES["g"] + ".xlsx")
+    plot = ezviz(microbiome, metadata, "g", "Treatment", output_dir=str(out), plot_format="png", dpi=20)
+    assert os.path.dirname(plot) == str(out)
+    assert sorted(os.listdir(tmp_path)) == ["nested"]
+
+
+def test_ezviz_does_not_read_back_a_file_in_its_directory(microbiome, metadata, tmp_path):
+    # A stale or foreign cleaned table under the same name must not be picked up
+    (tmp_path / (CLEANED_NAMES["g"] + ".xlsx")).write_bytes(b"not a workbook")
+    level, kwargs, data_name, baseline_name = VIZ_CASES[0]
+    ezviz(microbiome, metadata, level, "Treatment", output_dir=str(tmp_path), plot_format="png", dpi=20, **kwargs)
+    pd.testing.assert_frame_equal(viz_table(tmp_path, data_name), read_baseline(baseline_name))
+    assert_same_table(pd.read_excel(tmp_path / (CLEANED_NAMES["g"] + ".xlsx"), dtype={"sample-id": str}),
+                      cleaned_baseline("g"))
+
+
+def test_concurrent_runs_in_one_directory(microbiome, metadata, tmp_path):
+    def run(case):
+        level, kwargs, data_name, baseline_name = case
+        return ezviz(microbiome, metadata, level, "Treatment", output_dir=str(tmp_path), plot_format="png", dpi=20,
+                     **kwargs)
+
+    with ThreadPoolExecutor(max_workers=3) as executor:
+        plots = list(executor.map(run, VIZ_CASES * 2))
+    assert all(os.path.exists(plot) for plot in plots)
+    for level, kwargs, data_name, baseline_name in VIZ_CASES:
+        pd.testing.assert_frame_equal(viz_table(tmp_path, data_name), read_baseline(baseline_name))
+    # Every output was moved into place; no temporary names are left behind
+    assert not any(name.startswith(".") for name in os.listdir(tmp_path))
+
+
+def test_failed_write_keeps_the_old_file(tmp_path):
+    target = tmp_path / "table.xlsx"
+    target.write_text("old")
+    with pytest.raises(RuntimeError):
+        with _replace_output(str(target)) as tmp_name:
+            with open(tmp_name, "w") as fh:
+                fh.write("partial")
+            raise RuntimeError("write failed")
+    assert target.read_text() == "old"
+    assert os.listdir(tmp_path) == ["table.xlsx"]
@@ -0,0 +1,84 @@
+import logging
+import threading
+import tracemalloc
+
+import pytest
+
+from pymbX import StageCancelled, StageReport, ezclean, ezviz
+from pymbX import profiling
+
+# -------------------------------
+# Per-stage instrumentation
+# -------------------------------
+
+
+def test_ezclean_stages_are_recorded(microbiome, metadata):
+    report = StageReport()
+    ezclean(microbiome, metadata, "g", save=False, chunksize=5, profile=report)
+    summary = {row["stage"]: row for row in report.summary()}
+    assert list(summary)[:3] == ["ezclean.read_metadata", "ezclean.read_microbiome", "ezclean.read_chunk"]
+    assert summary["ezclean.read_chunk"]["calls"] == 4
+    assert (summary["ezclean.parse_lineages"]["rows"], summary["ezclean.parse_lineages"]["cols"]) == (50, 7)
+    assert summary["ezclean.percentages_merge"]["rows"] == 12
+    assert all(row["wall_s"] >= 0 and row["cpu_s"] >= 0 for row in summary.values())
+    assert all(row["peak_bytes"] is not None for row in summary.values())
+    # Tracing is switched off again when the report started it
+    assert not tracemalloc.is_tracing()
+
+
+def test_nested_stages_keep_the_inner_peak():
+    report = StageReport()
+    with report.stage("outer"):
+        with report.stage("inner"):
+            block = bytearray(4 * 2 ** 20)
+            del block
+    records = {r["stage"]: r for r in report.records}
+    assert records["inner"]["peak_bytes"] >= 4 * 2 ** 20
+    assert records["outer"]["peak_bytes"] >= records["inner"]["peak_bytes"]
+
+
+def test_callback_and_memory_off(microbiome, metadata, tmp_path):
+    seen = []
+    ezclean(microbiome, metadata, "p", save=False, profile=seen.append)
+    assert [record["stage"] for record in seen][-1] == "ezclean.percentages_merge"
+    assert all(record["peak_bytes"] is not None for record in seen)
+    # Rendering is slow under tracemalloc, so ezviz is profiled without it
+    report = StageReport(memory=False)
+    ezviz(microbiome, metadata, "g", "Treatment", output_dir=str(tmp_path), plot_format="png", dpi=20,
+          profile=report)
+    stages = [record["stage"] for record in report.records]
+    assert "ezviz.render" in stages and "ezclean.aggregate" in stages
+    assert all(record["peak_bytes"] is None for record in report.records)
+
+
+def test_exports(microbiome, metadata, caplog):
+    report = StageReport(memory=False)
+    ezclean(microbiome, metadata, "p", save=False, profile=report)
+    frame = report.to_frame()
+    assert list(frame.columns) == ["stage", "wall_s", "cpu_s", "peak_bytes", "rows", "cols"]
+    assert len(frame) == len(report.records)
+    text = report.to_prometheus()
+    assert '# TYPE pymbx_stage_calls_total counter' in text
+    assert 'pymbx_stage_calls_total{stage="ezclean.aggregate"} 1' in text
+    assert "stage_peak_memory_bytes{" not in text
+    with caplog.at_level(logging.INFO, logger="pymbX"):
+        report.log()
+    assert len(caplog.records) == len(report.summary())
+    assert str(report).splitlines()[0].startswith("ezclean.read_metadata")
+
+
+def test_invalid_profile_argument(microbiome, metadata):
+    with pytest.raises(TypeError):
+        ezclean(microbiome, metadata, "g", save=False, profile="yes")
+
+
+def test_set_cancel_event_stops_at_the_next_stage(microbiome, metadata):
+    event = threading.Event()
+    event.set()
+    token = profiling.cancel_event.set(event)
+    try:
+        with pytest.raises(StageCancelled, match="ezclean.read_metadata"):
+            ezclean(microbiome, metadata, "g", save=False)
+    finally:
+        profiling.cancel_event.reset(token)
+    assert not isinstance(ezclean(microbiome, metadata, "g", save=False), str)
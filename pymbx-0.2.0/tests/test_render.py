@@ -0,0 +1,111 @@
+import os
+
+import numpy as np
+import pytest
+from matplotlib.figure import Figure
+
+from pymbX import ezviz
+from pymbX.pymbX import _render_plot
+
+from conftest import read_baseline
+
+# -------------------------------
+# Stacked bar rendering and plot settings
+# -------------------------------
+
+
+@pytest.fixture
+def drawn(monkeypatch):
+    # Keep every Figure _render_plot saves, to look at its artists
+    figures = []
+    savefig = Figure.savefig
+    
+    def keep(fig, *args, **kwargs):
+        figures.append(fig)
+        return savefig(fig, *args, **kwargs)
+    
+    monkeypatch.setattr(Figure, "savefig", keep)
+    return figures
+
+
+def test_one_collection_per_taxon(drawn, tmp_path):
+    table = read_baseline("mbX_vizualization_data_genera_top5")
+    _render_plot(table, "g__", "Treatment", str(tmp_path / "plot.png"), dpi=20)
+    (fig,) = drawn
+    (ax,) = fig.axes
+    assert len(ax.patches) == 0
+    assert len(ax.collections) == len(table)
+    
+    groups = sorted(table.columns[1:])
+    values = table[groups].to_numpy(dtype=float).T
+    tops = np.cumsum(values, axis=1)
+    for i, collection in enumerate(ax.collections):
+        # One rectangle per group, stacked on the taxa drawn before it
+        paths = collection.get_paths()
+        assert len(paths) == len(groups)
+        for x, path in enumerate(paths):
+            (left, bottom), (right, top) = path.vertices.min(axis=0), path.vertices.max(axis=0)
+            assert (left, right) == pytest.approx((x - 0.4, x + 0.4))
+            assert (bottom, top) == pytest.approx((tops[x, i] - values[x, i], tops[x, i]))
+    legend = ax.get_legend()
+    assert [t.get_text() for t in legend.get_texts()] == list(table.iloc[:, 0])[::-1]
+    assert legend.get_title().get_text() == "Microorganism Genera"
+
+
+def test_bars_start_on_the_axis(drawn, tmp_path):
+    table = read_baseline("mbX_vizualization_data_species")
+    _render_plot(table, "s__", "Treatment", str(tmp_path / "plot.png"), dpi=20)
+    (ax,) = drawn[0].axes
+    assert ax.get_ylim()[0] == 0
+    assert [t.get_text() for t in ax.get_xticklabels()] == sorted(table.columns[1:])
+
+
+def _png_size(path):
+    with open(path, "rb") as fh:
+        header = fh.read(24)
+    assert header[:8] == b"\x89PNG\r\n\x1a\n"
+    return int.from_bytes(header[16:20], "big"), int.from_bytes(header[20:24], "big")
+
+
+@pytest.mark.parametrize("plot_format, magic", [("pdf", b"%PDF"), ("svg", b"<?xml"), ("png", b"\x89PNG")])
+def test_plot_format_sets_the_file_type(plot_format, magic, microbiome, metadata, tmp_path):
+    plot = ezviz(microbiome, metadata, "g", "Treatment", top_taxa=5, output_dir=str(tmp_path),
+                 plot_format=plot_format, dpi=20)
+    assert plot.endswith("mbX_viz_genera." + plot_format)
+    with open(plot, "rb") as fh:
+        assert fh.read(len(magic)) == magic
+
+
+def test_dpi_scales_a_png(microbiome, metadata, tmp_path):
+    small = ezviz(microbiome, metadata, "g", "Treatment", output_dir=str(tmp_path / "a"), plot_format="png", dpi=20)
+    large = ezviz(microbiome, metadata, "g", "Treatment", output_dir=str(tmp_path / "b"), plot_format="png", dpi=40)
+    (w1, h1), (w2, h2) = _png_size(small), _png_size(large)
+    assert w2 == pytest.approx(2 * w1, rel=0.05) and h2 == pytest.approx(2 * h1, rel=0.05)
+
+
+def test_preview_is_a_small_png(microbiome, metadata, tmp_path):
+    plot = ezviz(microbiome, metadata, "s", "Treatment", output_dir=str(tmp_path), preview=True)
+    assert plot.endswith(".png")
+    width, height = _png_size(plot)
+    # At most 12 x 15 inches at 72 dpi (plus the legend that bbox_inches="tight" keeps)
+    assert height <= 15 * 72 and width <= 2 * 12 * 72
+
+
+def test_rasterize_stores_the_bars_as_an_image(microbiome, metadata, tmp_path):
+    vector = ezviz(microbiome, metadata, "g", "Treatment", output_dir=str(tmp_path / "a"), plot_format="svg", dpi=20)
+    raster = ezviz(microbiome, metadata, "g", "Treatment", output_dir=str(tmp_path / "b"), plot_format="svg", dpi=20,
+                   rasterize=True)
+    with open(vector) as fh:
+        assert "<image" not in fh.read()
+    with open(raster) as fh:
+        svg = fh.read()
+    # The bars are one embedded image; the text stays vector
+    assert svg.count("<image") == 1 and "Relative Abundance" in svg
+
+
+def test_invalid_plot_settings_are_reported(microbiome, metadata, tmp_path):
+    assert ezviz(microbiome, metadata, "g", "Treatment", output_dir=str(tmp_path), plot_format="gif") == \
+        "The plot format should be one of the following: pdf, png, svg."
+    assert ezviz(microbiome, metadata, "g", "Treatment", output_dir=str(tmp_path), dpi=-5) == \
+        "The dpi should be a positive number."
+    assert os.listdir(tmp_path) == []
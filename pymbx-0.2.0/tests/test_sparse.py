@@ -0,0 +1,54 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from pymbX import ezclean, ezviz
+from pymbX.pymbX import _sparse_counts
+
+from conftest import LEVELS, VIZ_CASES, assert_same_table, cleaned_baseline, read_baseline, viz_table
+
+pytest.importorskip("scipy")
+
+# -------------------------------
+# sparse=True: scipy CSR backend
+# -------------------------------
+
+
+@pytest.mark.parametrize("level", LEVELS)
+def test_sparse_matches_baseline(level, microbiome, metadata):
+    cleaned = ezclean(microbiome, metadata, level, save=False, sparse=True)
+    taxa = cleaned.columns[1:-3]
+    assert all(isinstance(cleaned[col].dtype, pd.SparseDtype) for col in taxa)
+    assert_same_table(cleaned, cleaned_baseline(level))
+
+
+@pytest.mark.parametrize("chunksize", [1, 5, 100])
+def test_sparse_chunks_match_baseline(chunksize, microbiome, metadata):
+    cleaned = ezclean(microbiome, metadata, ["g", "p"], save=False, sparse=True, chunksize=chunksize)
+    assert_same_table(cleaned["g"], cleaned_baseline("g"))
+    assert_same_table(cleaned["p"], cleaned_baseline("p"))
+
+
+@pytest.mark.parametrize("level, kwargs, data_name, baseline_name", VIZ_CASES)
+def test_sparse_ezviz_matches_baseline(level, kwargs, data_name, baseline_name, microbiome, metadata, tmp_path):
+    ezviz(microbiome, metadata, level, "Treatment", sparse=True, output_dir=str(tmp_path), plot_format="png", dpi=20,
+          **kwargs)
+    pd.testing.assert_frame_equal(viz_table(tmp_path, data_name), read_baseline(baseline_name))
+
+
+def test_sparse_counts_treat_text_and_missing_as_zero():
+    block = pd.DataFrame({"a": [1, "x", 3], "b": [np.nan, 2, 0], "c": [0, 0, 5]})
+    counts = _sparse_counts(block)
+    assert counts.shape == (3, 3)
+    np.testing.assert_array_equal(counts.toarray(), [[1, 0, 3], [0, 2, 0], [0, 0, 5]])
+
+
+def test_sparse_sample_without_counts_is_nan(tmp_path):
+    microbiome = pd.DataFrame({"index": ["S1", "S2"], "d__A;p__B": [3, 0], "d__A;p__C": [1, 0]})
+    microbiome.to_csv(tmp_path / "micro.csv", index=False)
+    metadata = pd.DataFrame({"sample-id": ["S1", "S2"], "Group": ["x", "y"]})
+    dense = ezclean(str(tmp_path / "micro.csv"), metadata, "p", save=False)
+    sparse = ezclean(str(tmp_path / "micro.csv"), metadata, "p", save=False, sparse=True)
+    assert sparse["B"].sparse.to_dense().tolist()[0] == 75.0
+    assert np.isnan(sparse["B"].sparse.to_dense().tolist()[1])
+    assert_same_table(sparse, dense)
@@ -0,0 +1,92 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from pymbX import ezclean, ezsummary, ezviz
+
+from conftest import CLEANED_NAMES, VIZ_CASES, cleaned_baseline, read_baseline, viz_table
+
+# -------------------------------
+# ezsummary and ezviz with several metadata columns
+# -------------------------------
+# The group statistics of all columns come from one pass over the cleaned
+# table; they must equal a pandas groupby of the baseline table per column.
+
+STATS = ["mean", "count", "median", "std"]
+
+
+def _groupby_summary(cleaned, columns, level_name, stats=STATS):
+    # The long ezsummary table built with one groupby per metadata column
+    taxa = list(cleaned.columns[1:-3])
+    frames = []
+    for column in columns:
+        labels = cleaned[column].where(~cleaned[column].isin(["", "Na", "NA", "#VALUE!", "#NAME?"]))
+        grouped = cleaned[taxa].groupby(labels.rename(None), sort=True)
+        wide = {stat: getattr(grouped, stat)() for stat in stats}
+        groups = list(wide[stats[0]].index)
+        frame = pd.DataFrame({"metadata": column, "group": np.repeat(groups, len(taxa)),
+                              level_name: np.tile(taxa, len(groups))})
+        for stat in stats:
+            frame[stat] = wide[stat][taxa].to_numpy().reshape(-1)
+        frames.append(frame)
+    return pd.concat(frames, ignore_index=True)
+
+
+@pytest.mark.parametrize("level, level_name", [("g", "genus"), ("f", "family"), ("p", "phylum")])
+def test_summary_matches_groupby(level, level_name, microbiome, metadata):
+    columns = ["Treatment", "Site", "Timepoint"]
+    summary = ezsummary(microbiome, metadata, level, columns, save=False)
+    expected = _groupby_summary(cleaned_baseline(level), columns, level_name)
+    pd.testing.assert_frame_equal(summary, expected, check_dtype=False, rtol=1e-9)
+
+
+@pytest.mark.parametrize("kwargs", [{"sparse": True}, {"workers": 3}, {"chunksize": 4}])
+def test_summary_backends_match_default(kwargs, microbiome, metadata):
+    if kwargs.get("sparse"):
+        pytest.importorskip("scipy")
+    summary = ezsummary(microbiome, metadata, "g", ["Treatment", "Site"], save=False, **kwargs)
+    expected = ezsummary(microbiome, metadata, "g", ["Treatment", "Site"], save=False)
+    pd.testing.assert_frame_equal(summary, expected, check_dtype=False, rtol=1e-9)
+
+
+def test_summary_of_a_cleaned_table(microbiome, metadata):
+    cleaned = ezclean(microbiome, metadata, ["g", "f"], save=False)
+    summary = ezsummary(cleaned, metadata, "family", "Site", stats=["median", "mean"], save=False)
+    assert list(summary.columns) == ["metadata", "group", "family", "mean", "median"]
+    expected = _groupby_summary(cleaned_baseline("f"), ["Site"], "family", stats=["mean", "median"])
+    pd.testing.assert_frame_equal(summary, expected, check_dtype=False, rtol=1e-9)
+    # Site is missing for one sample, which is left out of every group
+    assert summary.groupby("group")["family"].count().sum() == 2 * len(cleaned["f"].columns[1:-3])
+
+
+def test_summary_file_and_messages(microbiome, metadata, tmp_path):
+    path = ezsummary(microbiome, metadata, "g", "Treatment", output_dir=str(tmp_path))
+    assert path.endswith("mbX_summary_genus.xlsx")
+    assert len(pd.read_excel(path)) == len(ezsummary(microbiome, metadata, "g", "Treatment", save=False))
+    assert ezsummary(microbiome, metadata, "g", "Treatment", stats=["max"]).startswith("The stats should be")
+    assert ezsummary(microbiome, metadata, "g", "Color") == "The selected metadata is not in the metadata: Color"
+
+
+@pytest.mark.parametrize("level, kwargs, data_name, baseline_name", VIZ_CASES[:2])
+def test_ezviz_columns_match_single_columns(level, kwargs, data_name, baseline_name, microbiome, metadata,
+                                            tmp_path):
+    plots = ezviz(microbiome, metadata, level, ["Treatment", "Site"], output_dir=str(tmp_path / "multi"),
+                  plot_format="png", dpi=20, **kwargs)
+    assert list(plots) == ["Treatment", "Site"]
+    for column in ["Treatment", "Site"]:
+        single = tmp_path / column
+        ezviz(microbiome, metadata, level, column, output_dir=str(single), plot_format="png", dpi=20, **kwargs)
+        pd.testing.assert_frame_equal(viz_table(tmp_path / "multi", data_name + "_" + column),
+                                      viz_table(single, data_name))
+    pd.testing.assert_frame_equal(viz_table(tmp_path / "multi", data_name + "_Treatment"),
+                                  read_baseline(baseline_name))
+
+
+def test_ezviz_columns_with_sparse_backend(microbiome, metadata, tmp_path):
+    pytest.importorskip("scipy")
+    ezviz(microbiome, metadata, "g", ["Site", "Treatment"], sparse=True, output_dir=str(tmp_path), plot_format="png",
+          dpi=20, top_taxa=5)
+    pd.testing.assert_frame_equal(viz_table(tmp_path, "mbX_vizualization_data_genera_Treatment"),
+                                  read_baseline("mbX_vizualization_data_genera_top5"))
+    assert not (tmp_path / (CLEANED_NAMES["g"] + ".xlsx")).exists()
+    assert np.isfinite(viz_table(tmp_path, "mbX_vizualization_data_genera_Site").iloc[:, 1:].to_numpy()).all()
@@ -0,0 +1,102 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from pymbX import ezviz
+from pymbX.pymbX import _collapse_taxa, _rank_taxa
+
+from conftest import read_baseline, viz_table
+
+# -------------------------------
+# top_taxa / threshold sweeps
+# -------------------------------
+# Every value of a list must give the table and plot a call with that single
+# value gives, under a name with its own _top<k> / _threshold<t> suffix.
+
+
+def _sweep(microbiome, metadata, output_dir, level, selected, **kwargs):
+    return ezviz(microbiome, metadata, level, selected, output_dir=str(output_dir), plot_format="png", dpi=10,
+                 **kwargs)
+
+
+def test_top_taxa_sweep_matches_single_calls(microbiome, metadata, tmp_path):
+    plots = _sweep(microbiome, metadata, tmp_path / "sweep", "g", "Treatment", top_taxa=[5, 10, 100])
+    assert list(plots) == [5, 10, 100]
+    for k in [5, 10, 100]:
+        assert os.path.basename(plots[k]) == "mbX_viz_genera_top%d.png" % k and os.path.exists(plots[k])
+        _sweep(microbiome, metadata, tmp_path / str(k), "g", "Treatment", top_taxa=k)
+        pd.testing.assert_frame_equal(viz_table(tmp_path / "sweep", "mbX_vizualization_data_genera_top%d" % k),
+                                      viz_table(tmp_path / str(k), "mbX_vizualization_data_genera"))
+    pd.testing.assert_frame_equal(viz_table(tmp_path / "sweep", "mbX_vizualization_data_genera_top5"),
+                                  read_baseline("mbX_vizualization_data_genera_top5"))
+    # More taxa than the table has: the whole ranked table, without an Other_* row
+    whole = viz_table(tmp_path / "sweep", "mbX_vizualization_data_genera_top100")
+    assert "Other_genera" not in whole.iloc[:, 0].tolist()
+
+
+def test_threshold_sweep_over_columns(microbiome, metadata, tmp_path):
+    plots = _sweep(microbiome, metadata, tmp_path / "sweep", "f", ["Treatment", "Site"], threshold=[1, 3.0])
+    assert list(plots) == [("Treatment", 1), ("Treatment", 3.0), ("Site", 1), ("Site", 3.0)]
+    assert sorted(os.listdir(tmp_path / "sweep")) == sorted(
+        ["mbX_cleaned_families.xlsx"] +
+        ["mbX_viz_families_%s_threshold%s.png" % (c, t) for c in ["Treatment", "Site"] for t in ["1", "3.0"]] +
+        ["mbX_vizualization_data_families_%s_threshold%s.xlsx" % (c, t) for c in ["Treatment", "Site"]
+         for t in ["1", "3.0"]]
+    )
+    for column in ["Treatment", "Site"]:
+        single = tmp_path / column
+        _sweep(microbiome, metadata, single, "f", column, threshold=1)
+        pd.testing.assert_frame_equal(
+            viz_table(tmp_path / "sweep", "mbX_vizualization_data_families_%s_threshold1" % column),
+            viz_table(single, "mbX_vizualization_data_families"))
+    pd.testing.assert_frame_equal(
+        viz_table(tmp_path / "sweep", "mbX_vizualization_data_families_Treatment_threshold3.0"),
+        read_baseline("mbX_vizualization_data_families_threshold3"))
+
+
+def test_sweep_messages(microbiome, metadata, tmp_path):
+    assert _sweep(microbiome, metadata, tmp_path, "f", "Treatment", threshold=[1], top_taxa=[3]) == \
+        "Only one of the parameter can be selected between top_taxa and threshold"
+
+
+def _collapse_by_sorting(df, other_name, top_taxa=None, threshold=None):
+    # One value the way the original ezviz did it: a stable sort of the whole
+    # table by the average, then the kept rows and the sum of the rest
+    avg = df.iloc[:, 1:].mean(axis=1)
+    ranked = df.loc[avg.sort_values(ascending=False, kind="stable").index]
+    if top_taxa is not None:
+        if len(df) <= top_taxa:
+            return ranked.reset_index(drop=True)
+        kept, rest = ranked.iloc[:top_taxa], ranked.iloc[top_taxa:]
+    else:
+        if not (avg < threshold).any():
+            return ranked.reset_index(drop=True)
+        kept, rest = ranked[avg[ranked.index] >= threshold], ranked[avg[ranked.index] < threshold]
+    other = pd.DataFrame([[other_name] + list(rest.iloc[:, 1:].sum())], columns=df.columns)
+    return pd.concat([kept, other], ignore_index=True)
+
+
+def test_collapse_matches_sorting_with_ties_and_nan():
+    rng = np.random.default_rng(7)
+    values = rng.integers(0, 4, size=(40, 3)).astype(float)
+    values[[3, 17], :] = np.nan
+    df = pd.DataFrame(values, columns=["A", "B", "C"])
+    df.insert(0, "Treatment", ["t%d" % i for i in range(40)])
+    tops = [1, 5, 12, 40, 60]
+    tables = _collapse_taxa(df, "g__", top_taxa=tops)
+    for k in tops:
+        pd.testing.assert_frame_equal(tables[k], _collapse_by_sorting(df, "Other_genera", top_taxa=k))
+    thresholds = [0.5, 1.5, 2.5, 9]
+    tables = _collapse_taxa(df, "g__", threshold=thresholds)
+    for t in thresholds:
+        pd.testing.assert_frame_equal(tables[t], _collapse_by_sorting(df, "Other_genera", threshold=t))
+
+
+@pytest.mark.parametrize("k", [0, 1, 3, 6, 10])
+def test_partial_ranking_is_the_head_of_the_full_ranking(k):
+    row_avg = np.array([2.0, np.nan, 5.0, 2.0, 5.0, 1.0])
+    full = _rank_taxa(row_avg)
+    assert full.tolist() == [2, 4, 0, 3, 5, 1]
+    assert _rank_taxa(row_avg, k).tolist() == full[:k].tolist()
@@ -0,0 +1,63 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from pymbX import ezclean, ezsummary, ezviz
+from pymbX.pymbX import _block_percentages, _level_groups, _parse_lineages, _sharded_levels
+
+from conftest import LEVELS, VIZ_CASES, assert_same_table, cleaned_baseline, read_baseline, viz_table
+
+# -------------------------------
+# workers=n: level collapse sharded over the samples
+# -------------------------------
+
+
+@pytest.mark.parametrize("workers", [2, 3, 20])
+def test_workers_match_baseline(workers, microbiome, metadata):
+    # 20 workers is more shards than the 12 samples
+    cleaned = ezclean(microbiome, metadata, "all", save=False, workers=workers)
+    for key, level in zip(cleaned, LEVELS):
+        assert_same_table(cleaned[key], cleaned_baseline(level))
+
+
+@pytest.mark.parametrize("kwargs, rtol", [({"compact": True}, 1e-5), ({"chunksize": 5}, 1e-9),
+                                          ({"chunksize": 5, "compact": True}, 1e-5)])
+def test_workers_with_compact_and_chunks(kwargs, rtol, microbiome, metadata):
+    cleaned = ezclean(microbiome, metadata, ["g", "p"], save=False, workers=3, **kwargs)
+    assert (cleaned["g"].iloc[:, 1].dtype == np.float32) == bool(kwargs.get("compact"))
+    assert_same_table(cleaned["g"], cleaned_baseline("g"), rtol=rtol)
+    assert_same_table(cleaned["p"], cleaned_baseline("p"), rtol=rtol)
+
+
+@pytest.mark.parametrize("level, kwargs, data_name, baseline_name", VIZ_CASES[:2])
+def test_workers_ezviz_matches_baseline(level, kwargs, data_name, baseline_name, microbiome, metadata, tmp_path):
+    ezviz(microbiome, metadata, level, "Treatment", workers=4, output_dir=str(tmp_path), plot_format="png", dpi=20,
+          **kwargs)
+    pd.testing.assert_frame_equal(viz_table(tmp_path, data_name), read_baseline(baseline_name))
+
+
+def test_workers_ezsummary_matches_one_pass(microbiome, metadata):
+    summary = ezsummary(microbiome, metadata, "f", ["Treatment", "Site"], save=False, workers=4)
+    pd.testing.assert_frame_equal(summary, ezsummary(microbiome, metadata, "f", ["Treatment", "Site"], save=False))
+
+
+def test_workers_must_be_a_positive_integer(microbiome, metadata):
+    for workers in [0, -2, 1.5, True]:
+        assert ezclean(microbiome, metadata, "g", save=False, workers=workers) == "workers should be a positive integer."
+
+
+def test_sharded_levels_treat_text_and_empty_samples_like_groupby():
+    # NaN counts are skipped and a sample without counts gives NaN percentages
+    rank_table = _parse_lineages(["d__A;p__B", "d__A;p__C", "d__A;p__B", "d__A;p__"])
+    counts = pd.DataFrame({"S1": [1, 2, 3, 4], "S2": [np.nan, 1, 1, 0], "S3": [0, 0, 0, 0]}, dtype=float)
+    groups = _level_groups(rank_table, ["p__"])
+    taxa, _, _ = groups["p__"]
+    sharded = _sharded_levels(counts, groups, workers=2)["p__"]
+    expected = counts.groupby(rank_table["p"].replace("", "unidentified_phylum_1_at_A_domain").values).sum()
+    expected = (expected / expected.sum() * 100).T
+    assert list(taxa) == list(expected.columns)
+    np.testing.assert_allclose(sharded, expected.to_numpy(), equal_nan=True)
+
+
+def test_block_percentages_without_taxa():
+    assert _block_percentages(np.ones((3, 0)), np.array([], dtype=int), np.array([], dtype=int)).shape == (3, 0)